@@ -0,0 +1,33 @@
+"""
+Micro-benchmarks of path classification, one per scheme.
+
+Compares the predicate chain path() used to run for every string with
+classify(), and with the memoized classification paths() uses.
+
+Usage (from the repository root): python -m benchmarks.bench_classify
+"""
+import timeit
+from multipath import multipath
+
+SAMPLES = (
+    ('posix abs', '/srv/data/builds/2026/artifact.tar'),
+    ('posix rel', 'builds/2026/artifact.tar'),
+    ('windows', r'c:\builds\2026\artifact.tar'),
+    ('unc', r'\\hostname\share\builds\artifact.tar'),
+    ('rsync uri', 'rsync://hostname/module/builds/artifact.tar'),
+    ('rsync daemon', 'user@hostname::/module/builds/artifact.tar'),
+    ('rsync shell', 'hostname:/srv/builds/artifact.tar'),
+    ('file uri', 'file:///srv/builds/artifact.tar'),
+)
+
+def bench(func, path_str, number):
+    return min(timeit.repeat(lambda: func(path_str), number=number, repeat=5)) / number
+
+if __name__ == '__main__':
+    number = 100000
+    print('{:14} {:>10} {:>10} {:>10}'.format('scheme', 'chain ns', 'classify', 'memo'))
+    for name, path_str in SAMPLES:
+        chain = bench(multipath._classify_slow, path_str, number)
+        fast = bench(multipath.classify, path_str, number)
+        memo = bench(multipath._classify_memo, path_str, number)
+        print('{:14} {:10.0f} {:10.0f} {:10.0f}'.format(name, chain * 1e9, fast * 1e9, memo * 1e9))
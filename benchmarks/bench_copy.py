@@ -0,0 +1,36 @@
+"""
+Copies a synthetic tree of small files with LocalPath.copy() at different
+jobs= settings.
+
+Usage (from the repository root): python -m benchmarks.bench_copy [number_of_files] [file_size] [tmpdir]
+
+Pass a tmpdir on the device you want to measure; the default is the system
+temp dir.
+"""
+import sys, time, shutil, tempfile
+from multipath.paths import local
+from benchmarks.bench_walk import make_tree
+
+JOBS = (1, 2, 4, 8, 16, 32)
+
+if __name__ == '__main__':
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    file_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    tmpdir = sys.argv[3] if len(sys.argv) > 3 else None
+    src = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        make_tree(src, n_files, file_size=file_size)
+        baseline = None
+        for jobs in JOBS:
+            dest = tempfile.mkdtemp(dir=tmpdir)
+            try:
+                start = time.perf_counter()
+                result = local.LocalPath(src).copy(dest, jobs=jobs, dir_exist_ok=True)
+                elapsed = time.perf_counter() - start
+            finally:
+                shutil.rmtree(dest)
+            baseline = baseline or elapsed
+            print('jobs={:<3d} {:8d} paths {:8.3f}s {:10.0f} files/s  x{:.2f}  errors={}'.format(
+                jobs, len(result), elapsed, n_files / elapsed, baseline / elapsed, len(result.errors)))
+    finally:
+        shutil.rmtree(src)
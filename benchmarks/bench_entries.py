@@ -0,0 +1,28 @@
+"""
+Measures memory held per listed path, full Paths versus compact entries.
+
+Usage (from the repository root): python -m benchmarks.bench_entries [number_of_files]
+"""
+import sys, gc, shutil, tempfile, tracemalloc
+from multipath.paths import local
+from benchmarks.bench_walk import make_tree
+
+def measure(root, compact):
+    gc.collect()
+    tracemalloc.start()
+    listing = list(local.LocalPath(root).list(compact=compact))
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(listing), size, peak
+
+if __name__ == '__main__':
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = tempfile.mkdtemp()
+    try:
+        make_tree(root, n_files)
+        for name, compact in (('Path', False), ('Entry', True)):
+            n, size, peak = measure(root, compact)
+            print('{:6} {:8d} entries {:10.1f} MiB held {:8.0f} bytes/entry (peak {:.1f} MiB)'.format(
+                name, n, size / 2 ** 20, size / n, peak / 2 ** 20))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,64 @@
+"""
+Compares the os.walk() based listing with the os.scandir() based walker used
+by LocalPath.list().
+
+Usage (from the repository root): python -m benchmarks.bench_walk [number_of_files]
+"""
+import os, sys, time, shutil, tempfile
+from multipath.paths import local
+
+def make_tree(root, n_files, files_per_dir=100, dirs_per_dir=10, file_size=0):
+    """Create a synthetic tree of n_files files of file_size bytes."""
+    data = b'x' * file_size
+    dirs = [root]
+    created = 0
+    while created < n_files:
+        parent = dirs.pop(0)
+        for i in range(dirs_per_dir):
+            d = os.path.join(parent, 'd{}'.format(i))
+            os.mkdir(d)
+            dirs.append(d)
+        for i in range(min(files_per_dir, n_files - created)):
+            with open(os.path.join(parent, 'f{}.txt'.format(i)), 'wb') as f:
+                f.write(data)
+            created += 1
+    return created
+
+def os_walk_listing(root):
+    """What LocalPath.list() used to do for every entry."""
+    n = 0
+    for path in local.os_walk_path_generator(root):
+        filename = os.path.basename(path)
+        abs_path = os.path.abspath(path)
+        rel_path = os.path.relpath(abs_path, start=root)
+        abs_dirpath = os.path.dirname(abs_path)
+        is_file = os.path.isfile(path)
+        n += 1
+    return n
+
+def scandir_listing(root):
+    n = 0
+    for dir_entry, abs_dirpath, rel_path in local.scandir_path_generator(root):
+        is_file = not dir_entry.is_dir()
+        n += 1
+    return n
+
+def bench(func, root, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = func(root)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return n, best
+
+if __name__ == '__main__':
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = tempfile.mkdtemp()
+    try:
+        make_tree(root, n_files)
+        for name, func in (('os.walk', os_walk_listing), ('scandir', scandir_listing)):
+            n, elapsed = bench(func, root)
+            print('{:10} {:8d} entries {:8.3f}s {:10.0f} entries/s'.format(name, n, elapsed, n / elapsed))
+    finally:
+        shutil.rmtree(root)
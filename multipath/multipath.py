@@ -5,38 +5,96 @@ Definitions
 References:
     Windows Paths: http://blogs.msdn.com/b/ie/archive/2006/12/06/file-Paths-in-windows.aspx
 """
-import re, os, fnmatch
+import re, os, fnmatch, functools
 # FIXME only in python >= 3
 from urllib import parse
 # from urllib import parse
-from multipath.paths import path as base, rsync, windows, smb, posix
+from multipath.paths import path as base, rsync, windows, smb, posix, http, ftp
 
-def path(path, path_class=None):
+# Number of path strings paths() remembers the class of
+MEMO_SIZE = 65536
+
+def path(path, path_class=None, memo=False):
     """
     Factory function for Path objects.
-    """
-    parsed_url = parse.urlparse(path)
-    scheme = parsed_url.scheme
 
+    Arguments:
+        path_class: Path class to use instead of guessing one.
+        memo: remember the class guessed for recently seen path strings.
+    """
     if isinstance(path, base.Path):
         return path
     elif path_class:
         return path_class(path)
-    elif smb.is_unc(path):
-        return smb.SmbPath(path)
+    elif memo:
+        return _classify_memo(path)(path)
+    else:
+        return classify(path)(path)
+
+def paths(iterable, path_class=None, memo=True):
+    """
+    Like path(), for many path strings. Yields Path objects in the order of
+    iterable.
+    """
+    classify_func = _classify_memo if memo else classify
+    for p in iterable:
+        if isinstance(p, base.Path):
+            yield p
+        elif path_class:
+            yield path_class(p)
+        else:
+            yield classify_func(p)(p)
+
+def classify(path):
+    """
+    Returns the Path class for a path string. Raises if there is none.
+
+    Common prefixes are dispatched directly; everything else goes through
+    the predicates of each Path module in order.
+    """
+    first = path[:1]
+    if first == '/':
+        # Only a Windows path can start with / and have : second or contain \
+        if path[1:2] == ':' or '\\' in path:
+            return windows.WindowsPath
+        return posix.PosixPath
+    elif first == '\\':
+        if smb.is_unc(path):
+            return smb.SmbPath
+        return windows.WindowsPath
+    elif path[:8].lower() == 'rsync://' and '\\' not in path:
+        return rsync.RsyncPath
+    elif http.is_http_url(path):
+        return http.HttpPath
+    elif ftp.is_ftp_url(path):
+        return ftp.FtpPath
+    return _classify_slow(path)
+
+def _classify_slow(path):
+    """Classify by asking each Path module in turn"""
+    if smb.is_unc(path):
+        return smb.SmbPath
     elif windows.is_windows_path(path):
-        return windows.WindowsPath(path)
+        return windows.WindowsPath
+    elif http.is_http_url(path):
+        return http.HttpPath
+    elif ftp.is_ftp_url(path):
+        return ftp.FtpPath
     elif rsync.is_rsync_path(path):
-        return rsync.RsyncPath(path)
+        return rsync.RsyncPath
     elif posix.is_posix_path(path):
-        return posix.PosixPath(path)
-    elif scheme == 'file':
+        return posix.PosixPath
+
+    scheme = parse.urlparse(path).scheme
+    if scheme == 'file':
         # FIXME decide on SmbPath, WindowsPath, PathPath, PosixPath, ...
-        return posix.PosixPath(path)
+        return posix.PosixPath
     else:
         raise Exception('Cannot handle scheme {}'.format(scheme))
         # TODO Default to path? return PathPath(path)
 
+_classify_memo = functools.lru_cache(maxsize=MEMO_SIZE)(classify)
+
 def glob(pattern):
     """
     Turns a glob into a regex.
@@ -0,0 +1,134 @@
+"""
+Compact listing entries.
+
+A listing of millions of paths as full Path objects costs a dict payload and
+several path strings per entry. Entry only keeps a reference to its parent
+directory, its base name and its type; directories are DirRefs shared by all
+their children, and the listing's root is stored once. Paths are computed
+when asked for, and to_path() turns an Entry into a full Path.
+"""
+import os, sys
+
+class DirRef(object):
+    """A directory in a listing. rel_path and abs_path are computed once, on first use."""
+    __slots__ = ('parent', 'name', '_rel_path', '_abs_path')
+
+    def __init__(self, parent, name):
+        self.parent = parent
+        self.name = sys.intern(name)
+        self._rel_path = None
+        self._abs_path = None
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.abs_path)
+
+    @property
+    def rel_path(self):
+        if self._rel_path is None:
+            parent_rel_path = self.parent.rel_path
+            self._rel_path = parent_rel_path + os.path.sep + self.name if parent_rel_path else self.name
+        return self._rel_path
+
+    @property
+    def abs_path(self):
+        if self._abs_path is None:
+            self._abs_path = os.path.join(self.parent.abs_path, self.name)
+        return self._abs_path
+
+    @property
+    def root(self):
+        """The RootRef this dir belongs to"""
+        ref = self
+        while ref.parent is not None:
+            ref = ref.parent
+        return ref
+
+class RootRef(DirRef):
+    """
+    The directory a listing started from.
+    Arguments:
+        root: the Path that was listed.
+        abs_path: absolute path of the dir entries are relative to.
+        path_class: class Entry.to_path() makes.
+    """
+    __slots__ = ('root_path', 'path_class')
+
+    def __init__(self, root, abs_path, path_class):
+        super().__init__(None, '')
+        self.root_path = root
+        self.path_class = path_class
+        self._rel_path = ''
+        self._abs_path = abs_path
+
+class Entry(object):
+    """
+    One path in a listing. Supports the read-only dict keys of listed Paths:
+    path, abs_path, rel_path, filename, abs_dirpath, is_dir and is_file.
+    Like list(), sockets, FIFOs and broken symlinks are neither dirs nor files.
+    """
+    __slots__ = ('dir', 'name', 'is_dir', 'is_file')
+
+    _keys = ('path', 'abs_path', 'rel_path', 'filename', 'abs_dirpath', 'is_dir', 'is_file')
+
+    def __init__(self, dir, name, is_dir, is_file):
+        self.dir = dir
+        self.name = sys.intern(name)
+        self.is_dir = is_dir
+        self.is_file = is_file
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.abs_path)
+
+    def __str__(self):
+        return self.abs_path
+
+    def __fspath__(self):
+        return self.abs_path
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._keys
+
+    @property
+    def filename(self):
+        return self.name
+
+    @property
+    def rel_path(self):
+        dir_rel_path = self.dir.rel_path
+        return dir_rel_path + os.path.sep + self.name if dir_rel_path else self.name
+
+    @property
+    def abs_dirpath(self):
+        return self.dir.abs_path
+
+    @property
+    def abs_path(self):
+        return os.path.join(self.dir.abs_path, self.name)
+
+    path = abs_path
+
+    def info(self, symlinks=True):
+        """Like os.stat()"""
+        if symlinks:
+            return os.stat(self.abs_path)
+        else:
+            return os.lstat(self.abs_path)
+
+    def to_path(self):
+        """Returns the full Path list() would have yielded for this entry"""
+        root = self.dir.root
+        abs_path = self.abs_path
+        return root.path_class(abs_path, root=root.root_path, filename=self.name,
+                               abs_dirpath=self.abs_dirpath, abs_path=abs_path, rel_path=self.rel_path,
+                               dir_entry=None, is_dir=self.is_dir, is_file=self.is_file)
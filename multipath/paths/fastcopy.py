@@ -0,0 +1,173 @@
+"""
+Copy functions that let the kernel do the work.
+
+FastCopy follows the copy_func contract of LocalPath.copy(), i.e. it is
+called with source and destination file names and returns the destination.
+It tries, in order:
+
+    reflink          FICLONE ioctl; shares extents on btrfs, XFS, ...
+    copy_file_range  in-kernel copy, may be offloaded by NFS/SMB servers
+    sendfile         in-kernel copy between file descriptors
+    userspace        readinto()/write() loop with one large reusable buffer
+
+A strategy that isn't supported for a pair of devices is not tried again
+for that pair.
+"""
+import os, sys, errno, shutil, logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+USERSPACE = 'userspace'
+STRATEGIES = (REFLINK, COPY_FILE_RANGE, SENDFILE, USERSPACE)
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+# Errors meaning "can't do it this way", as opposed to a failing disk or a
+# full file system.
+_unsupported_errnos = set([errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+                           errno.ENOSYS, errno.EBADF, errno.EPERM, errno.ETXTBSY])
+
+class FastCopy(object):
+    """
+    Callable copy_func using the fastest copy the platform and file systems
+    allow.
+
+    Arguments:
+        strategies: Strategies to try, in order. See module docs.
+        metadata: If true, copy metadata like shutil.copy2(), if false only
+            the permission bits like shutil.copy(). If None, as the metadata
+            argument of LocalPath.copy() says, or true when called directly.
+        buffer_size: Buffer size for the userspace strategy.
+
+    After copying, used maps each destination to the strategy that copied it.
+    """
+    def __init__(self, strategies=STRATEGIES, metadata=None, buffer_size=1024 * 1024):
+        for strategy in strategies:
+            if strategy not in STRATEGIES:
+                raise ValueError('Unknown copy strategy {}'.format(strategy))
+        self.strategies = [s for s in strategies if _is_available(s)]
+        self.metadata = metadata
+        self.buffer_size = buffer_size
+        self.used = dict()
+        # (strategy, src device, dest device) combinations that failed
+        self._unsupported = set()
+
+    def __call__(self, src, dest, metadata=True):
+        if self.metadata is not None:
+            metadata = self.metadata
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(src))
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+            strategy = self.copy_fileobj(fsrc, fdest)
+        if metadata:
+            shutil.copystat(src, dest)
+        else:
+            shutil.copymode(src, dest)
+        self.used[dest] = strategy
+        return dest
+
+    def counts(self):
+        """Number of files copied with each strategy"""
+        counts = dict()
+        for strategy in self.used.values():
+            counts[strategy] = counts.get(strategy, 0) + 1
+        return counts
+
+    def copy_fileobj(self, fsrc, fdest):
+        """
+        Copy the contents of open file fsrc into open file fdest. Both must
+        be at offset 0. Returns the name of the strategy that was used.
+        """
+        src_stat = os.fstat(fsrc.fileno())
+        dest_stat = os.fstat(fdest.fileno())
+        devices = (src_stat.st_dev, dest_stat.st_dev)
+        for strategy in self.strategies:
+            if (strategy, devices) in self._unsupported:
+                continue
+            copy_strategy = getattr(self, '_copy_' + strategy)
+            try:
+                copy_strategy(fsrc, fdest, src_stat.st_size)
+            except _StrategyUnsupported as e:
+                log.debug('{} not supported for devices {}: {}'.format(strategy, devices, e))
+                self._unsupported.add((strategy, devices))
+                continue
+            return strategy
+        raise OSError('No copy strategy worked for {}'.format(fsrc.name))
+
+    # Strategies. Each raises _StrategyUnsupported if it failed before
+    # writing anything, so the next one can take over.
+
+    def _copy_reflink(self, fsrc, fdest, size):
+        try:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+        except OSError as e:
+            if e.errno in _unsupported_errnos:
+                raise _StrategyUnsupported(e)
+            raise
+
+    def _copy_copy_file_range(self, fsrc, fdest, size):
+        chunk_size = min(max(size, 8 * 1024 * 1024), 2 ** 30)
+        copied = 0
+        while True:
+            try:
+                n = os.copy_file_range(fsrc.fileno(), fdest.fileno(), chunk_size)
+            except OSError as e:
+                if copied == 0 and e.errno in _unsupported_errnos:
+                    raise _StrategyUnsupported(e)
+                raise
+            if n == 0:
+                break
+            copied += n
+        if copied == 0 and size > 0:
+            # Some file systems (e.g. procfs) report 0 bytes instead of failing
+            raise _StrategyUnsupported('copy_file_range copied nothing')
+
+    def _copy_sendfile(self, fsrc, fdest, size):
+        chunk_size = min(max(size, 8 * 1024 * 1024), 2 ** 30)
+        offset = 0
+        while True:
+            try:
+                n = os.sendfile(fdest.fileno(), fsrc.fileno(), offset, chunk_size)
+            except OSError as e:
+                if offset == 0 and e.errno in _unsupported_errnos | set([errno.ENOTSOCK]):
+                    raise _StrategyUnsupported(e)
+                raise
+            if n == 0:
+                break
+            offset += n
+
+    def _copy_userspace(self, fsrc, fdest, size):
+        buf = bytearray(self.buffer_size)
+        view = memoryview(buf)
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            fdest.write(view[:n])
+
+class _StrategyUnsupported(Exception):
+    pass
+
+def fast_copy(src, dest):
+    """Copy like shutil.copy2(), using the fastest strategy available."""
+    return FastCopy()(src, dest)
+
+def _is_available(strategy):
+    """Can strategy be used on this platform at all?"""
+    if strategy == REFLINK:
+        return fcntl is not None and sys.platform.startswith('linux')
+    elif strategy == COPY_FILE_RANGE:
+        return hasattr(os, 'copy_file_range')
+    elif strategy == SENDFILE:
+        # Copying between regular files needs Linux >= 2.6.33
+        return hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+    return True
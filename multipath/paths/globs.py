@@ -0,0 +1,130 @@
+"""
+Glob query planning.
+
+A glob like `builds/2026/*/artifacts/*.tar` is split into the literal
+directory prefix `builds/2026` and the segments `*`, `artifacts` and `*.tar`.
+Walkers start at the prefix and match one segment per directory level, so
+only directories that can still lead to a match are read.
+"""
+import re, fnmatch, logging
+
+log = logging.getLogger(__name__)
+
+RECURSIVE = '**'
+
+_magic_regex = re.compile(r'[*?[]')
+
+class GlobPlan(object):
+    """
+    A glob split into its literal directory prefix and the segments below it.
+    `**` matches zero or more directory levels, and a glob ending with / only
+    matches dirs. Globs can't reach above the dir they are matched in, so
+    `..` segments raise ValueError.
+
+    Matching runs a small state machine: a state is the index of the next
+    segment to match, and a path matches when all segments are consumed.
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        # HACK Windows compatability
+        segments = [s for s in re.split(r'[\\/]', pattern) if s not in ('', '.')]
+        if not segments:
+            raise ValueError('Empty glob: {!r}'.format(pattern))
+        if '..' in segments:
+            raise ValueError('Glob reaches outside the listed dir: {!r}'.format(pattern))
+        self.dirs_only = pattern.endswith(('/', '\\'))
+        prefix = []
+        # Keep at least one segment so the last literal is matched, not walked,
+        # and keep the literal before a trailing `**`, which matches it too
+        while len(segments) > 1 and not is_magic(segments[0]) \
+                and any(s != RECURSIVE for s in segments[1:]):
+            prefix.append(segments.pop(0))
+        self.prefix = prefix
+        self.segments = segments
+        self._matchers = [_compile_segment(s) for s in segments]
+        self.start = self._closure((0,))
+        log.debug('Glob {} planned as prefix={} segments={}'.format(pattern, prefix, segments))
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.pattern)
+
+    @property
+    def end(self):
+        """State reached once every segment has matched"""
+        return len(self.segments)
+
+    def advance(self, states, name):
+        """
+        States reached after matching one path segment `name` from `states`.
+        An empty result means nothing at or below `name` can match.
+        """
+        next_states = []
+        for i in states:
+            if i == self.end:
+                continue
+            matcher = self._matchers[i]
+            if matcher is None:
+                # `**` consumes name and stays
+                next_states.append(i)
+            elif matcher(name):
+                next_states.append(i + 1)
+        return self._closure(next_states)
+
+    def is_match(self, states):
+        """True if a path that led to states matches the whole glob"""
+        return self.end in states
+
+    def can_descend(self, states):
+        """True if something below a directory that led to states can match"""
+        return any(i < self.end for i in states)
+
+    def match(self, rel_path, is_dir=None):
+        """
+        True if rel_path matches the whole glob, prefix included. is_dir
+        defaults to whether rel_path ends with a separator.
+        """
+        if is_dir is None:
+            is_dir = rel_path.endswith(('/', '\\'))
+        if self.dirs_only and not is_dir:
+            return False
+        names = [n for n in re.split(r'[\\/]', rel_path) if n not in ('', '.')]
+        if names[:len(self.prefix)] != self.prefix:
+            return False
+        states = self.start
+        for name in names[len(self.prefix):]:
+            states = self.advance(states, name)
+            if not states:
+                return False
+        return self.is_match(states)
+
+    def _closure(self, states):
+        """Add the states reachable by letting `**` match zero levels"""
+        closed = set()
+        pending = list(states)
+        while pending:
+            i = pending.pop()
+            if i in closed:
+                continue
+            closed.add(i)
+            if i < self.end and self._matchers[i] is None:
+                pending.append(i + 1)
+        return frozenset(closed)
+
+def plan(pattern):
+    """Factory function for GlobPlan objects"""
+    if isinstance(pattern, GlobPlan):
+        return pattern
+    return GlobPlan(pattern)
+
+def is_magic(segment):
+    """True if a path segment contains glob wildcards"""
+    return _magic_regex.search(segment) is not None
+
+def _compile_segment(segment):
+    """Returns a callable matching one path segment, or None for `**`"""
+    if segment == RECURSIVE:
+        return None
+    elif is_magic(segment):
+        return re.compile(fnmatch.translate(segment)).match
+    else:
+        return segment.__eq__
@@ -0,0 +1,543 @@
+"""
+Path for HTTP and HTTPS URLs.
+
+Directories are URLs ending with /. They are listed by parsing their index
+page, as served by Apache, nginx or python -m http.server, or with WebDAV
+PROPFIND. Requests go through a ConnectionPool of persistent http.client
+connections, so a listing or copy of many files reuses a few connections.
+"""
+import os, io, re, stat, logging, threading, functools, collections, email.utils
+import concurrent.futures
+import http.client
+from html import parser as html_parser
+from urllib import parse
+from xml.etree import ElementTree
+from multipath.paths import path as base, local
+
+log = logging.getLogger(__name__)
+
+# Idle connections a ConnectionPool keeps per host
+POOL_SIZE = 8
+# Socket timeout in seconds
+TIMEOUT = 60
+# Default number of downloads HttpPath.copy() runs at once
+COPY_JOBS = 4
+# Files bigger than this are downloaded in ranges of this size, if the
+# server supports it, RANGE_JOBS at a time
+RANGE_SIZE = 16 * 1024 * 1024
+RANGE_JOBS = 4
+# Read size when writing a response to a file
+CHUNK_SIZE = 1024 * 1024
+# Sidecar file of a ranged download, listing the ranges done
+PARTS_SUFFIX = '.parts'
+
+# Total is * if the server doesn't know it
+content_range_regex = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+PROPFIND_BODY = (b'<?xml version="1.0" encoding="utf-8"?>'
+                 b'<propfind xmlns="DAV:"><prop>'
+                 b'<resourcetype/><getcontentlength/><getlastmodified/>'
+                 b'</prop></propfind>')
+
+class HttpError(OSError):
+    """Unexpected HTTP status. status and reason are those of the response."""
+    def __init__(self, url, status, reason=''):
+        super().__init__('{} {} for {}'.format(status, reason, url))
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+class HttpPath(base.Path):
+    """
+    Implements HTTP(S) as a Path.
+
+    Arguments:
+        pool: ConnectionPool to send requests through. Defaults to the
+            module's pool.
+    """
+    def __init__(self, path, pool=None, **kwargs):
+        self._pool = pool
+        self._abs_path = path
+        super().__init__(path=path, **kwargs)
+
+    @property
+    def pool(self):
+        return self._pool if self._pool is not None else default_pool
+
+    # Functions that read or write
+
+    def as_bytes(self):
+        """Return contents of Path as bytes"""
+        with self.as_file('rb') as f:
+            return f.read()
+
+    def as_string(self, encoding='utf-8'):
+        """Return contents of Path as string"""
+        return self.as_bytes().decode(encoding)
+
+    def as_file(self, mode='rb', headers=None):
+        """
+        GET this URL and return the response as a file like object. The body
+        is read from the connection as it is read from the file. Close it to
+        give the connection back to the pool.
+        """
+        if any(c in mode for c in 'wax+'):
+            raise NotImplementedError('HttpPath can only be read')
+        response = self.pool.request('GET', self.path, headers=headers)
+        if response.status not in (200, 206):
+            response.close()
+            raise _error(self.path, response)
+        if 'b' in mode:
+            return response
+        return io.TextIOWrapper(io.BufferedReader(response), encoding=_charset(response))
+
+    # Functions that give information/metadata
+
+    def list(self, include=['.*'], exclude=[], recursive=False, files=True, dirs=True,
+             dav=False, **kwargs):
+        """
+        List files and directories below this URL.
+
+        Arguments:
+            dav: list with WebDAV PROPFIND instead of parsing index pages.
+                Listed paths then also have size and mtime.
+            Others are as for LocalPath.list().
+
+        Yields HttpPaths with the keys filename, rel_path (/ separated),
+        is_dir and is_file, and size and mtime when the listing has them.
+        """
+        path_filter = base.PathFilter(include, exclude)
+        root_url = self.path if self.path.endswith('/') else self.path + '/'
+        list_dir = self._propfind if dav else self._index
+        pending = collections.deque([(root_url, '')])
+        while pending:
+            dir_url, dir_rel_path = pending.popleft()
+            for url, name, is_dir, size, mtime in list_dir(dir_url):
+                rel_path = dir_rel_path + name
+                if is_dir and recursive and not path_filter.prune(rel_path):
+                    pending.append((url, rel_path + '/'))
+                if (is_dir and not dirs) or (not is_dir and not files):
+                    continue
+                if not path_filter.accept(rel_path):
+                    continue
+                yield type(self)(url, pool=self._pool, root=self, filename=name, rel_path=rel_path,
+                                 is_dir=is_dir, is_file=not is_dir, size=size, mtime=mtime)
+
+    def info(self, symlinks=True):
+        """
+        Like os.stat(), from the headers of a HEAD request. Only st_mode,
+        st_size and st_mtime are known. URLs ending with / are dirs.
+        """
+        if self.get('size') is not None:
+            size, mtime = self['size'], self['mtime']
+        else:
+            response = self.pool.request('HEAD', self.path)
+            response.read()
+            response.close()
+            if response.status != 200:
+                raise _error(self.path, response)
+            size = int(response.getheader('Content-Length') or 0)
+            mtime = _parse_date(response.getheader('Last-Modified'))
+        if self.get('is_dir', self.path.endswith('/')):
+            mode = stat.S_IFDIR | 0o555
+        else:
+            mode = stat.S_IFREG | 0o444
+        return os.stat_result((mode, 0, 0, 1, 0, 0, size, mtime or 0, mtime or 0, mtime or 0))
+
+    # Functions that move files
+
+    def copy(self, dest, metadata=True, dir_exist_ok=True,
+             include=['.*'], exclude=[], recursive=True,
+             jobs=COPY_JOBS, dav=False, range_size=RANGE_SIZE, range_jobs=RANGE_JOBS, **kwargs):
+        """
+        Download to local dest. A URL ending with / is listed, with include,
+        exclude, recursive and dav as for list(), and the files found are
+        fetched on jobs threads through the pool. Other URLs are fetched to
+        dest, or into dest if it is a dir.
+
+        Files bigger than range_size are fetched in ranges of that size,
+        range_jobs at a time, if the server supports ranges. See download().
+
+        With metadata, files get the Last-Modified time of the listing or
+        of their download. See local.copy_remote().
+
+        Returns: CopyResult. With jobs > 1, files that failed are in its errors.
+        """
+        copy_func = functools.partial(download, pool=self.pool, range_size=range_size, range_jobs=range_jobs,
+                                      metadata=metadata)
+        return local.copy_remote(self, dest, copy_func, metadata=metadata, download_mtime=True,
+                                 dir_exist_ok=dir_exist_ok, jobs=jobs, include=include, exclude=exclude,
+                                 recursive=recursive, dav=dav)
+
+    def _index(self, dir_url):
+        """Yields (url, name, is_dir, size, mtime) for the links of an index page"""
+        with type(self)(dir_url, pool=self._pool).as_file('rb') as f:
+            page = f.read().decode(_charset(f), 'replace')
+        links = _LinkParser()
+        links.feed(page)
+        links.close()
+        seen = set()
+        for href in links.hrefs:
+            url = parse.urljoin(dir_url, href)
+            url = parse.urldefrag(url)[0]
+            if '?' in url or not url.startswith(dir_url) or url in seen:
+                continue
+            seen.add(url)
+            name = url[len(dir_url):]
+            is_dir = name.endswith('/')
+            name = parse.unquote(name.rstrip('/'))
+            if not base.is_plain_name(name):
+                # The dir itself, not directly in it, or escaped out of it
+                continue
+            yield url, name, is_dir, None, None
+
+    def _propfind(self, dir_url):
+        """Yields (url, name, is_dir, size, mtime) for what PROPFIND finds in a dir"""
+        response = self.pool.request('PROPFIND', dir_url, body=PROPFIND_BODY,
+                                     headers={'Depth': '1', 'Content-Type': 'application/xml'})
+        body = response.read()
+        response.close()
+        if response.status != 207:
+            raise _error(dir_url, response)
+        return parse_propfind(body, dir_url)
+
+class ConnectionPool(object):
+    """
+    Persistent http.client connections, kept per scheme, host and port.
+    Connections are given back when the response is closed after being
+    read to the end; at most size idle ones are kept per host.
+    """
+    def __init__(self, size=POOL_SIZE, timeout=TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.connections_made = 0
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request and return the response. Close the response when done
+        with it. An idle connection the server has closed in the meantime is
+        replaced, and the request sent again.
+        """
+        parts = parse.urlsplit(url)
+        key = (parts.scheme.lower(), parts.netloc)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        headers = dict(headers or {})
+        while True:
+            conn, reused = self._get(key)
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            return _PooledResponse(self, key, conn, response)
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _get(self, key):
+        """Returns (connection, whether it was used before)"""
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop(), True
+            self.connections_made += 1
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _put(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.size:
+                conns.append(conn)
+                return
+        conn.close()
+
+class _PooledResponse(io.RawIOBase):
+    """http.client.HTTPResponse that gives its connection back to the pool when closed"""
+    def __init__(self, pool, key, conn, response):
+        super().__init__()
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._response.readinto(b)
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            return self._response.read()
+        return self._response.read(n)
+
+    def close(self):
+        if self.closed:
+            return
+        # Only a response read to the end leaves the connection usable
+        reusable = self._response.isclosed() and not self._response.will_close
+        self._response.close()
+        if reusable:
+            self._pool._put(self._key, self._conn)
+        else:
+            self._conn.close()
+        super().close()
+
+class _LinkParser(html_parser.HTMLParser):
+    """Collects the href of every <a> on a page"""
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.hrefs.append(value)
+
+# Connection pool HttpPaths use unless given one
+default_pool = ConnectionPool()
+
+## Convenience functions
+
+def download(url, dest, pool=None, range_size=RANGE_SIZE, range_jobs=RANGE_JOBS, metadata=False):
+    """
+    Download url to the file dest.
+
+    The first request asks for the first range_size bytes. If the server
+    answers with a part of a bigger file, dest is preallocated and the other
+    ranges are fetched range_jobs at a time, each written at its offset with
+    os.pwrite(). Ranges that are done are recorded in dest + PARTS_SUFFIX, so
+    an interrupted download picks up where it stopped. If-Range makes sure
+    all ranges come from the same version of the file; if it changes, the
+    ranges not fetched yet are dropped and the download starts over, and if
+    it changes again HttpError is raised. A
+    server that doesn't tell the total size gets one plain GET.
+
+    With metadata, dest gets the Last-Modified time of the responses, if
+    the server sends one, so no HEAD request is needed for it.
+
+    Returns dest.
+    """
+    if pool is None:
+        pool = default_pool
+    try:
+        last_modified = _download(url, dest, pool, range_size, range_jobs)
+    except _Changed:
+        log.info('{} changed while downloading it; starting over'.format(url))
+        os.remove(dest + PARTS_SUFFIX)
+        try:
+            last_modified = _download(url, dest, pool, range_size, range_jobs)
+        except _Changed:
+            raise HttpError(url, 200, 'Changed again while downloading')
+    mtime = _parse_date(last_modified) if metadata else None
+    if mtime is not None:
+        os.utime(dest, (mtime, mtime))
+    return dest
+
+class _Changed(Exception):
+    """The file changed during a ranged download"""
+
+def _download(url, dest, pool, range_size, range_jobs):
+    """download() without starting over. Returns the Last-Modified header of a response, or None."""
+    parts_path = dest + PARTS_SUFFIX
+    parts = _read_parts(parts_path, dest)
+    first = None
+    if parts is None:
+        first = pool.request('GET', url, headers={'Range': 'bytes=0-{}'.format(range_size - 1)})
+        if first.status == 416:
+            # No range of an empty file can be satisfied
+            first.read()
+            first.close()
+            first = pool.request('GET', url)
+        if first.status == 206 and _total_size(first) is None:
+            # E.g. "bytes 0-N/*": can't tell where the ranges end
+            first.close()
+            first = pool.request('GET', url)
+        if first.status == 200 or (first.status == 206 and _total_size(first) <= range_size):
+            # The whole file, in one go
+            with first, open(dest, 'wb') as fdest:
+                base.stream_copy(first, fdest)
+            return first.getheader('Last-Modified')
+        if first.status != 206:
+            first.close()
+            raise _error(url, first)
+        total = _total_size(first)
+        validator = first.getheader('ETag') or first.getheader('Last-Modified') or ''
+        if validator.startswith('W/'):
+            # Weak ETags can't be used with If-Range
+            validator = first.getheader('Last-Modified') or ''
+        with open(dest, 'wb') as f:
+            f.truncate(total)
+        with open(parts_path, 'w') as f:
+            f.write('{} {} {}\n'.format(total, range_size, validator))
+        parts = (total, range_size, validator, set())
+    total, range_size, validator, done = parts
+
+    headers = {'If-Range': validator} if validator else {}
+    ranges = [start for start in range(0, total, range_size) if start not in done]
+    # Every range is of the same version, so any of them tells its time
+    last_modified = [first.getheader('Last-Modified')] if first is not None else []
+    fd = os.open(dest, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+    parts_lock = threading.Lock()
+    try:
+        with open(parts_path, 'a') as parts_file:
+            def finished(start):
+                with parts_lock:
+                    parts_file.write('{}\n'.format(start))
+                    parts_file.flush()
+
+            # Set once a range failed, so the ranges still queued aren't fetched for nothing
+            stop = threading.Event()
+
+            def fetch(start):
+                if stop.is_set():
+                    return
+                end = min(start + range_size, total) - 1
+                range_headers = dict(headers, Range='bytes={}-{}'.format(start, end))
+                try:
+                    with pool.request('GET', url, headers=range_headers) as response:
+                        if response.status == 200:
+                            raise _Changed()
+                        if response.status != 206:
+                            raise _error(url, response)
+                        m = content_range_regex.match(response.getheader('Content-Range', ''))
+                        if not m or m.group(1, 2) != (str(start), str(end)):
+                            raise HttpError(url, response.status, 'Not the range asked for')
+                        _write_at(fd, response, start)
+                        last_modified.append(response.getheader('Last-Modified'))
+                except BaseException:
+                    stop.set()
+                    raise
+                finished(start)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=range_jobs) as executor:
+                futures = [executor.submit(fetch, start) for start in ranges if first is None or start > 0]
+                try:
+                    if first is not None:
+                        # Write the first range while the others download
+                        with first:
+                            _write_at(fd, first, 0)
+                        finished(0)
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+    finally:
+        os.close(fd)
+    os.remove(parts_path)
+    return last_modified[0] if last_modified else None
+
+def _read_parts(parts_path, dest):
+    """(total, range_size, validator, set of range starts done) of an unfinished download, or None"""
+    try:
+        with open(parts_path) as f:
+            total, range_size, validator = f.readline().rstrip('\n').split(' ', 2)
+            done = {int(line) for line in f if line.strip()}
+    except (OSError, ValueError):
+        return None
+    total = int(total)
+    if not validator or not os.path.isfile(dest) or os.path.getsize(dest) != total:
+        # Can't tell if the ranges done are still good
+        return None
+    return total, int(range_size), validator, done
+
+def _total_size(response):
+    """Total size from the Content-Range of a 206 response, or None if not known"""
+    m = content_range_regex.match(response.getheader('Content-Range', ''))
+    if not m or m.group(3) == '*':
+        return None
+    return int(m.group(3))
+
+def _write_at(fd, response, offset):
+    """Write the body of response to fd at offset"""
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = response.readinto(buf)
+        if not n:
+            break
+        written = 0
+        while written < n:
+            written += _pwrite(fd, view[written:n], offset + written)
+        offset += n
+
+if hasattr(os, 'pwrite'):
+    _pwrite = os.pwrite
+else:
+    _pwrite_lock = threading.Lock()
+    def _pwrite(fd, data, offset):
+        with _pwrite_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.write(fd, data)
+
+def parse_propfind(body, dir_url):
+    """
+    Parse a PROPFIND multistatus response for dir_url. Returns (url, name,
+    is_dir, size, mtime) tuples for what is in the dir.
+    """
+    dav = '{DAV:}'
+    entries = []
+    for response in ElementTree.fromstring(body).iter(dav + 'response'):
+        url = parse.urljoin(dir_url, response.findtext(dav + 'href', '').strip())
+        is_dir = response.find('.//' + dav + 'resourcetype/' + dav + 'collection') is not None
+        if is_dir and not url.endswith('/'):
+            url += '/'
+        name = parse.unquote(url[len(dir_url):].rstrip('/')) if url.startswith(dir_url) else ''
+        if not base.is_plain_name(name):
+            # The dir itself, not directly in it, or escaped out of it
+            continue
+        size = response.findtext('.//' + dav + 'getcontentlength')
+        mtime = _parse_date(response.findtext('.//' + dav + 'getlastmodified'))
+        entries.append((url, name, is_dir, int(size) if size else None, mtime))
+    return entries
+
+def _parse_date(value):
+    """Seconds since the epoch for an HTTP date, or None"""
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def _charset(response):
+    return response.headers.get_content_charset() or 'utf-8'
+
+def _error(url, response):
+    if response.status == 404:
+        return FileNotFoundError('404 {} for {}'.format(response.reason, url))
+    return HttpError(url, response.status, response.reason)
+
+## Path information functions
+
+def is_http_url(path):
+    path = str(path)[:8].lower()
+    return path.startswith('http://') or path.startswith('https://')
@@ -0,0 +1,231 @@
+"""
+Persistent listing index.
+
+A ListingIndex keeps listings in SQLite, keyed by root, so repeated listings
+of big trees can be answered without walking them again. For local trees
+refresh_local() only rescans directories whose mtime changed since the last
+refresh.
+
+Caveat: changing a file's content doesn't change its directory's mtime, so
+size, mtime and hash of files in otherwise unchanged directories can be
+stale. Adding, removing and renaming entries is always picked up.
+"""
+import os, logging, sqlite3, threading, contextlib
+
+log = logging.getLogger(__name__)
+
+FILE = 'f'
+DIR = 'd'
+# Sockets, FIFOs, broken symlinks and the like
+OTHER = 'o'
+
+_schema = """
+CREATE TABLE IF NOT EXISTS entries (
+    root TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    type TEXT NOT NULL,
+    symlink INTEGER NOT NULL DEFAULT 0,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    PRIMARY KEY (root, rel_path)
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (root, parent);
+CREATE TABLE IF NOT EXISTS dirs (
+    root TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (root, rel_path)
+);
+"""
+
+class ListingIndex(object):
+    """
+    SQLite backed listings.
+    Arguments:
+        path: SQLite database file. Defaults to an in-memory database.
+    """
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_schema)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.path)
+
+    def close(self):
+        self._db.close()
+
+    def has(self, root):
+        """True if a listing of root is stored"""
+        row = self._db.execute('SELECT 1 FROM entries WHERE root = ? LIMIT 1', (root,)).fetchone()
+        return row is not None
+
+    def entries(self, root, recursive=True):
+        """
+        Yields stored entries of root as dicts with rel_path, type, symlink,
+        size, mtime and hash keys, ordered by rel_path.
+        """
+        sql = 'SELECT rel_path, type, symlink, size, mtime, hash FROM entries WHERE root = ?'
+        params = [root]
+        if not recursive:
+            sql += ' AND parent = ?'
+            params.append('')
+        sql += ' ORDER BY rel_path'
+        for rel_path, type_, symlink, size, mtime, hash_ in self._db.execute(sql, params):
+            yield dict(rel_path=rel_path, type=type_, symlink=bool(symlink), size=size, mtime=mtime, hash=hash_)
+
+    def store(self, root, entries, sep='/'):
+        """
+        Replace the listing of root, e.g. with the listing of a remote Path.
+        Arguments:
+            entries: iterable of dicts with rel_path and type keys, and
+                optionally symlink, size, mtime and hash.
+            sep: separator used in rel_path, to find each entry's parent.
+        """
+        def rows():
+            for entry in entries:
+                rel_path = entry['rel_path']
+                parent = rel_path.rpartition(sep)[0]
+                yield (root, rel_path, parent, entry['type'], int(bool(entry.get('symlink'))),
+                       entry.get('size'), entry.get('mtime'), entry.get('hash'))
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM entries WHERE root = ?', (root,))
+            self._db.execute('DELETE FROM dirs WHERE root = ?', (root,))
+            self._db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows())
+
+    def refresh_local(self, root, hash_func=None):
+        """
+        Bring the listing of local dir root up to date. Only directories whose
+        mtime changed, or that weren't indexed yet, are read.
+        Arguments:
+            root: absolute path of a local directory.
+            hash_func: optional callable returning a hash for a file path. Hashes
+                are only computed for files whose size or mtime changed.
+        Returns: number of directories that were rescanned.
+        """
+        sep = os.path.sep
+        with self._lock, self._db:
+            known_dirs = dict(self._db.execute('SELECT rel_path, mtime_ns FROM dirs WHERE root = ?', (root,)))
+            seen_dirs = set()
+            rescanned = 0
+            stack = ['']
+            while stack:
+                rel_dirpath = stack.pop()
+                abs_dirpath = os.path.join(root, rel_dirpath) if rel_dirpath else root
+                try:
+                    mtime_ns = os.stat(abs_dirpath).st_mtime_ns
+                except OSError as e:
+                    log.warn('Cannot index {}: {}'.format(abs_dirpath, e))
+                    continue
+                seen_dirs.add(rel_dirpath)
+                if known_dirs.get(rel_dirpath) == mtime_ns:
+                    subdirs = [r for (r,) in self._db.execute(
+                        'SELECT rel_path FROM entries WHERE root = ? AND parent = ? AND type = ? AND symlink = 0',
+                        (root, rel_dirpath, DIR))]
+                else:
+                    subdirs = self._rescan_dir(root, rel_dirpath, abs_dirpath, mtime_ns, hash_func)
+                    rescanned += 1
+                stack.extend(subdirs)
+            # Forget dirs that are gone, along with their entries
+            for rel_dirpath in set(known_dirs) - seen_dirs:
+                self._db.execute('DELETE FROM entries WHERE root = ? AND parent = ?', (root, rel_dirpath))
+                self._db.execute('DELETE FROM dirs WHERE root = ? AND rel_path = ?', (root, rel_dirpath))
+        log.debug('Index of {} refreshed; rescanned {} of {} dirs'.format(root, rescanned, len(seen_dirs)))
+        return rescanned
+
+    def _rescan_dir(self, root, rel_dirpath, abs_dirpath, mtime_ns, hash_func):
+        """Replace the direct children of one dir. Returns its subdirs to visit."""
+        old = dict()
+        for rel_path, size, mtime, hash_ in self._db.execute(
+                'SELECT rel_path, size, mtime, hash FROM entries WHERE root = ? AND parent = ?', (root, rel_dirpath)):
+            old[rel_path] = (size, mtime, hash_)
+        rel_prefix = rel_dirpath + os.path.sep if rel_dirpath else ''
+        rows = []
+        subdirs = []
+        try:
+            with os.scandir(abs_dirpath) as it:
+                dir_entries = list(it)
+        except OSError as e:
+            log.warn('Cannot index {}: {}'.format(abs_dirpath, e))
+            dir_entries = []
+        for dir_entry in dir_entries:
+            rel_path = rel_prefix + dir_entry.name
+            try:
+                is_dir = dir_entry.is_dir()
+                is_file = dir_entry.is_file()
+                symlink = dir_entry.is_symlink()
+                try:
+                    st = dir_entry.stat()
+                except FileNotFoundError:
+                    if not symlink:
+                        raise
+                    # Broken symlinks are listed, as list() does
+                    st = dir_entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                rows.append((root, rel_path, rel_dirpath, DIR, int(symlink), None, st.st_mtime, None))
+                if not symlink:
+                    subdirs.append(rel_path)
+            elif not is_file:
+                # Never hashed; reading a FIFO would block
+                rows.append((root, rel_path, rel_dirpath, OTHER, int(symlink), st.st_size, st.st_mtime, None))
+            else:
+                hash_ = None
+                if hash_func is not None:
+                    size, mtime, hash_ = old.get(rel_path, (None, None, None))
+                    if hash_ is None or size != st.st_size or mtime != st.st_mtime:
+                        hash_ = hash_func(dir_entry.path)
+                rows.append((root, rel_path, rel_dirpath, FILE, int(symlink), st.st_size, st.st_mtime, hash_))
+        self._db.execute('DELETE FROM entries WHERE root = ? AND parent = ?', (root, rel_dirpath))
+        self._db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self._db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (root, rel_dirpath, mtime_ns))
+        return subdirs
+
+@contextlib.contextmanager
+def open_index(index):
+    """
+    Context manager giving index as a ListingIndex. Strings are taken as
+    database paths; the ListingIndex opened for one is closed on exit.
+    """
+    if isinstance(index, ListingIndex):
+        yield index
+        return
+    listing_index = ListingIndex(index)
+    try:
+        yield listing_index
+    finally:
+        listing_index.close()
+
+class IndexedDirEntry(object):
+    """
+    Stands in for os.DirEntry for entries read from a ListingIndex. Type
+    information comes from the index; stat() asks the file system.
+    """
+    def __init__(self, abs_dirpath, entry):
+        self.name = entry['rel_path'].rpartition(os.path.sep)[2]
+        self.path = os.path.join(abs_dirpath, self.name)
+        self.entry = entry
+        self._stat = None
+
+    def __repr__(self):
+        return '<{} {!r}>'.format(type(self).__name__, self.name)
+
+    def is_dir(self, follow_symlinks=True):
+        return self.entry['type'] == DIR
+
+    def is_file(self, follow_symlinks=True):
+        return self.entry['type'] == FILE
+
+    def is_symlink(self):
+        return self.entry['symlink']
+
+    def stat(self, follow_symlinks=True):
+        if not follow_symlinks:
+            return os.lstat(self.path)
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
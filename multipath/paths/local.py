@@ -1,272 +1,792 @@
-"""
-Extends and enhances os.path
-"""
-import os, shutil, logging, string, re
-from multipath.paths import path as base
-
-log = logging.getLogger(__name__)
-
-class LocalPath(base.Path):
-    """
-    Base for Posix, Windows and SMB/UNC paths.
-    """
-    
-    def __init__(self, path, *args, **kwargs):
-        # Decide on canonical path
-        if os.path.isabs(path):
-            self._path = path
-            self._abs_path = path
-            self._rel_path = os.path.relpath(path, start=os.path.curdir)
-        else:
-            self._abs_path = os.path.abspath(path)
-            self._rel_path = path
-        super().__init__(*args, path=self._abs_path, **kwargs)
-    
-    def list(self, 
-        include=['.*'], exclude=[], visitors=[], recursive=True, 
-        files=True, dirs=True,
-        **visitor_kwargs):
-        """
-        TODO What if self.path is a file?
-
-        Arguments
-        ---------
-        files: include files in list?
-        dirs: include dirs in list?
-        include: regular expression(s) indicating which paths to include
-        exclude: regular expression(s) indicating which paths to exclude. Overrides include.
-        visitors: list of callables to apply to each path that will be returned.
-        **visitor_kwargs: kwargs passed directly to visitors
-        """
-        # Pull in defaults
-        if visitors and not len(visitors):
-            visitors = self.visitors
-        log.debug('Visitors: {}'.format(visitors))
-
-        (include_patterns, exclude_patterns) = base.compile_filters(include, exclude)
-        """
-        # Make lists of include and exclude patterns
-        include_patterns = []
-        exclude_patterns = []
-        if type(include) == str:
-            include = [include]
-        for include_regex in include:
-            # HACK Windows compatability
-            include_regex = include_regex.replace('/', r'[\\/]')
-            include_patterns.append(re.compile(include_regex))
-        if type(exclude) == str:
-            exclude = [exclude]
-        for exclude_regex in exclude:
-            # HACK Windows compatability
-            exclude_regex = exclude_regex.replace('/', r'[\\/]')
-            exclude_patterns.append(re.compile(exclude_regex))
-
-        log.debug('Include regexes: {}'.format(include))
-        log.debug('Exclude regexes: {}'.format(exclude))
-        """
-
-        # Decide which path generator to use        
-        if os.path.isfile(self.path):
-            path_generator = echo_path_generator
-        elif recursive:
-            path_generator = os_walk_path_generator
-        else:
-            path_generator = os_listdir_path_generator
-        
-        for path in path_generator(self.path, files=files, dirs=dirs):
-            filename = os.path.basename(path)
-            abs_path = os.path.abspath(path)
-            rel_path = os.path.relpath(abs_path, start=self.path)
-            abs_dirpath = os.path.dirname(abs_path)
-            
-            # Apply filter(s)
-            if not base.accept_path(path, include_patterns, exclude_patterns):
-                continue
-            """
-            if not include_patterns or not len(include_patterns) or len([True for p in include_patterns if p.search(rel_path)]):
-                # An include regex matched relative path
-                log.debug('Including path: {}'.format(path))
-            else:
-                # log.debug('Skipping path: {}'.format(path))
-                continue
-            if len([True for p in exclude_patterns if p.search(rel_path)]):
-                # An exclude regex matched relative path, so don't yield file
-                log.debug('Excluding path: {}'.format(path))
-                continue
-            """
-            
-            file_dict = path.Path(path=path, root=self, filename=filename, abs_dirpath=abs_dirpath, abs_path=abs_path, rel_path=rel_path)
-            
-            # Possibly apply visitors
-            for visitor in visitors:
-                kwargs = dict()
-                kwargs.update(file_dict)
-                kwargs.update(visitor_kwargs)
-                file_dict.update(visitor(**kwargs))
-            
-            yield file_dict
-
-    def copy(self, dest, metadata=True, copy_func=shutil.copy2, 
-            include=['.*'], exclude=[], recursive=True,
-            files=True, dirs=True,
-            dir_exist_ok=False, dry_run=False,
-            delete=False, mirror=False, 
-            **kwargs):
-        """
-        Arguments:
-            copy_func: Must follow same contract as shutil.copy(), i.e. "Returns the path to the newly created file."
-            username:
-            password:
-            files: Copy files? If true, empty dirs will be copied.
-            dirs: Copy dirs? If true, empty dirs will be copied. If false, empty dirs won't.
-            dry_run: Don't actually copy. Just report via log.debug()
-            All others, see path.Path
-        Returns:
-            list of tuples of source Path and destination Path
-        """
-        log.debug('Ignoring these keyword args: {}'.format(kwargs))
-
-        # FIXME class should be same as calling sublcass?  
-        """
-        if not isinstance(dest, base.Path):
-            dest = multipath.path(dest)
-        """
-
-        # TODO support ignoring files?
-        """
-        filenames_to_ignore = {}
-        if ignore is not None: filenames_to_ignore = ignore(dirpath, filenames)
-        for filename in filenames:
-            if filename in filenames_to_ignore: continue
-            # exists_ok is new in Python 3.2
-            os.makedirs(dest_dirpath, exist_ok=exist_ok)
-            fq_src_path = os.path.sep.join((dirpath, filename))
-            fq_dest_path = os.path.sep.join((dest_dirpath, filename))
-            copy_function(fq_src_path, fq_dest_path)
-        """
-
-        # List of destination file paths that were copied
-        copied_to_dest = []
-
-        paths_to_copy = self.list(include=include, exclude=exclude, recursive=recursive, files=files, dirs=dirs)
-        for src in paths_to_copy:
-            # FIXME class should be same as calling sublcass?
-            # final_dest = multipath.path(join_consistently(dest.path, src.get('rel_path')))
-            final_dest = LocalPath(join_consistently(dest.path, src.get('rel_path')))
-
-            if dry_run:
-                log.debug('Should copy {} to {}'.format(src.path, final_dest.path))
-                continue
-
-            # Possibly create destination directory
-            # Creating dest dir only makes sense if src is not a file.
-            if not os.path.isfile(src) and not os.path.exists(dest):
-                os.makedirs(dest, exist_ok=dir_exist_ok)
-
-            # Actually copy file
-            if os.path.isfile(src) and os.path.isfile(dest):
-                log.debug('Overwrite file dest with file src')
-                copied_to_dest.append(copy_func(src, dest))
-            elif os.path.isfile(src) and os.path.isdir(dest):
-                log.debug('Copy file src into dir dest')
-                copied_to_dest.append(copy_func(src, dest))
-            elif os.path.isfile(src) and dest[-1] not in ['/','\\']:
-                log.debug('Copy file to new file')
-                os.makedirs(os.path.dirname(dest), exist_ok=dir_exist_ok)
-                copied_to_dest.append(copy_func(src, dest))
-            elif os.path.isfile(src) and dest[-1] in ['/','\\']:
-                log.debug('Copy file to new file into new dir')
-                os.makedirs(dest, exist_ok=dir_exist_ok)
-                copied_to_dest.append(copy_func(src, dest))
-            elif os.path.isdir(src) and src[-1] not in ['/','\\'] and os.path.isdir(dest):
-                log.debug('Copy dir src into dir dest.')
-                src_dir_basename = os.path.basename(src)
-                # FIXME
-                dest_dir = os.path.join(dest, src_dir_basename)
-                copied_to_dest += copytree(src, dest_dir, copy_func=copy_func)
-            elif os.path.isdir(src) and src[-1] in ['/','\\'] and os.path.isdir(dest):
-                log.debug('Recursively copy contents of dir src into dir dest')
-                # Dest will be created. Will fail if dest exists
-                copied_to_dest += copytree(src, dest, copy_func=copy_func)
-            else:
-                log.debug('Trying naive copytree')
-                copied_to_dest += copytree(src, dest, copy_func=copy_func)
-
-            copied_to_dest.append((src, dest))
-
-        log.debug('File multipath copied {} files'.format(len(copied_to_dest)))
-        return copied_to_dest
-
-## Path manipulation functions
-
-def echo_path_generator(root, files=True, dirs=True):
-    log.warn('Unused argument: files={}'.format(files))
-    log.warn('Unused argument: dirs={}'.format(dirs))
-    return [root]
-
-def os_walk_path_generator(root, files=True, dirs=True):
-    """
-    Yields recursive list of filenames
-    """
-    log.debug('os_walk_path_generator(root={}, files={}, dirs={})'.format(root, files, dirs))
-    # Special case where root is a file
-
-    for dirpath, subdirs, filenames in os.walk(root):
-        if files:
-            for filename in filenames:
-                yield os.path.join(dirpath, filename)
-        if dirs:
-            for subdir in subdirs:
-                yield os.path.join(dirpath, subdir)
-
-def os_listdir_path_generator(root, files=True, dirs=True):
-    """
-    Yields non-recursive list of filenames
-    """
-    log.warn('Unused argument: files={}'.format(files))
-    log.warn('Unused argument: dirs={}'.format(dirs))
-    for path in os.listdir(path=root):
-        yield path
-
-def join_consistently(*args):
-    """Like os.path.join(), but examines path to decide which join char to use"""
-    prejoined = "".join(args)
-    sep = '/'
-    if '/' not in prejoined and '\\' in prejoined:
-        sep = '\\'
-    return sep.join(args)
-
-def copytree(src, dest, copy_func=shutil.copy2, dir_exist_ok=False):
-    """
-    Similar to shutil.copytree(), but will overwrite files.
-    Arguments:
-        src: Path object.
-        dest: Path object.
-    Returns: list of tuples of source, destination Path pairs.
-    """
-    log.debug('copytree: {} -> {}'.format(src, dest))
-    copied_paths = []
-    for dirpath, subdirs, files in os.walk(src.path):
-        # Get path of source file relative to source root
-        rel_dirpath = os.path.relpath(dirpath, src.path)
-        if rel_dirpath == '.':
-            rel_dirpath = ''
-        os.makedirs(os.path.join(dest, rel_dirpath), exist_ok=dir_exist_ok)
-        for f in files:
-            src_file = os.path.normpath(os.path.join(src.path, rel_dirpath, f))
-            dest_file = os.path.normpath(os.path.join(dest.path, rel_dirpath, f))
-            log.debug(src_file + ' -> ' + dest_file)
-            copied_paths.append(copy_func(src_file, dest_file))
-    log.debug('copytree() copied {} files'.format(len(copied_paths)))
-    return copied_paths
-
-## Path information functions
-
-def is_local(path):
-    """True if path is on the local file system"""
-    
-    # TODO path.startswith('.') or path.startswith('/')
-    
-    return os.path.exists(path)
-
-
+"""
+Extends and enhances os.path
+"""
+import os, shutil, logging, string, re, functools, threading, hashlib, mmap
+import concurrent.futures
+from urllib import parse
+from multipath.paths import path as base, globs, index, entry, fastcopy
+# copy() has a plan argument
+from multipath.paths import plan as plans
+# list() has an index argument
+from multipath.paths.index import IndexedDirEntry
+
+log = logging.getLogger(__name__)
+
+# See LocalPath.copy()
+UPDATE_MODES = ('always', 'quick', 'checksum')
+# Files at least this big are memory mapped by LocalPath.as_bytes()
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
+class LocalPath(base.Path):
+    """
+    Base for Posix, Windows and SMB/UNC paths.
+    """
+    
+    def __init__(self, path, *args, **kwargs):
+        # Decide on canonical path. Relative paths are made absolute now, so
+        # a later chdir doesn't change what they point at. Making an absolute
+        # path relative needs the current dir, i.e. a syscall, so that waits
+        # until it's asked for.
+        if os.path.isabs(path):
+            self._abs_path = path
+        else:
+            self._abs_path = os.path.abspath(path)
+            self._rel_path = path
+        super().__init__(*args, path=self._abs_path, **kwargs)
+
+    @property
+    def path(self):
+        return self.abs_path
+    @path.setter
+    def path(self, value):
+        raise Exception('Path attributes are immutable')
+    @path.deleter
+    def path(self):
+        raise Exception('Path attributes are immutable')
+
+    def _make_abs_path(self):
+        return os.path.abspath(self._init_path)
+
+    def _make_rel_path(self):
+        return os.path.relpath(self._init_path, start=os.path.curdir)
+    
+    def list(self, 
+        include=['.*'], exclude=[], visitors=[], recursive=True, 
+        files=True, dirs=True, glob=None, index=None, hashes=False, compact=False,
+        sort=False, **visitor_kwargs):
+        """
+        Arguments
+        ---------
+        files: include files in list?
+        dirs: include dirs in list?
+        glob: only list paths matching this glob, relative to self. `**` matches
+            any number of dirs, and a glob ending with / only dirs. The walk starts at the glob's deepest literal
+            directory and only enters dirs that can still match, so recursive
+            is ignored.
+        index: ListingIndex, or path of its SQLite file, to answer from; a
+            file given by path is opened for the listing and closed after. Only
+            dirs whose mtime changed since the last listing are read; see
+            multipath.paths.index for what that can miss. Yielded Paths also get
+            size, mtime and hash keys.
+        hashes: with index, also store a content hash of each new or changed file.
+        compact: yield entry.Entry objects instead of Paths. They take a fraction
+            of the memory, support the same read-only keys and turn into
+            Paths with to_path(). Can't be used with visitors.
+        sort: yield paths in path.diff_key() order. Plain walks read each dir
+            sorted by name; glob and index listings are sorted in memory.
+        include: regular expression(s) indicating which paths to include
+        exclude: regular expression(s) indicating which paths to exclude. Overrides include.
+        visitors: list of callables to apply to each path that will be returned.
+        **visitor_kwargs: kwargs passed directly to visitors
+
+        Each yielded Path carries the os.DirEntry it was found through as
+        `dir_entry`, plus `is_dir` and `is_file`, so callers don't have to stat
+        the path again. See info(). Sockets, FIFOs and broken symlinks are
+        listed with the files, but with is_file false.
+        """
+        # Pull in defaults
+        if visitors and not len(visitors):
+            visitors = self.visitors
+        log.debug('Visitors: {}'.format(visitors))
+        if compact and visitors:
+            raise ValueError('Visitors need Paths; they cannot be used with compact=True')
+
+        path_filter = base.PathFilter(include, exclude)
+        # Subtrees that can't contain accepted paths are never entered
+        prune = path_filter.prune if path_filter.can_prune else None
+
+        # Decide which path generator to use
+        if os.path.isfile(self.path):
+            path_generator = echo_entry_generator
+        elif glob:
+            path_generator = functools.partial(glob_path_generator, pattern=glob)
+        elif index is not None:
+            path_generator = functools.partial(index_path_generator, listing_index=index,
+                                               hash_func=file_hash if hashes else None)
+        else:
+            path_generator = functools.partial(scandir_path_generator, sort=sort)
+        if sort and (glob or index is not None) and path_generator is not echo_entry_generator:
+            path_generator = _sorted_generator(path_generator)
+
+        path_class = type(self)
+        if compact:
+            dir_refs = _DirRefs(self, path_class)
+        for dir_entry, abs_dirpath, rel_path in path_generator(self.path, files=files, dirs=dirs, recursive=recursive, prune=prune):
+            if dir_entry is None:
+                # self.path is a file
+                abs_path = self.path
+                filename = rel_path
+                is_dir = False
+                is_file = True
+            else:
+                abs_path = dir_entry.path
+                filename = dir_entry.name
+                is_dir = dir_entry.is_dir()
+                is_file = dir_entry.is_file()
+
+            # Apply filter(s)
+            if not path_filter.accept(rel_path):
+                continue
+
+            if compact:
+                yield dir_refs.entry(rel_path, filename, is_dir, is_file)
+                continue
+
+            file_dict = path_class(abs_path, root=self, filename=filename, 
+                abs_dirpath=abs_dirpath, abs_path=abs_path, rel_path=rel_path,
+                dir_entry=dir_entry, is_dir=is_dir, is_file=is_file)
+            if type(dir_entry) is IndexedDirEntry:
+                indexed = dir_entry.entry
+                file_dict.update(size=indexed['size'], mtime=indexed['mtime'], hash=indexed['hash'])
+
+            # Possibly apply visitors
+            for visitor in visitors:
+                kwargs = dict()
+                kwargs.update(file_dict)
+                kwargs.update(visitor_kwargs)
+                file_dict.update(visitor(**kwargs))
+            
+            yield file_dict
+
+    def list_sorted(self, **kwargs):
+        """Like list(sort=True). See path.Path.list_sorted()."""
+        return self.list(sort=True, **kwargs)
+
+    def as_bytes(self, mmap_threshold=MMAP_THRESHOLD):
+        """
+        Return contents as a bytes-like object.
+
+        Files of at least mmap_threshold bytes are memory mapped and returned
+        as a read-only memoryview, so nothing is read or copied up front; the
+        map goes away with the last reference to the view. Smaller files, or
+        all files if mmap_threshold is None, are read into bytes.
+        """
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if mmap_threshold is not None and size and size >= mmap_threshold:
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            return f.read()
+
+    def as_string(self, encoding='utf-8', errors='strict'):
+        """Return contents as string"""
+        return str(self.as_bytes(), encoding, errors)
+
+    def as_file(self, mode='r', buffering=-1, **kwargs):
+        """
+        Opens file object and returns file like object. Arguments are passed on to open().
+        """
+        return open(self.path, mode, buffering=buffering, **kwargs)
+
+    def chunks(self, size=1024 * 1024):
+        """
+        Yields the contents in memoryviews of at most size bytes.
+
+        All chunks are views of one reused buffer filled with readinto(), so a
+        chunk is only valid until the next one is asked for. Use bytes(chunk) to
+        keep one.
+        """
+        buf = bytearray(size)
+        view = memoryview(buf)
+        # Unbuffered, so readinto() writes straight into buf
+        with open(self.path, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                yield view[:n]
+
+    def info(self, symlinks=True):
+        """
+        Like os.stat(). When this Path came from list(), asks its os.DirEntry,
+        which keeps the result. Only on Windows does the listing itself carry
+        the stat; elsewhere the first call still stats the file.
+        """
+        dir_entry = self.get('dir_entry')
+        if dir_entry is not None:
+            return dir_entry.stat(follow_symlinks=symlinks)
+        elif symlinks:
+            return os.stat(self.path)
+        else:
+            return os.lstat(self.path)
+
+    def copy(self, dest, metadata=True, copy_func=None, 
+            include=['.*'], exclude=[], recursive=True,
+            files=True, dirs=True,
+            dir_exist_ok=False, dry_run=False,
+            delete=False, mirror=False, jobs=1, update='always', plan=False,
+            index=None, hashes=False, **kwargs):
+        """
+        Arguments:
+            copy_func: Must follow same contract as shutil.copy(), i.e. "Returns the path to the newly created file."
+                Defaults to shutil.copy2() or shutil.copy(), depending on metadata.
+                Use fastcopy.FastCopy() for reflinks and in-kernel copies; it
+                copies metadata as metadata says unless it was given its own.
+            username:
+            password:
+            files: Copy files? If true, empty dirs will be copied.
+            dirs: Copy dirs? If true, empty dirs will be copied. If false, empty dirs won't.
+            dry_run: Don't actually copy. Just report the plan via log.debug()
+            jobs: Number of files to copy concurrently. With jobs > 1 files are
+                copied by a thread pool and a failing file doesn't stop the copy;
+                failures are collected in the result's errors.
+            update: When to write a file that already exists in dest, like rsync:
+                'always': always, without looking at dest.
+                'quick': if size or modification time (in whole seconds) differ.
+                'checksum': if size or content hash differ.
+                Source and dest are each stat'ed once per file; the listing only
+                saves the type check. Counts of copied, updated and skipped
+                files are kept on the result.
+            delete: Also remove what is below dest but not below this dir, like
+                rsync --delete. Paths excluded by include and exclude are left
+                alone on both sides. Works from self.diff(dest), so each tree
+                is listed once; removals happen after the copy, deepest first,
+                and are kept in the result's removed.
+            mirror: Make dest a copy of this dir, like rsync -a --delete:
+                delete, recursive and metadata, with update='quick' unless
+                another update mode is given.
+            index, hashes: list the source from a listing index, see list().
+                Stored hashes save hashing the source for update='checksum'
+                when the file's size and mtime still match them.
+            plan: Don't copy; return a plan.CopyPlan of what would be done, with
+                file and byte counts and a time estimate. Listing, and comparing
+                with dest for update and delete, happen now; the plan's
+                execute(jobs=...) does the rest. Without plan the operations
+                are run as the listing yields them.
+            All others, see path.Path
+        Returns:
+            CopyResult, i.e. list of tuples of source Path and destination Path
+        """
+        log.debug('Ignoring these keyword args: {}'.format(kwargs))
+
+        dest_str = base.ensure_string(dest)
+        if not dest_str:
+            raise ValueError('dest must not be empty')
+        if mirror:
+            delete = recursive = metadata = dir_exist_ok = True
+            if update == 'always':
+                update = 'quick'
+        if copy_func is None:
+            copy_func = shutil.copy2 if metadata else shutil.copy
+        elif isinstance(copy_func, fastcopy.FastCopy):
+            copy_func = functools.partial(copy_func, metadata=metadata)
+        if update not in UPDATE_MODES:
+            raise ValueError('update must be one of {}, not {!r}'.format(UPDATE_MODES, update))
+
+        # A plan that is kept decides what to skip up front. Otherwise the
+        # copy workers check dest, so checking overlaps copying.
+        planning = plan or dry_run
+        list_kwargs = dict(include=include, exclude=exclude, recursive=recursive, files=files, dirs=dirs,
+                           index=index, hashes=hashes)
+        if delete and os.path.isdir(self.path):
+            ops = self._plan_delete(dest_str, update, sizes=planning, **list_kwargs)
+            skip = None
+        elif planning:
+            ops = self._plan_copy(dest_str, update, sizes=True, **list_kwargs)
+            skip = None
+        else:
+            ops = self._plan_copy(dest_str, 'always', sizes=False, **list_kwargs)
+            skip = None if update == 'always' else functools.partial(is_up_to_date, update=update)
+
+        if planning:
+            copy_plan = plans.CopyPlan(ops, copy_func=copy_func, dir_exist_ok=dir_exist_ok)
+            if plan:
+                return copy_plan
+            for op in copy_plan:
+                log.debug('Should {} {}'.format(op.op, op.dest.path))
+            return base.CopyResult()
+        return plans.execute(ops, copy_func=copy_func, jobs=jobs, dir_exist_ok=dir_exist_ok, skip=skip)
+
+    def _plan_copy(self, dest_str, update, sizes, **list_kwargs):
+        """
+        Yields the plan.PlanOps of copy() without delete, as the listing
+        reaches each path, i.e. parents first. Files are compared with dest
+        unless update is 'always'; sizes says whether to get their sizes.
+        """
+        for src in self.list(**list_kwargs):
+            if src.path == self.path and (os.path.isdir(dest_str) or dest_str[-1] not in ['/','\\']):
+                # Source is a single file and dest names the file to create
+                if os.path.isdir(dest_str):
+                    final_dest = LocalPath(join_consistently(dest_str, src.get('rel_path')))
+                else:
+                    final_dest = LocalPath(dest_str)
+            else:
+                # FIXME class should be same as calling sublcass?
+                final_dest = LocalPath(join_consistently(dest_str.rstrip('/\\'), src.get('rel_path')))
+
+            # Type information comes from the listing; no need to stat src again
+            if src.get('is_dir'):
+                # Dirs already there are kept, so a repeated copy doesn't fail on them
+                final_dest['exists'] = os.path.isdir(final_dest.path)
+                yield plans.PlanOp(plans.MKDIR, src, final_dest, None)
+            elif update != 'always' and is_up_to_date(src, final_dest, update=update):
+                yield plans.PlanOp(plans.SKIP, src, final_dest, None)
+            else:
+                if sizes and update == 'always':
+                    # A kept plan counts the files it writes over
+                    final_dest['exists'] = os.path.exists(final_dest.path)
+                yield plans.PlanOp(plans.COPY, src, final_dest, _file_size(src) if sizes else None)
+
+    def _plan_delete(self, dest_str, update, sizes, **list_kwargs):
+        """Yields the plan.PlanOps of copy() with delete, from self.diff(dest)"""
+        dest_root = dest_str.rstrip('/\\')
+        compare = 'size' if update == 'always' else update
+        # A dest dir to be removed whole to make way for a file, whose
+        # contents are skipped when they come up as removed
+        removed_key = None
+        # Files replacing dirs; they come once the dest listing is done with them
+        replace_dirs = []
+        # Removals come last, deepest first
+        to_delete = []
+        # Only the source is listed from the index
+        src_listing = self.list_sorted(index=list_kwargs.pop('index'), hashes=list_kwargs.pop('hashes'),
+                                       **list_kwargs)
+        dest_listing = LocalPath(dest_root).list_sorted(**list_kwargs) if os.path.isdir(dest_root) else []
+        records = base.diff_listings(src_listing, dest_listing, compare=compare)
+        for record in records:
+            if record.status == base.REMOVED:
+                if removed_key is None or base.diff_key(record.rel_path)[:len(removed_key)] != removed_key:
+                    to_delete.append(record.dest)
+                continue
+            src = record.src
+            final_dest = record.dest
+            if final_dest is not None and src['is_dir'] != final_dest['is_dir']:
+                if final_dest['is_dir']:
+                    removed_key = base.diff_key(record.rel_path)
+                    replace_dirs.append((src, final_dest))
+                    continue
+                # Dir where there was a file
+                yield plans.PlanOp(plans.DELETE, src, final_dest, None)
+                final_dest = None
+            if final_dest is None:
+                final_dest = LocalPath(join_consistently(dest_root, record.rel_path))
+                final_dest['exists'] = False
+            else:
+                final_dest['exists'] = True
+
+            if src['is_dir']:
+                yield plans.PlanOp(plans.MKDIR, src, final_dest, None)
+            elif record.status == base.SAME and update != 'always':
+                yield plans.PlanOp(plans.SKIP, src, final_dest, None)
+            else:
+                yield plans.PlanOp(plans.COPY, src, final_dest, _file_size(src) if sizes else None)
+        for src, dest_dir in replace_dirs:
+            yield plans.PlanOp(plans.DELETE, src, dest_dir, None)
+            final_dest = LocalPath(dest_dir.path)
+            final_dest['exists'] = False
+            yield plans.PlanOp(plans.COPY, src, final_dest, _file_size(src) if sizes else None)
+        for dest in reversed(to_delete):
+            yield plans.PlanOp(plans.DELETE, None, dest, None)
+
+## Path manipulation functions
+
+def echo_path_generator(root, files=True, dirs=True):
+    log.warn('Unused argument: files={}'.format(files))
+    log.warn('Unused argument: dirs={}'.format(dirs))
+    return [root]
+
+def os_walk_path_generator(root, files=True, dirs=True):
+    """
+    Yields recursive list of filenames
+    """
+    log.debug('os_walk_path_generator(root={}, files={}, dirs={})'.format(root, files, dirs))
+    # Special case where root is a file
+
+    for dirpath, subdirs, filenames in os.walk(root):
+        if files:
+            for filename in filenames:
+                yield os.path.join(dirpath, filename)
+        if dirs:
+            for subdir in subdirs:
+                yield os.path.join(dirpath, subdir)
+
+def os_listdir_path_generator(root, files=True, dirs=True):
+    """
+    Yields non-recursive list of filenames
+    """
+    log.warn('Unused argument: files={}'.format(files))
+    log.warn('Unused argument: dirs={}'.format(dirs))
+    for path in os.listdir(path=root):
+        yield path
+
+def echo_entry_generator(root, files=True, dirs=True, recursive=True, prune=None):
+    """
+    Yields root itself in the same (dir_entry, abs_dirpath, rel_path) shape
+    as scandir_path_generator(). There is no os.DirEntry for root, so
+    dir_entry is None and rel_path is the file name.
+    """
+    yield (None, os.path.dirname(root), os.path.basename(root))
+
+def scandir_path_generator(root, files=True, dirs=True, recursive=True, followlinks=False, prune=None, sort=False):
+    """
+    Yields (dir_entry, abs_dirpath, rel_path) for everything below root.
+
+    Built on os.scandir() so file type (and stat, once asked for) is cached on
+    each os.DirEntry, and rel_path is built from the parent's prefix instead of
+    calling os.path.relpath() on every entry. Traversal is depth first and
+    pre-order: a directory is yielded before anything below it. Like
+    os.walk(), symlinks to directories are reported as dirs but not descended
+    into unless followlinks is true, everything else that isn't a dir comes
+    with the files, and unreadable directories are skipped.
+
+    prune: optional callable taking a dir's rel_path. If it returns true,
+        the dir is still yielded but nothing below it is read.
+    sort: read the entries of each dir sorted by name, so everything comes
+        in path.diff_key() order.
+    """
+    log.debug('scandir_path_generator(root={}, files={}, dirs={}, recursive={})'.format(root, files, dirs, recursive))
+    sep = os.path.sep
+    scandir_list = _scandir_sorted if sort else _scandir_list
+    # Stack of (abs_dirpath, rel_prefix, iterator over the dir's entries)
+    stack = [(root, '', iter(scandir_list(root)))]
+    while stack:
+        abs_dirpath, rel_prefix, entries = stack[-1]
+        for dir_entry in entries:
+            rel_path = rel_prefix + dir_entry.name
+            try:
+                is_dir = dir_entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if dirs:
+                    yield (dir_entry, abs_dirpath, rel_path)
+                if recursive and (followlinks or not dir_entry.is_symlink()) \
+                        and (prune is None or not prune(rel_path)):
+                    stack.append((dir_entry.path, rel_path + sep, iter(scandir_list(dir_entry.path))))
+                    break
+            elif files:
+                yield (dir_entry, abs_dirpath, rel_path)
+        else:
+            stack.pop()
+
+def glob_path_generator(root, pattern, files=True, dirs=True, recursive=True, followlinks=False, prune=None):
+    """
+    Yields (dir_entry, abs_dirpath, rel_path) for paths below root matching
+    the glob pattern, like scandir_path_generator() does for all paths.
+
+    The walk starts at the pattern's deepest literal directory and each level
+    is matched against one glob segment, so subtrees that can't match are
+    never read. recursive is ignored; the pattern decides how deep to go.
+    """
+    glob_plan = globs.plan(pattern)
+    log.debug('glob_path_generator(root={}, plan={})'.format(root, glob_plan))
+    sep = os.path.sep
+    start_dirpath = os.path.join(root, *glob_plan.prefix)
+    if not os.path.isdir(start_dirpath):
+        return
+    rel_prefix = sep.join(glob_plan.prefix) + sep if glob_plan.prefix else ''
+    # Stack of (abs_dirpath, rel_prefix, glob states, iterator over the dir's entries)
+    stack = [(start_dirpath, rel_prefix, glob_plan.start, iter(_scandir_list(start_dirpath)))]
+    while stack:
+        abs_dirpath, rel_prefix, states, entries = stack[-1]
+        for dir_entry in entries:
+            entry_states = glob_plan.advance(states, dir_entry.name)
+            if not entry_states:
+                continue
+            rel_path = rel_prefix + dir_entry.name
+            try:
+                is_dir = dir_entry.is_dir()
+            except OSError:
+                is_dir = False
+            if glob_plan.is_match(entry_states) and \
+                    ((is_dir and dirs) or (not is_dir and files and not glob_plan.dirs_only)):
+                yield (dir_entry, abs_dirpath, rel_path)
+            if is_dir and glob_plan.can_descend(entry_states) \
+                    and (followlinks or not dir_entry.is_symlink()) \
+                    and (prune is None or not prune(rel_path)):
+                stack.append((dir_entry.path, rel_path + sep, entry_states, iter(_scandir_list(dir_entry.path))))
+                break
+        else:
+            stack.pop()
+
+def index_path_generator(root, listing_index, files=True, dirs=True, recursive=True, prune=None, hash_func=None):
+    """
+    Yields (dir_entry, abs_dirpath, rel_path) for everything below root, like
+    scandir_path_generator(), but answers from a ListingIndex after refreshing
+    it. dir_entry is an index.IndexedDirEntry.
+    """
+    sep = os.path.sep
+    with index.open_index(listing_index) as listing_index:
+        listing_index.refresh_local(root, hash_func=hash_func)
+        # Pruned dirs. Entries come sorted, so parents are seen before children
+        pruned = set()
+        for entry in listing_index.entries(root, recursive=recursive):
+            rel_path = entry['rel_path']
+            parent = rel_path.rpartition(sep)[0]
+            is_dir = entry['type'] == index.DIR
+            if parent in pruned:
+                if is_dir:
+                    pruned.add(rel_path)
+                continue
+            if is_dir and prune is not None and prune(rel_path):
+                pruned.add(rel_path)
+            if (is_dir and dirs) or (not is_dir and files):
+                abs_dirpath = os.path.join(root, parent) if parent else root
+                yield (IndexedDirEntry(abs_dirpath, entry), abs_dirpath, rel_path)
+
+def _scandir_list(dirpath):
+    """
+    Read a whole directory with os.scandir(). The handle is closed before
+    descending so deep trees don't pile up open file descriptors.
+    """
+    try:
+        with os.scandir(dirpath) as it:
+            return [dir_entry for dir_entry in it]
+    except OSError as e:
+        log.warn('Cannot list {}: {}'.format(dirpath, e))
+        return []
+
+def _scandir_sorted(dirpath):
+    """_scandir_list(), sorted by name"""
+    dir_entries = _scandir_list(dirpath)
+    dir_entries.sort(key=lambda dir_entry: dir_entry.name)
+    return dir_entries
+
+def _sorted_generator(path_generator):
+    """Wraps a path generator so it yields in path.diff_key() order"""
+    def sorted_path_generator(root, **kwargs):
+        return iter(sorted(path_generator(root, **kwargs), key=lambda item: base.diff_key(item[2])))
+    return sorted_path_generator
+
+class _DirRefs(dict):
+    """
+    The entry.DirRefs of one listing by rel_path, so all entries of a dir
+    share one.
+    """
+    def __init__(self, root, path_class):
+        super().__init__()
+        if os.path.isfile(root.path):
+            abs_path = os.path.dirname(root.path)
+        else:
+            abs_path = root.path
+        self[''] = entry.RootRef(root, abs_path, path_class)
+
+    def __missing__(self, rel_dirpath):
+        parent, _, name = rel_dirpath.rpartition(os.path.sep)
+        dir_ref = self[rel_dirpath] = entry.DirRef(self[parent], name)
+        return dir_ref
+
+    def entry(self, rel_path, name, is_dir, is_file):
+        return entry.Entry(self[rel_path[:-len(name)].rstrip(os.path.sep)], name, is_dir, is_file)
+
+def join_consistently(*args):
+    """Like os.path.join(), but examines path to decide which join char to use"""
+    prejoined = "".join(args)
+    sep = '/'
+    if '/' not in prejoined and '\\' in prejoined:
+        sep = '\\'
+    return sep.join(args)
+
+def copy_files(pairs, copy_func=shutil.copy2, jobs=1, backlog=None, result=None, skip=None):
+    """
+    Copy files, possibly concurrently.
+    Arguments:
+        pairs: iterable of (src, dest) tuples of Paths or strings. Dest dirs
+            must already exist.
+        copy_func: see LocalPath.copy()
+        jobs: number of worker threads. With jobs <= 1 files are copied in the
+            calling thread and the first failure is raised.
+        backlog: max number of pairs waiting for a worker. Defaults to 4 per job.
+            Bounds memory when pairs comes from a lazy listing.
+        result: CopyResult to add to. A new one is made if not given.
+        skip: optional callable taking src and dest. If it returns true, the
+            file isn't copied. Runs in the worker, so it may be slow.
+    Returns: CopyResult. With jobs > 1, files that failed are in its errors
+        as (src, dest, exception) tuples, and finished files are in
+        completion order.
+    """
+    if result is None:
+        result = base.CopyResult()
+    if jobs <= 1:
+        for src, dest in pairs:
+            if skip is not None and skip(src, dest):
+                result.add_skipped(src, dest)
+                continue
+            copy_func(base.ensure_string(src), base.ensure_string(dest))
+            result.add_copied(src, dest)
+        return result
+
+    if backlog is None:
+        backlog = jobs * 4
+    # Bounds files submitted but not yet copied
+    slots = threading.BoundedSemaphore(jobs + backlog)
+
+    def copy_one(src, dest):
+        try:
+            if skip is not None and skip(src, dest):
+                result.add_skipped(src, dest)
+            else:
+                copy_func(base.ensure_string(src), base.ensure_string(dest))
+                result.add_copied(src, dest)
+        except Exception as e:
+            log.error('Could not copy {} to {}: {}'.format(src, dest, e))
+            result.errors.append((src, dest, e))
+        finally:
+            slots.release()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for src, dest in pairs:
+            slots.acquire()
+            executor.submit(copy_one, src, dest)
+    log.debug('copy_files() copied {} files with {} errors'.format(len(result), len(result.errors)))
+    return result
+
+def copy_remote(src, dest, download, metadata=True, download_mtime=False, dir_exist_ok=True, jobs=1,
+                **list_kwargs):
+    """
+    Download a remote file or tree to local dest, as HttpPath.copy() and
+    FtpPath.copy() do.
+    Arguments:
+        src: Path of a URL. One ending with / is listed with list_kwargs and
+            its files downloaded below dest on jobs threads; other URLs are
+            downloaded to dest, or into dest if it is a dir. Listed paths
+            that would land outside dest are not copied but kept in errors.
+        download: callable taking a URL and a dest file name, that downloads one file.
+        metadata: if true, files and dirs get the source's mtime, from the
+            listing if it has one. Files listed without one are asked with
+            info(), unless download_mtime says download sets it already.
+    Returns: CopyResult, see copy_files().
+    """
+    dest = base.ensure_string(dest)
+    # Listed source of each dest file being downloaded
+    sources = dict()
+
+    def copy_func(url, dest_file):
+        src_path = sources.pop(dest_file)
+        download(url, dest_file)
+        if metadata:
+            mtime = src_path.get('mtime')
+            if mtime is None and not download_mtime:
+                mtime = src_path.info().st_mtime
+            if mtime:
+                os.utime(dest_file, (mtime, mtime))
+        return dest_file
+
+    if not src.path.endswith('/'):
+        if os.path.isdir(dest):
+            name = parse.unquote(src.path.rsplit('/', 1)[-1])
+            if not base.is_plain_name(name):
+                raise ValueError('Cannot copy {} into {}: bad name {!r}'.format(src, dest, name))
+            dest = os.path.join(dest, name)
+        dest_path = LocalPath(dest)
+        sources[dest_path.path] = src
+        return copy_files([(src, dest_path)], copy_func=copy_func)
+
+    result = base.CopyResult()
+    os.makedirs(dest, exist_ok=dir_exist_ok)
+    dirs = []
+
+    def pairs():
+        made_dirs = {dest}
+        real_dest = os.path.realpath(dest)
+        for src_path in src.list(**list_kwargs):
+            final_dest = os.path.normpath(os.path.join(dest, *src_path['rel_path'].split('/')))
+            real_path = os.path.realpath(final_dest)
+            if real_path == real_dest or os.path.commonpath([real_dest, real_path]) != real_dest:
+                # A listing must not put anything outside dest, whatever names it had
+                e = ValueError('{} is not below {}'.format(final_dest, dest))
+                log.error('Could not copy {} to {}: {}'.format(src_path, final_dest, e))
+                result.errors.append((src_path, LocalPath(final_dest), e))
+                continue
+            dirpath = final_dest if src_path['is_dir'] else os.path.dirname(final_dest)
+            if dirpath not in made_dirs:
+                os.makedirs(dirpath, exist_ok=True)
+                made_dirs.add(dirpath)
+            dest_path = LocalPath(final_dest)
+            if src_path['is_dir']:
+                result.append((src_path, dest_path))
+                dirs.append((src_path, dest_path))
+            else:
+                sources[dest_path.path] = src_path
+                yield src_path, dest_path
+
+    copy_files(pairs(), copy_func=copy_func, jobs=jobs, result=result)
+    if metadata:
+        # Writing files below a dir changes its mtime, so dirs come last, deepest first
+        for src_path, dest_path in reversed(dirs):
+            if src_path.get('mtime'):
+                os.utime(dest_path.path, (src_path['mtime'], src_path['mtime']))
+    return result
+
+def _file_size(path):
+    """Size of a listed file, from the listing if it has it"""
+    if path.get('size') is not None:
+        return path['size']
+    return path.info().st_size
+
+def is_up_to_date(src, dest, update='quick'):
+    """
+    Decide whether file dest already matches file src, like rsync's quick check.
+    Arguments:
+        src: LocalPath. Its stat comes from info(), so a Path from list()
+            isn't stat'ed twice, but is stat'ed once here.
+        dest: LocalPath. Gets an `exists` key telling whether it existed.
+        update: 'quick' compares size and modification time in whole seconds,
+            'checksum' compares size and content hash. See LocalPath.copy().
+    Returns: True if dest doesn't need to be written.
+
+    src is always stat'ed: an index listing can be stale for files changed
+    in place. Its hash key is only used if its size and mtime keys match
+    that stat.
+    """
+    try:
+        dest_stat = os.stat(dest.path)
+    except FileNotFoundError:
+        dest['exists'] = False
+        return False
+    dest['exists'] = True
+    src_stat = src.info()
+    if src_stat.st_size != dest_stat.st_size:
+        return False
+    if update == 'quick':
+        return int(src_stat.st_mtime) == int(dest_stat.st_mtime)
+    elif update == 'checksum':
+        return (base.listed_hash(src, src_stat) or file_hash(src.path)) == file_hash(dest.path)
+    raise ValueError('Unknown update mode {!r}'.format(update))
+
+def file_hash(path, algorithm='blake2b', buffer_size=1024 * 1024):
+    """Hex digest of a file's content"""
+    h = hashlib.new(algorithm)
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+def copytree(src, dest, copy_func=shutil.copy2, dir_exist_ok=False):
+    """
+    Similar to shutil.copytree(), but will overwrite files.
+    Arguments:
+        src: Path object.
+        dest: Path object.
+    Returns: list of tuples of source, destination Path pairs.
+    """
+    log.debug('copytree: {} -> {}'.format(src, dest))
+    copied_paths = []
+    for dirpath, subdirs, files in os.walk(src.path):
+        # Get path of source file relative to source root
+        rel_dirpath = os.path.relpath(dirpath, src.path)
+        if rel_dirpath == '.':
+            rel_dirpath = ''
+        os.makedirs(os.path.join(dest, rel_dirpath), exist_ok=dir_exist_ok)
+        for f in files:
+            src_file = os.path.normpath(os.path.join(src.path, rel_dirpath, f))
+            dest_file = os.path.normpath(os.path.join(dest.path, rel_dirpath, f))
+            log.debug(src_file + ' -> ' + dest_file)
+            copied_paths.append(copy_func(src_file, dest_file))
+    log.debug('copytree() copied {} files'.format(len(copied_paths)))
+    return copied_paths
+
+## Path information functions
+
+def is_local(path):
+    """True if path is on the local file system"""
+    
+    # TODO path.startswith('.') or path.startswith('/')
+    
+    return os.path.exists(path)
+
+
@@ -1,15 +1,42 @@
 """
 Base for all Path implementations.
 """
-import sys, logging, re
+import sys, os, stat, logging, re, threading, functools, asyncio, queue, collections, hashlib
+import concurrent.futures
 
 log = logging.getLogger(__name__)
 
+# Max number of blocking Path operations the async API runs at once
+ASYNC_WORKERS = 32
+_executor = None
+_executor_lock = threading.Lock()
+
+# Buffer pool stream_copy() uses: number of buffers and size of each
+COPY_BUFFERS = 4
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# How diff() decides if a file in both trees is the same, see diff_listings()
+DIFF_MODES = ('quick', 'size', 'checksum')
+# Statuses of DiffRecords
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+SAME = 'same'
+
+# What diff() yields. src or dest is None for paths only on the other side.
+DiffRecord = collections.namedtuple('DiffRecord', ['status', 'rel_path', 'src', 'dest'])
+
 class Path(dict):
     """
     Base class for all Path objects. 
     Don't instantate this class directly; call multipath.path() instead.
     """
+    # Subclasses set these when they are known up front. Otherwise they are
+    # worked out on first use by _make_abs_path() and _make_rel_path(), so
+    # constructing a Path stays cheap.
+    _abs_path = None
+    _rel_path = None
+
     def __init__(self, path, **kwargs):
         self._init_path = path
         self._path = path
@@ -41,6 +68,8 @@ class Path(dict):
     
     @property
     def abs_path(self):
+        if self._abs_path is None:
+            self._abs_path = self._make_abs_path()
         return self._abs_path
     @abs_path.setter
     def abs_path(self, value):
@@ -51,6 +80,8 @@ class Path(dict):
 
     @property
     def rel_path(self):
+        if self._rel_path is None:
+            self._rel_path = self._make_rel_path()
         return self._rel_path
     @rel_path.setter
     def rel_path(self, value):
@@ -58,6 +89,14 @@ class Path(dict):
     @rel_path.deleter
     def rel_path(self):
         raise Exception('Path attributes are immutable')
+
+    def _make_abs_path(self):
+        """Work out abs_path. Returns None if it can't be known."""
+        return None
+
+    def _make_rel_path(self):
+        """Work out rel_path. Returns None if it can't be known."""
+        return None
     
     # Functions that read or write
 
@@ -131,11 +170,38 @@ class Path(dict):
         """
         raise NotImplementedError()
 
+    def list_sorted(self, **kwargs):
+        """
+        Like list(), but yields Paths in the order of diff_key() of their
+        rel_path. This version sorts the whole listing in memory; subclasses
+        that can walk their tree in that order override it.
+        """
+        return iter(sorted(self.list(**kwargs), key=lambda p: diff_key(p['rel_path'])))
+
+    def diff(self, other, compare='quick', **kwargs):
+        """
+        Compare the tree below this dir with the one below other, a Path or
+        path string of any kind. Yields DiffRecords in rel_path order:
+            added: only below self. dest is None.
+            removed: only below other. src is None.
+            changed, same: in both, compared as compare says; see
+                diff_listings().
+        kwargs, e.g. include, exclude and recursive, are passed to list() of
+        both sides. Both listings are streamed in sorted order and merged, so
+        memory doesn't grow with the size of the trees when both sides can
+        list in order, see list_sorted().
+        """
+        if not isinstance(other, Path):
+            from multipath import multipath
+            other = multipath.path(other)
+        return diff_listings(self.list_sorted(**kwargs), other.list_sorted(**kwargs), compare=compare)
+
     # Functions that move files
 
     def copy(self, dest, metadata=True, dir_exist_ok=True,
             include=None, exclude=None, recursive=True,
-            delete=False, mirror=False):
+            delete=False, mirror=False,
+            buffer_size=COPY_BUFFER_SIZE, buffers=COPY_BUFFERS, **kwargs):
         """
         A full featured copy command. 
         Tries to combine best parts of rsync, shutil.copytree(), shutil.copy2()
@@ -151,11 +217,26 @@ class Path(dict):
                 Only used if path is a dir.
             delete: Deletes files in dest that arent in source.
                 Only used if path is a dir.
+            buffer_size, buffers: Size and number of buffers for stream_copy().
         Meta-arguments:
             mirror: Makes copy behave like `rsync -az --delete`.
                 Copies files from 
+
+        This version copies the contents of a single file by streaming this
+        path's as_file() into dest's as_file() with stream_copy(), so any two
+        Path classes that implement as_file() can copy to each other.
+        Subclasses override it to copy directories or to use native tools,
+        and may take more keyword args; those are ignored here.
         """
-        raise NotImplementedError() 
+        log.debug('Ignoring these keyword args: {}'.format(kwargs))
+        if not isinstance(dest, Path):
+            from multipath import multipath
+            dest = multipath.path(dest)
+        with self.as_file('rb') as fsrc, dest.as_file('wb') as fdest:
+            stream_copy(fsrc, fdest, buffer_size=buffer_size, buffers=buffers)
+        result = CopyResult()
+        result.add_copied(self, dest)
+        return result
 
     def move(self, dest):
         raise NotImplementedError()
@@ -163,6 +244,86 @@ class Path(dict):
     def rename(self, dest):
         raise NotImplementedError()
 
+    # Async versions. By default these run the blocking versions on the shared
+    # executor, see get_executor(). Subclasses that can do better, e.g. with
+    # asyncio subprocesses, override them.
+
+    async def alist(self, batch_size=256, **kwargs):
+        """
+        Async iterator over what list() yields. Takes the same arguments.
+        Paths are fetched from the executor batch_size at a time. If the
+        consumer stops early, the list() generator is closed, so it can
+        release what it holds.
+        """
+        loop = asyncio.get_running_loop()
+        executor = get_executor()
+        listing = await loop.run_in_executor(executor, functools.partial(self.list, **kwargs))
+        paths = iter(listing)
+        try:
+            while True:
+                batch = await loop.run_in_executor(executor, _take, paths, batch_size)
+                for path in batch:
+                    yield path
+                if len(batch) < batch_size:
+                    break
+        finally:
+            close = getattr(paths, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(executor, close)
+
+    async def ainfo(self, **kwargs):
+        """Async version of info()"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), functools.partial(self.info, **kwargs))
+
+    async def acopy(self, dest, **kwargs):
+        """Async version of copy()"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), functools.partial(self.copy, dest, **kwargs))
+
+class CopyResult(list):
+    """
+    What copy() returns: a list of (source Path, destination Path) tuples.
+    Copies that failed without stopping the whole copy are kept in errors as
+    (source, destination, exception) tuples.
+
+    copied, updated and skipped count files written to a new destination,
+    files written over an existing one, and files left alone because the
+    destination was up to date. If nothing looked at the destination first,
+    every written file counts as copied. deleted counts what was removed from
+    the destination; those paths are kept in removed.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.errors = []
+        self.copied = 0
+        self.updated = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.removed = []
+        # Copy engines may add results from several threads
+        self._lock = threading.Lock()
+
+    def add_copied(self, src, dest):
+        """Record a written file. dest's `exists` key tells if it was updated."""
+        with self._lock:
+            self.append((src, dest))
+            if isinstance(dest, dict) and dest.get('exists'):
+                self.updated += 1
+            else:
+                self.copied += 1
+
+    def add_skipped(self, src, dest):
+        """Record a file that was already up to date"""
+        with self._lock:
+            self.skipped += 1
+
+    def add_deleted(self, dest):
+        """Record a path removed from the destination"""
+        with self._lock:
+            self.removed.append(dest)
+            self.deleted += 1
+
 ## Convenience functions
 
 def compile_filters(include=[], exclude=[]):
@@ -193,28 +354,347 @@ def compile_filters(include=[], exclude=[]):
 
     return (include_patterns, exclude_patterns)
 
+class PathFilter(object):
+    """
+    Include and exclude regexes compiled into a single matcher each.
+
+    Besides accepting or rejecting single relative paths, a PathFilter can tell
+    when nothing below a directory can ever be accepted so walkers can skip
+    the whole subtree. See prune().
+    """
+    # Constructs whose result depends on what follows the matched text. A
+    # regex without them that matches a dir's path also matches everything
+    # below that dir.
+    _unstable_regex = re.compile(r'\$|\\Z|\\b|\\B|\(\?=|\(\?!')
+    # Backreferences would point at the wrong group once regexes are merged
+    _backref_regex = re.compile(r'\\[1-9]|\(\?P=')
+
+    def __init__(self, include=None, exclude=None):
+        if include is None:
+            include = []
+        elif type(include) == str:
+            include = [include]
+        if exclude is None:
+            exclude = []
+        elif type(exclude) == str:
+            exclude = [exclude]
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self._include_search = _merge_regexes(self.include)
+        self._exclude_search = _merge_regexes(self.exclude)
+
+        # Excludes that, once they match a dir, match all its descendants
+        self._prune_exclude_search = _merge_regexes([r for r in self.exclude 
+                                                     if not self._unstable_regex.search(r)])
+        # Literal prefixes of anchored includes. If any include has no such
+        # prefix, every directory might contain a match.
+        prefixes = [_literal_prefix(r) for r in self.include]
+        if prefixes and None not in prefixes:
+            self._include_prefixes = prefixes
+        else:
+            self._include_prefixes = None
+
+        self.can_prune = self._prune_exclude_search is not None or self._include_prefixes is not None
+        log.debug('Include regexes: {}'.format(self.include))
+        log.debug('Exclude regexes: {}'.format(self.exclude))
+
+    def accept(self, rel_path):
+        """True if rel_path passes the include and exclude regexes"""
+        if self._include_search is not None and not self._include_search(rel_path):
+            return False
+        if self._exclude_search is not None and self._exclude_search(rel_path):
+            return False
+        return True
+
+    def accept_path(self, path):
+        """Like accept(), but for Path objects with a rel_path key"""
+        return self.accept(path['rel_path'])
+
+    def prune(self, rel_dirpath):
+        """
+        True if no path below the directory rel_dirpath can be accepted, i.e.
+        a walker does not need to descend into it. The directory itself is
+        not judged; use accept() for that.
+        """
+        if not self.can_prune:
+            return False
+        dir_prefix = rel_dirpath + os.path.sep
+        if self._prune_exclude_search is not None and self._prune_exclude_search(dir_prefix):
+            return True
+        if self._include_prefixes is not None:
+            dir_prefix = dir_prefix.replace('\\', '/')
+            for prefix in self._include_prefixes:
+                if prefix.startswith(dir_prefix) or dir_prefix.startswith(prefix):
+                    return False
+            return True
+        return False
+
 def accept_path(path, include_patterns=None, exclude_patterns=None):
     """Filter a single path based on include and exclude pattern/filters"""
-    is_accepted = True
+    rel_path = path['rel_path']
     # Apply filter(s)
-    if not include_patterns or not len(include_patterns) or len([True for p in include_patterns if p.search(path['rel_path'])]):
-        # An include regex matched relative path
-        log.debug('Including path: {}'.format(path))
-        is_accepted = True
-    else:
-        # log.debug('Skipping path: {}'.format(path))
+    if include_patterns and not any(p.search(rel_path) for p in include_patterns):
         return False # Shortcut; dont examine exclude pattern
-    if len([True for p in exclude_patterns if p.search(path['rel_path'])]):
+    if exclude_patterns and any(p.search(rel_path) for p in exclude_patterns):
         # An exclude regex matched relative path, so don't yield file
         log.debug('Excluding path: {}'.format(path))
         return False # Shortcut
-    return is_accepted
+    return True
 
 def reject_path(*args, **kwargs):
     return not accept_path(*args, **kwargs)
 
+def _merge_regexes(regexes):
+    """
+    Compile regexes into a single search function, or None if there are no
+    regexes. They are merged into one alternation when that is safe, so a
+    path is scanned once instead of once per regex.
+    """
+    if not regexes:
+        return None
+    # HACK Windows compatability
+    regexes = [r.replace('/', r'[\\/]') for r in regexes]
+    if len(regexes) == 1:
+        return re.compile(regexes[0]).search
+    if not any(PathFilter._backref_regex.search(r) for r in regexes):
+        try:
+            return re.compile('|'.join('(?:{})'.format(r) for r in regexes)).search
+        except re.error:
+            # E.g. global inline flags that are only allowed at the start
+            pass
+    patterns = [re.compile(r) for r in regexes]
+    return lambda path: any(p.search(path) for p in patterns)
+
+def _literal_prefix(regex):
+    """
+    The literal text every match of a ^-anchored regex starts with, or None
+    if that can't be told from the regex.
+    """
+    if not regex.startswith('^') or '|' in regex:
+        return None
+    prefix = []
+    i = 1
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\' and i + 1 < len(regex) and not regex[i + 1].isalnum():
+            prefix.append(regex[i + 1])
+            i += 2
+        elif c in '\\.^$*+?{}[]()|':
+            break
+        else:
+            prefix.append(c)
+            i += 1
+    # The last literal is optional if a quantifier allowing zero follows it
+    if i < len(regex) and regex[i] in '*?{':
+        prefix = prefix[:-1]
+    return ''.join(prefix) or None
+
+def stream_copy(fsrc, fdest, buffer_size=COPY_BUFFER_SIZE, buffers=COPY_BUFFERS):
+    """
+    Copy binary file object fsrc to fdest. Returns the number of bytes copied.
+
+    A reader thread fills a pool of fixed-size buffers while the
+    calling thread writes them out, so reading and writing overlap. When all
+    buffers wait to be written the reader blocks, so memory use is
+    buffers * buffer_size however large the file. Errors on either side are
+    raised in the calling thread.
+    """
+    free = queue.Queue()
+    for _ in range(buffers):
+        free.put(bytearray(buffer_size))
+    full = queue.Queue()
+    stop = threading.Event()
+    readinto = getattr(fsrc, 'readinto', None)
+
+    def read():
+        try:
+            while not stop.is_set():
+                buf = free.get()
+                if stop.is_set():
+                    break
+                if readinto is not None:
+                    n = readinto(buf)
+                else:
+                    data = fsrc.read(buffer_size)
+                    n = len(data)
+                    buf[:n] = data
+                if not n:
+                    break
+                full.put((buf, n))
+        except BaseException as e:
+            full.put((None, e))
+            return
+        full.put((None, 0))
+
+    reader = threading.Thread(target=read, name='stream_copy reader', daemon=True)
+    reader.start()
+    copied = 0
+    try:
+        while True:
+            buf, n = full.get()
+            if buf is None:
+                if isinstance(n, BaseException):
+                    raise n
+                break
+            with memoryview(buf) as view:
+                fdest.write(view[:n])
+            copied += n
+            free.put(buf)
+    finally:
+        stop.set()
+        # Wake the reader if it waits for a buffer
+        free.put(bytearray(0))
+        reader.join()
+    return copied
+
+def diff_key(rel_path):
+    """
+    Sort key of a rel_path in diff() order: by path components, so a dir
+    comes right before what is below it. That is the order of a depth first
+    walk visiting the entries of each dir sorted by name.
+    """
+    if os.sep != '/':
+        rel_path = rel_path.replace(os.sep, '/')
+    return tuple(rel_path.split('/'))
+
+def diff_listings(src_paths, dest_paths, compare='quick'):
+    """
+    Merge two listings sorted by diff_key() of rel_path into DiffRecords,
+    see Path.diff(). Reads each listing once, one Path at a time.
+
+    compare: when a file in both is the same:
+        'quick': same size and modification time in whole seconds.
+        'size': same size.
+        'checksum': same size and content hash.
+        A dir and a file with the same rel_path are changed. size, mtime and
+        hash come from the listing when it has them, else from info() and
+        as_file().
+    """
+    if compare not in DIFF_MODES:
+        raise ValueError('compare must be one of {}, not {!r}'.format(DIFF_MODES, compare))
+    src_paths = _sorted_keys(src_paths)
+    dest_paths = _sorted_keys(dest_paths)
+    src_key, src = next(src_paths, (None, None))
+    dest_key, dest = next(dest_paths, (None, None))
+    while src is not None or dest is not None:
+        if dest is None or (src is not None and src_key < dest_key):
+            yield DiffRecord(ADDED, src['rel_path'], src, None)
+            src_key, src = next(src_paths, (None, None))
+        elif src is None or dest_key < src_key:
+            yield DiffRecord(REMOVED, dest['rel_path'], None, dest)
+            dest_key, dest = next(dest_paths, (None, None))
+        else:
+            status = SAME if _is_same(src, dest, compare) else CHANGED
+            yield DiffRecord(status, src['rel_path'], src, dest)
+            src_key, src = next(src_paths, (None, None))
+            dest_key, dest = next(dest_paths, (None, None))
+
+def _sorted_keys(paths):
+    """Yields (diff_key, Path). Raises if paths isn't sorted."""
+    last_key = None
+    for path in paths:
+        key = diff_key(path['rel_path'])
+        if last_key is not None and key <= last_key:
+            raise ValueError('Listing not in diff_key() order at {}'.format(path['rel_path']))
+        last_key = key
+        yield key, path
+
+def _is_same(src, dest, compare):
+    src_is_dir, dest_is_dir = _is_dir(src), _is_dir(dest)
+    if src_is_dir or dest_is_dir:
+        return src_is_dir == dest_is_dir
+    src_size, src_mtime = _size_mtime(src)
+    dest_size, dest_mtime = _size_mtime(dest)
+    if src_size != dest_size:
+        return False
+    if compare == 'quick':
+        return int(src_mtime) == int(dest_mtime)
+    elif compare == 'checksum':
+        return (listed_hash(src) or content_hash(src)) == (listed_hash(dest) or content_hash(dest))
+    return True
+
+def _is_dir(path):
+    if path.get('is_dir') is not None:
+        return path['is_dir']
+    return stat.S_ISDIR(path.info().st_mode)
+
+def _size_mtime(path):
+    """
+    Size and mtime from the listing, or info(). Paths listed with an
+    os.DirEntry are always stat'ed: that is cheap, and their size and mtime
+    keys may come from an index that missed a change.
+    """
+    if path.get('dir_entry') is None and path.get('size') is not None and path.get('mtime') is not None:
+        return path['size'], path['mtime']
+    st = path.info()
+    return st.st_size, st.st_mtime
+
+def listed_hash(path, st=None):
+    """
+    The hash key of a listed Path, or None if there is none or it may be
+    stale. For Paths listed with an os.DirEntry, e.g. from a local index,
+    the size and mtime keys must match what info() says now; st is that
+    stat if already known.
+    """
+    if not path.get('hash'):
+        return None
+    if path.get('dir_entry') is not None:
+        if st is None:
+            st = path.info()
+        if (path.get('size'), path.get('mtime')) != (st.st_size, st.st_mtime):
+            return None
+    return path['hash']
+
+def content_hash(path, algorithm='blake2b', buffer_size=COPY_BUFFER_SIZE):
+    """Hex digest of the content of a Path, read with as_file()"""
+    h = hashlib.new(algorithm)
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with path.as_file('rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+def get_executor():
+    """
+    The executor the async Path methods run blocking operations on. Shared by
+    all Paths and bounded to ASYNC_WORKERS threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=ASYNC_WORKERS, 
+                                                              thread_name_prefix='multipath')
+        return _executor
+
+def set_executor(executor):
+    """Use executor for the async Path methods instead of the default one"""
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+def _take(iterator, n):
+    """Next n items of iterator as a list"""
+    items = []
+    for item in iterator:
+        items.append(item)
+        if len(items) == n:
+            break
+    return items
+
 def ensure_string(path):
     if isinstance(path, str):
         return path
     else:
         return path.path
+
+def is_plain_name(name):
+    """
+    True if name, e.g. from a remote listing, is a single path component:
+    not empty, '.' or '..', and without / or \\. Other names could put a
+    copy outside its destination.
+    """
+    return name not in ('', '.', '..') and '/' not in name and '\\' not in name
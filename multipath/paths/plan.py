@@ -0,0 +1,186 @@
+"""
+Copy plans.
+
+LocalPath.copy(plan=True) lists and compares the trees, and returns what it
+would do as a CopyPlan instead of doing it: an ordered list of mkdir, copy,
+skip and delete operations with their byte and file counts, and an estimate
+of how long they take. A plan can be looked at, checked against limits,
+split into parts and run later with execute(), without listing again.
+"""
+import os, shutil, logging, time, collections
+from multipath.paths import path as base
+
+log = logging.getLogger(__name__)
+
+# Operations of a plan
+MKDIR = 'mkdir'
+COPY = 'copy'
+SKIP = 'skip'
+DELETE = 'delete'
+
+# Assumed copy speed in bytes per second, and cost per file in seconds, for
+# CopyPlan.estimate()
+THROUGHPUT = 100 * 1024 * 1024
+FILE_OVERHEAD = 0.001
+
+# One operation. size is the bytes a copy writes. dest of a copy or mkdir
+# may have an `exists` key telling if it is there already. A delete with a
+# src removes what is in the way of src and comes right before the
+# operation making it; other deletes remove what isn't in the source,
+# deepest first.
+PlanOp = collections.namedtuple('PlanOp', ['op', 'src', 'dest', 'size'])
+
+class CopyPlan(list):
+    """
+    A list of PlanOps in the order they run. See execute().
+
+    Arguments:
+        copy_func, dir_exist_ok: as for LocalPath.copy(), used by execute().
+    """
+    def __init__(self, ops=(), copy_func=shutil.copy2, dir_exist_ok=False):
+        super().__init__(ops)
+        self.copy_func = copy_func
+        self.dir_exist_ok = dir_exist_ok
+
+    @property
+    def bytes(self):
+        """Bytes the copies write"""
+        return sum(op.size or 0 for op in self if op.op == COPY)
+
+    @property
+    def copies(self):
+        """Number of files written, new or over existing ones"""
+        return sum(1 for op in self if op.op == COPY)
+
+    @property
+    def updates(self):
+        """Number of files written over existing ones"""
+        return sum(1 for op in self if op.op == COPY and op.dest.get('exists'))
+
+    @property
+    def skips(self):
+        """Number of files left alone because dest is up to date"""
+        return sum(1 for op in self if op.op == SKIP)
+
+    @property
+    def mkdirs(self):
+        """Number of dirs made; dirs already in dest aren't counted"""
+        return sum(1 for op in self if op.op == MKDIR and not op.dest.get('exists'))
+
+    @property
+    def deletes(self):
+        """Number of paths removed from dest"""
+        return sum(1 for op in self if op.op == DELETE)
+
+    def estimate(self, throughput=THROUGHPUT, file_overhead=FILE_OVERHEAD):
+        """
+        Seconds the plan should take to run: its bytes at throughput bytes
+        per second, plus file_overhead for each operation that touches the
+        file system. Pass the throughput measured for the storage involved;
+        jobs > 1 helps with many small files more than with big ones.
+        """
+        return self.bytes / throughput + (len(self) - self.skips) * file_overhead
+
+    def execute(self, jobs=1):
+        """Run the plan. Returns: CopyResult, as LocalPath.copy() does."""
+        return execute(self, copy_func=self.copy_func, jobs=jobs, dir_exist_ok=self.dir_exist_ok)
+
+    def split(self, parts):
+        """
+        Split into parts plans that can run at the same time, e.g. on
+        different workers. Copies are spread so each part writes about as
+        many bytes. The first part also gets every mkdir, skip and delete,
+        and the copies to where a delete makes way, in their order; other
+        parts make the parent dirs of their files as they go.
+        """
+        first, copies = [], []
+        # Dest paths a delete makes way for
+        replaced = []
+        for op in self:
+            if op.op == DELETE and op.src is not None:
+                replaced.append(op.dest.path)
+            if op.op == COPY and not any(op.dest.path == path or op.dest.path.startswith(path + os.sep)
+                                         for path in replaced):
+                copies.append(op)
+            else:
+                first.append(op)
+        split_plans = [type(self)(copy_func=self.copy_func, dir_exist_ok=True) for _ in range(parts)]
+        totals = [0] * parts
+        totals[0] = sum(op.size or 0 for op in first if op.op == COPY)
+        # Biggest first, each to the part with the fewest bytes so far
+        for op in sorted(copies, key=lambda op: op.size or 0, reverse=True):
+            i = totals.index(min(totals))
+            split_plans[i].append(op)
+            totals[i] += op.size or 0
+        # Keep copies in listing order within a part
+        order = {id(op): i for i, op in enumerate(self)}
+        for split_plan in split_plans:
+            split_plan.sort(key=lambda op: order[id(op)])
+        split_plans[0][:0] = first
+        return split_plans
+
+## Convenience functions
+
+def execute(ops, copy_func=shutil.copy2, jobs=1, dir_exist_ok=False, skip=None):
+    """
+    Run PlanOps, e.g. a CopyPlan, or a generator of them so listing and
+    copying overlap. Copies run on jobs threads with local.copy_files(), and
+    skip is passed to it. Deletes that don't make way for a src run last;
+    a failing one is kept in the result's errors.
+
+    Returns: CopyResult
+    """
+    # local imports this module
+    from multipath.paths import local
+    result = base.CopyResult()
+    # Dest dirs known to exist, so each is only created once
+    made_dirs = set()
+    to_delete = []
+    start = time.monotonic()
+
+    def files_to_copy():
+        for op in ops:
+            if op.op == MKDIR:
+                if not op.dest.get('exists'):
+                    os.makedirs(op.dest.path, exist_ok=dir_exist_ok)
+                made_dirs.add(op.dest.path)
+                result.append((op.src, op.dest))
+            elif op.op == COPY:
+                dest_dirpath = os.path.dirname(op.dest.path)
+                if dest_dirpath not in made_dirs:
+                    os.makedirs(dest_dirpath, exist_ok=True)
+                    made_dirs.add(dest_dirpath)
+                yield (op.src, op.dest)
+            elif op.op == SKIP:
+                result.add_skipped(op.src, op.dest)
+            elif op.src is not None:
+                remove(op.dest)
+                result.add_deleted(op.dest)
+            else:
+                to_delete.append(op.dest)
+
+    local.copy_files(files_to_copy(), copy_func=copy_func, jobs=jobs, result=result, skip=skip)
+
+    for dest in to_delete:
+        try:
+            remove(dest, recursive=False)
+        except OSError as e:
+            # E.g. a dir still holding excluded paths
+            log.warn('Could not delete {}: {}'.format(dest.path, e))
+            result.errors.append((None, dest, e))
+        else:
+            result.add_deleted(dest)
+
+    log.debug('Plan copied {} files, updated {}, skipped {}, deleted {} in {:.3f}s'.format(
+        result.copied, result.updated, result.skipped, result.deleted, time.monotonic() - start))
+    return result
+
+def remove(path, recursive=True):
+    """Remove a listed LocalPath. Symlinks are removed, not followed."""
+    if path['is_dir'] and not os.path.islink(path.path):
+        if recursive:
+            shutil.rmtree(path.path)
+        else:
+            os.rmdir(path.path)
+    else:
+        os.remove(path.path)
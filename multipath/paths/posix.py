@@ -5,4 +5,6 @@ class PosixPath(local.LocalPath):
 	pass
 
 def is_posix_path(path):
-	return str(path).startswith('/') or str(path).startswith('./') or ( not parse.urlparse(str(path)).scheme and '/' in str(path) )
+	path = str(path)
+	# urlparse() is slow, and there is no scheme without a :
+	return path.startswith('/') or path.startswith('./') or ( '/' in path and (':' not in path or not parse.urlparse(path).scheme) )
@@ -1,133 +1,784 @@
-"""
-"""
-import os, logging, re, subprocess
-from multipath.paths import path as base, cygwin
-
-log = logging.getLogger(__name__)
-
-hostname_regex = "(?!-)[A-Z\d-]{1,63}(?<!-)"
-
-class RsyncPath(base.Path):
-    """
-    Implements rsync as a Path.
-    """
-    
-    def __init__(self, path, **kwargs):
-        # Decide on canonical path
-        self._is_rsync_path = is_rsync_path(path)
-        if not self._is_rsync_path and os.path.isabs(path):
-            # This is not clearly an rsync path. Assume it's local
-            self._path = path
-            self._abs_path = path
-            self._rel_path = os.path.relpath(path, start=os.path.curdir)
-        elif not self._is_rsync_path and not os.path.isabs(path):
-            self._abs_path = os.path.abspath(path)
-            self._rel_path = path
-        elif self._is_rsync_path:
-            # Looks like a full rsync path
-            self._path = path
-            self._abs_path = path
-        super().__init__(path=self._abs_path, **kwargs)
-    
-    def copy(self, dest, recursive=True, makedirs=True, dir_exist_ok=True, mirror=False, **kwargs):
-        """
-        Copy files via rsync.
-        
-        Arguments:
-            mirror: Runs rsync with `-az --delete` options.
-        """
-        log.debug('rsync transport: {} -> {} kwargs={}'.format(self, dest, kwargs))
-        
-        # TODO This will fail if dest is not on the local file system
-        # Make destination dirs
-        if makedirs:
-            # FIXME there's no exist_ok in python < 3
-            try:
-                os.makedirs(dest, exist_ok=dir_exist_ok)
-            except Exception as e:
-                log.warn(e)
-            
-        # Passing **kwargs leads to things like --os_username ending up on command line
-        # return run_rsync(src, dest, recursive=recursive, **kwargs)
-        return run_rsync(self, dest, recursive=recursive, mirror=mirror)
-
-## Convenience functions
-
-def rsync(src, dest, mirror=False, **kwargs):
-    """Build rsync command line"""
-    args = ['rsync']
-    
-    # Rewrite paths on windows to /cygdrive/ style. Needed by cwrsync.
-    if os.name == 'nt':
-        if not src._is_rsync_path:
-            src = cygwin.to_cygdrive_path(src)
-        if not dest._is_rsync_path:
-            dest = cygwin.to_cygdrive_path(dest)
-
-    # Meta arguments
-    if mirror:
-        args.append('-az')
-        args.append('--delete')
-    # Basic arguments
-    for k, v in kwargs.items():
-        # Real rync arguments 
-        if type(v) == type(True):
-            if v and len(k) == 1:
-                args.append('-{}'.format(k))
-            elif v:
-                args.append('--' + k)
-            else:
-                args.append('--no-' + k)
-        elif v and len(k) == 1:
-            args.append('-{}'.format(k))
-            args.append(v)
-        elif v:
-            args.append('--{}={}'.format(k, v))
-        else:
-            args.append('--{}'.format(k))
-    args.append(src.abs_path)
-    args.append(dest.abs_path)
-    return args
-
-def run_rsync(*args, **kwargs):
-    """Execute rsync subprocess"""
-    cmd = rsync(*args, **kwargs)
-    r = subprocess.check_call(cmd, stderr=subprocess.STDOUT)
-    return r
-
-## Path information functions
-
-def is_rsync_path(path):
-    return is_rsync_uri(path) or is_rsync_shell(path) or is_rsync_daemon(path)
-
-def is_rsync_uri(path):
-    """Is this a Path style rsync path?"""
-    return str(path).lower().startswith('rsync://')
-
-def is_rsync_daemon(path):
-    """
-    Access via rsync daemon:
-      Pull: rsync [OPTION...] [USER@]HOST::SRC... [DEST]
-            rsync [OPTION...] rsync://[USER@]HOST[:PORT]/SRC... [DEST]
-      Push: rsync [OPTION...] SRC... [USER@]HOST::DEST
-            rsync [OPTION...] SRC... rsync://[USER@]HOST[:PORT]/DEST
-    """
-    if re.match('[a-zA-Z0-9]+@[a-zA-Z0-9\.]+::/.*', str(path)):
-        return True
-    elif re.match('[a-zA-Z0-9\.]+::/.*', str(path)):
-        return True
-    else:
-        return False
-
-def is_rsync_shell(path):
-    if re.match('[a-zA-Z0-9]+@[a-zA-Z0-9\.]+:/.*', str(path)):
-        # Access via remote shell with password
-        return True
-    elif re.match('[a-zA-Z0-9\.]+:/.*', str(path)):
-        # Access via remote shell with no password
-        return True
-    else:
-        return False
-
-
-
+"""
+"""
+import os, logging, re, subprocess, asyncio, functools, heapq, threading, time, collections, stat, tempfile
+from multipath.paths import path as base, cygwin, local, entry
+
+log = logging.getLogger(__name__)
+
+hostname_regex = r"(?!-)[A-Z\d-]{1,63}(?<!-)"
+# [USER@]HOST::/SRC
+rsync_daemon_regex = re.compile(r'(?:[a-zA-Z0-9]+@)?[a-zA-Z0-9\.]+::/')
+# [USER@]HOST:/SRC
+rsync_shell_regex = re.compile(r'(?:[a-zA-Z0-9]+@)?[a-zA-Z0-9\.]+:/')
+# Regex without special characters, optionally anchored with ^. See filter_rules()
+literal_regex = re.compile(r'^(\^?)((?:[^.^$*+?{}\[\]\\|()]|\\[^A-Za-z0-9])+)$')
+# Regexes that match every path
+match_all_regexes = ('', '.*')
+# --info=progress2 line, e.g. "  1,238,099 100%  146.38MB/s  0:00:00 (xfr#5, to-chk=0/6)"
+progress_regex = re.compile(r'^\s*([\d,]+)\s+(\d+)%\s+(\S+)\s+(\d+:\d\d:\d\d)'
+                            r'(?:\s+\(xfr#(\d+), (?:to|ir)-chk=(\d+)/(\d+)\))?')
+# --stats lines, by RsyncResult attribute
+stats_regexes = [
+    ('files_transferred', re.compile(r'^Number of (?:regular )?files transferred: ([\d,]+)')),
+    ('total_size', re.compile(r'^Total file size: ([\d,]+) bytes')),
+    ('total_transferred_size', re.compile(r'^Total transferred file size: ([\d,]+) bytes')),
+    ('literal_bytes', re.compile(r'^Literal data: ([\d,]+) bytes')),
+    ('matched_bytes', re.compile(r'^Matched data: ([\d,]+) bytes')),
+    ('bytes_sent', re.compile(r'^Total bytes sent: ([\d,]+)')),
+    ('bytes_received', re.compile(r'^Total bytes received: ([\d,]+)')),
+]
+speedup_regex = re.compile(r'^total size is [\d,]+\s+speedup is ([\d.]+)')
+# --list-only line, e.g. "-rw-r--r--          1,024 2020/01/31 12:00:00 dir/file"
+list_line_regex = re.compile(r'^([-bcdlps])([-rwxsStT]{9})\S*\s+([\d,]+) (\d{4}/\d\d/\d\d \d\d:\d\d:\d\d) (.*)$')
+# rsync prints unprintable bytes in names as \#ooo
+list_escape_regex = re.compile(rb'\\#([0-7]{3})')
+# File type bits by first letter of an rsync --list-only line
+list_types = {'-': stat.S_IFREG, 'd': stat.S_IFDIR, 'l': stat.S_IFLNK, 'p': stat.S_IFIFO,
+              's': stat.S_IFSOCK, 'c': stat.S_IFCHR, 'b': stat.S_IFBLK}
+
+class RsyncPath(base.Path):
+    """
+    Implements rsync as a Path.
+    """
+    
+    def __init__(self, path, **kwargs):
+        # Decide on canonical path. Relative local paths are made absolute
+        # now, so a later chdir doesn't change what they point at. Absolute
+        # ones are made relative when asked for, as that needs the current dir.
+        self._is_rsync_path = is_rsync_path(path)
+        if not self._is_rsync_path and os.path.isabs(path):
+            # This is not clearly an rsync path. Assume it's local
+            self._abs_path = path
+        elif not self._is_rsync_path and not os.path.isabs(path):
+            self._abs_path = os.path.abspath(path)
+            self._rel_path = path
+        elif self._is_rsync_path:
+            # Looks like a full rsync path
+            self._abs_path = path
+            self._rel_path = path
+        super().__init__(path=self._abs_path, **kwargs)
+
+    @property
+    def path(self):
+        return self.abs_path
+    @path.setter
+    def path(self, value):
+        raise Exception('Path attributes are immutable')
+    @path.deleter
+    def path(self):
+        raise Exception('Path attributes are immutable')
+
+    def _make_abs_path(self):
+        return os.path.abspath(self._init_path)
+
+    def _make_rel_path(self):
+        return os.path.relpath(self._init_path, start=os.path.curdir)
+
+    def list(self, include=['.*'], exclude=[], recursive=True, files=True, dirs=True, **kwargs):
+        """
+        List files and directories with `rsync --list-only`, which works for
+        local and remote paths. Output is parsed while rsync runs, so paths are
+        yielded as they come.
+
+        Filters are as for LocalPath.list(). Those filter_rules() can
+        translate are passed on to rsync, so it doesn't send what they
+        exclude; all are applied here too.
+
+        Yields RsyncPaths with the keys filename, rel_path (/ separated),
+        is_dir, is_file, size, mtime, mode and link_target (for symlinks).
+        """
+        path_filter = base.PathFilter(include, exclude)
+        prefix = self._transfer_prefix()
+        filters = filter_rules(include, exclude, prefix=prefix) or []
+        if not recursive:
+            filters.append('- /{}*/*'.format(prefix))
+        src = str(self.path)
+        for name, is_dir, size, mtime, mode, link_target in run_list(self, filters=filters):
+            if prefix:
+                if name == prefix[:-1]:
+                    if is_dir:
+                        # The dir being listed
+                        continue
+                    rel_path = name
+                else:
+                    rel_path = name[len(prefix):]
+            elif name == '.':
+                continue
+            else:
+                rel_path = name
+            if (is_dir and not dirs) or (not is_dir and not files):
+                continue
+            if not path_filter.accept(rel_path):
+                continue
+            abs_path = src if rel_path == name and prefix else src.rstrip('/') + '/' + rel_path
+            yield type(self)(abs_path, root=self, filename=rel_path.rsplit('/', 1)[-1], rel_path=rel_path,
+                             is_dir=is_dir, is_file=not is_dir, size=size, mtime=mtime, mode=mode,
+                             link_target=link_target)
+
+    def info(self, symlinks=True):
+        """
+        Like os.stat(), from `rsync --list-only`. Only st_mode, st_size and
+        the times are known. Paths from list() answer from what was listed.
+        rsync lists symlinks as such, so symlinks=True isn't supported for them.
+        """
+        if 'mode' in self:
+            mode, size, mtime = self['mode'], self['size'], self['mtime']
+        else:
+            listed = next(run_list(self, recursive=False), None)
+            if listed is None:
+                raise FileNotFoundError(str(self.path))
+            name, is_dir, size, mtime, mode, link_target = listed
+        return os.stat_result((mode, 0, 0, 1, 0, 0, size, mtime, mtime, mtime))
+
+    def _transfer_prefix(self):
+        """
+        What rsync puts before paths relative to this path in listings and in
+        dest: the dir name and a /, or nothing if this path ends with /.
+        """
+        src = str(self.path)
+        if src.endswith(('/', os.path.sep)):
+            return ''
+        return os.path.basename(src.rstrip('/' + os.path.sep)) + '/'
+    
+    def copy(self, dest, recursive=True, makedirs=True, dir_exist_ok=True, mirror=False,
+             include=None, exclude=None, files=None, parallel=1, balance='size', progress=None, **kwargs):
+        """
+        Copy files via rsync.
+        
+        Arguments:
+            include, exclude: regexes, as LocalPath.list() takes them. Literal
+                excludes become rsync --filter rules. Other filters need a local
+                source, which is then listed here and the paths it accepts are
+                passed to rsync with --files-from.
+            files: Paths to copy, relative to this path, or Paths and entries
+                list() yielded for it. All of them are copied by one rsync,
+                reading them from stdin with --files-from, to the same relative
+                paths in dest. See also copy_batch().
+            parallel: Number of rsync processes to run at once. The source is
+                listed and split into this many shards, each copied by its own
+                rsync with --files-from. Returns an RsyncResult then.
+            balance: What shards are balanced by: 'size' or file 'count'.
+            progress: Called with an RsyncProgress for every progress update
+                rsync prints. With parallel, updates come from several threads.
+            mirror: Runs rsync with `-az --delete` options.
+
+        Returns an RsyncResult with the statistics of the transfer.
+        """
+        log.debug('rsync transport: {} -> {} kwargs={}'.format(self, dest, kwargs))
+        if not isinstance(dest, base.Path):
+            dest = RsyncPath(dest)
+        
+        # TODO This will fail if dest is not on the local file system
+        # Make destination dirs
+        if makedirs:
+            # FIXME there's no exist_ok in python < 3
+            try:
+                os.makedirs(str(dest), exist_ok=dir_exist_ok)
+            except Exception as e:
+                log.warn(e)
+            
+        if files is not None:
+            rel_paths = (self._relative(f) for f in files)
+            return run_rsync(self, dest, mirror=mirror, files=rel_paths, progress=progress)
+
+        if parallel > 1:
+            if mirror:
+                # Each rsync would delete what the others copy
+                raise ValueError('mirror cannot be combined with parallel')
+            parent, listing = self._list_for_files_from(include, exclude, recursive)
+            if balance == 'size':
+                weight = lambda rel_path, p: p.info().st_size if p['is_file'] else 0
+            elif balance == 'count':
+                weight = lambda rel_path, p: 1 if p['is_file'] else 0
+            else:
+                raise ValueError('balance must be size or count, not {}'.format(balance))
+            shards = split_shards(listing, parallel, weight=lambda item: weight(*item))
+            return run_rsync_parallel(parent, dest, [[rel_path for rel_path, p in shard] for shard in shards],
+                                      progress=progress)
+
+        filters = None
+        if include or exclude:
+            # rsync puts the source dir itself in dest, unless it ends with /
+            filters = filter_rules(include, exclude, prefix=self._transfer_prefix())
+            if filters is None:
+                # Filter here and hand rsync the list
+                parent, listing = self._list_for_files_from(include, exclude, recursive)
+                return run_rsync(parent, dest, mirror=mirror, files=(rel_path for rel_path, p in listing),
+                                 progress=progress)
+
+        # Passing **kwargs leads to things like --os_username ending up on command line
+        # return run_rsync(src, dest, recursive=recursive, **kwargs)
+        return run_rsync(self, dest, recursive=recursive, mirror=mirror, filters=filters, progress=progress)
+
+    def _list_for_files_from(self, include, exclude, recursive):
+        """
+        List this path for --files-from. Returns the source to give rsync and
+        an iterator of (rel_path, Path) tuples. Paths are relative to the
+        parent dir, unless this path ends with /, so that the dir itself still
+        ends up in dest.
+        """
+        src = str(self.path)
+        # Remote paths are listed by rsync, local ones directly
+        lister = self if self._is_rsync_path else local.LocalPath(src)
+        listing = lister.list(include=include or ['.*'], exclude=exclude or [], recursive=recursive)
+        prefix = self._transfer_prefix()
+        if not prefix:
+            return self, ((to_rsync_path(p['rel_path']), p) for p in listing)
+        parent = os.path.dirname(src.rstrip('/' + os.path.sep))
+        return (RsyncPath(parent or os.path.sep),
+                ((prefix + to_rsync_path(p['rel_path']), p) for p in listing))
+
+    def _relative(self, source):
+        """Path of source, relative to this path, as rsync --files-from wants it"""
+        root, rel_path = split_source(source)
+        if root is None and os.path.isabs(rel_path):
+            rel_path = os.path.relpath(rel_path, self.abs_path)
+        return to_rsync_path(rel_path)
+
+    async def acopy(self, dest, recursive=True, makedirs=True, dir_exist_ok=True, mirror=False,
+                    include=None, exclude=None, files=None, parallel=1, balance='size', progress=None,
+                    **kwargs):
+        """
+        Async version of copy(), with the same arguments. rsync runs as an
+        asyncio subprocess, so no thread is tied up while it runs. With
+        makedirs, a local dest is created first; failing to create it raises.
+        Paths for --files-from are listed on the executor before rsync
+        starts. With parallel, copy() runs on the executor, as its shards
+        need threads anyway.
+        """
+        log.debug('rsync transport: {} -> {} kwargs={}'.format(self, dest, kwargs))
+        if not isinstance(dest, base.Path):
+            dest = RsyncPath(dest)
+        dest_str = base.ensure_string(dest)
+        loop = asyncio.get_running_loop()
+        executor = base.get_executor()
+        if makedirs and not is_rsync_path(dest_str):
+            await loop.run_in_executor(executor, functools.partial(os.makedirs, dest_str, exist_ok=dir_exist_ok))
+
+        if files is not None:
+            rel_paths = await loop.run_in_executor(executor, lambda: [self._relative(f) for f in files])
+            return await arun_rsync(self, dest, mirror=mirror, files=rel_paths, progress=progress)
+
+        if parallel > 1:
+            return await loop.run_in_executor(executor, functools.partial(
+                self.copy, dest, recursive=recursive, makedirs=False, mirror=mirror, include=include,
+                exclude=exclude, parallel=parallel, balance=balance, progress=progress))
+
+        filters = None
+        if include or exclude:
+            filters = filter_rules(include, exclude, prefix=self._transfer_prefix())
+            if filters is None:
+                def list_files():
+                    parent, listing = self._list_for_files_from(include, exclude, recursive)
+                    return parent, [rel_path for rel_path, p in listing]
+                parent, rel_paths = await loop.run_in_executor(executor, list_files)
+                return await arun_rsync(parent, dest, mirror=mirror, files=rel_paths, progress=progress)
+
+        return await arun_rsync(self, dest, recursive=recursive, mirror=mirror, filters=filters, progress=progress)
+
+# A progress update of rsync --info=progress2. to_check and total count files
+# rsync still has to check out of all it knows of; they and transfers are None
+# until rsync prints them.
+RsyncProgress = collections.namedtuple('RsyncProgress',
+    'bytes percent rate elapsed transfers to_check total')
+
+class RsyncResult(object):
+    """
+    Outcome of an rsync run, or of several combined with combine().
+
+    Attributes:
+        cmd: command line, or list of command lines for combined results.
+        returncode: exit code, or the first nonzero one of combined results.
+        shards: the results that were combined.
+        output: lines rsync printed, apart from progress updates.
+        elapsed: wall clock seconds the run took.
+        files_transferred, total_size, total_transferred_size, literal_bytes,
+        matched_bytes, bytes_sent, bytes_received, speedup: from rsync --stats,
+            or None if rsync didn't print them.
+    """
+    stats = [name for name, regex in stats_regexes]
+
+    def __init__(self, cmd=None, returncode=0):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.shards = []
+        self.output = []
+        self.elapsed = None
+        self.speedup = None
+        for name in self.stats:
+            setattr(self, name, None)
+
+    def __repr__(self):
+        return '<{} returncode={} files_transferred={} literal_bytes={} elapsed={}>'.format(
+            type(self).__name__, self.returncode, self.files_transferred, self.literal_bytes, self.elapsed)
+
+    def parse_line(self, line):
+        """Take in a line of rsync output. Returns an RsyncProgress for progress lines."""
+        m = progress_regex.match(line)
+        if m:
+            transfers, to_check, total = (int(g) if g else None for g in m.group(5, 6, 7))
+            return RsyncProgress(int(m.group(1).replace(',', '')), int(m.group(2)), m.group(3),
+                                 m.group(4), transfers, to_check, total)
+        self.output.append(line)
+        for name, regex in stats_regexes:
+            m = regex.match(line)
+            if m:
+                setattr(self, name, int(m.group(1).replace(',', '')))
+                return None
+        m = speedup_regex.match(line)
+        if m:
+            self.speedup = float(m.group(1))
+        return None
+
+    @classmethod
+    def combine(cls, results):
+        """
+        Combine the results of rsyncs that ran at the same time. Statistics
+        are summed, elapsed is the longest run and speedup is worked out again.
+        """
+        result = cls([r.cmd for r in results])
+        result.shards = list(results)
+        result.returncode = next((r.returncode for r in results if r.returncode), 0)
+        for name in cls.stats:
+            values = [getattr(r, name) for r in results if getattr(r, name) is not None]
+            setattr(result, name, sum(values) if values else None)
+        elapsed = [r.elapsed for r in results if r.elapsed is not None]
+        result.elapsed = max(elapsed) if elapsed else None
+        if result.total_size is not None and result.bytes_sent is not None and result.bytes_received is not None:
+            sent = result.bytes_sent + result.bytes_received
+            result.speedup = round(result.total_size / sent, 2) if sent else None
+        return result
+
+class RsyncError(subprocess.CalledProcessError):
+    """Raised when rsync fails. result is the RsyncResult of the run."""
+    def __init__(self, result, output=None):
+        if output is None:
+            output = '\n'.join(result.output)
+        super().__init__(result.returncode, result.cmd, output=output)
+        self.result = result
+
+## Convenience functions
+
+def copy_batch(sources, dest, **kwargs):
+    """
+    Copy many paths with one rsync per source root, instead of one per path.
+
+    Arguments:
+        sources: Paths or entries from list(), or path strings. Listed paths
+            keep their place below the root they were listed from; other
+            local paths are copied into dest by name. Remote sources, e.g.
+            host:/path or rsync://host/module/path, are copied one rsync each,
+            as given.
+        dest: destination dir.
+        kwargs: passed on to RsyncPath.copy().
+    Returns: list of what each RsyncPath.copy() returned, batches first.
+    """
+    batches, remote = batch_sources(sources)
+    return ([RsyncPath(root).copy(dest, files=rel_paths, **kwargs)
+             for root, rel_paths in batches.items()] +
+            [RsyncPath(source).copy(dest, **kwargs) for source in remote])
+
+def batch_sources(sources):
+    """
+    Group sources for copy_batch(). Returns a dict of root to rsync style
+    paths relative to it, and a list of remote source strings.
+    """
+    # multipath imports this module
+    from multipath import multipath
+    batches = {}
+    remote = []
+    for source in sources:
+        root, rel_path = split_source(source)
+        if root is None:
+            if multipath.classify(rel_path) is RsyncPath:
+                remote.append(rel_path)
+                continue
+            root, rel_path = os.path.split(os.path.abspath(rel_path))
+        batches.setdefault(root, []).append(to_rsync_path(rel_path))
+    return batches, remote
+
+def split_source(source):
+    """
+    Returns (root, rel_path) for a Path or entry that list() yielded, and
+    (None, path) for anything else.
+    """
+    if isinstance(source, entry.Entry):
+        return source.dir.root.abs_path, source.rel_path
+    elif isinstance(source, base.Path) and source.get('root') is not None:
+        return str(source['root']), source['rel_path']
+    else:
+        return None, str(source)
+
+def to_rsync_path(path):
+    """rsync wants / as separator"""
+    if os.path.sep != '/':
+        path = path.replace(os.path.sep, '/')
+    return path
+
+def filter_rules(include=None, exclude=None, prefix=''):
+    """
+    Translate include and exclude regexes into rsync --filter rules.
+
+    Only what rsync can do exactly is translated: includes that match
+    everything, and excludes that are plain strings, optionally anchored with
+    ^. Returns None when the filters can't be translated.
+
+    Arguments:
+        prefix: what rsync puts before paths relative to the source dir, i.e.
+            the source dir's name and a / unless the source ends with /.
+    """
+    if isinstance(include, str):
+        include = [include]
+    if isinstance(exclude, str):
+        exclude = [exclude]
+    if include and not any(r in match_all_regexes for r in include):
+        return None
+    rules = []
+    for regex in exclude or []:
+        m = literal_regex.match(regex)
+        if not m:
+            return None
+        literal = re.sub(r'\\(.)', r'\1', m.group(2))
+        if any(c in literal + prefix for c in '*?[\\'):
+            # Would need escaping for rsync
+            return None
+        if m.group(1):
+            rules.append('- /{}{}**'.format(prefix, literal))
+        else:
+            rules.append('- /{}**{}**'.format(prefix, literal))
+    return rules
+
+def rsync(src, dest, mirror=False, filters=None, **kwargs):
+    """Build rsync command line. dest may be None, e.g. for --list-only."""
+    args = ['rsync']
+    
+    # Rewrite paths on windows to /cygdrive/ style. Needed by cwrsync.
+    if os.name == 'nt':
+        if not src._is_rsync_path:
+            src = cygwin.to_cygdrive_path(src)
+        if dest is not None and not dest._is_rsync_path:
+            dest = cygwin.to_cygdrive_path(dest)
+
+    # Meta arguments
+    if mirror:
+        args.append('-az')
+        args.append('--delete')
+    # Basic arguments
+    for k, v in kwargs.items():
+        # Real rync arguments 
+        if type(v) == type(True):
+            if v and len(k) == 1:
+                args.append('-{}'.format(k))
+            elif v:
+                args.append('--' + k)
+            else:
+                args.append('--no-' + k)
+        elif v and len(k) == 1:
+            args.append('-{}'.format(k))
+            args.append(v)
+        elif v:
+            args.append('--{}={}'.format(k, v))
+        else:
+            args.append('--{}'.format(k))
+    for rule in filters or []:
+        args.append('--filter=' + rule)
+    args.append(src.abs_path)
+    if dest is not None:
+        args.append(dest.abs_path)
+    return args
+
+def run_rsync(*args, files=None, progress=None, **kwargs):
+    """
+    Execute rsync subprocess. Returns an RsyncResult and raises RsyncError if
+    rsync fails.
+
+    Arguments:
+        files: iterable of paths relative to the source. They are streamed to
+            rsync's stdin for --files-from while it runs.
+        progress: callback for RsyncProgress updates. Asks rsync for them.
+    """
+    if files is not None:
+        kwargs.update({'files-from': '-', 'from0': True})
+    cmd = rsync(*args, **_output_options(kwargs, progress))
+    result = _run(cmd, files, progress)
+    if result.returncode:
+        raise RsyncError(result)
+    return result
+
+def run_list(src, recursive=True, filters=None):
+    """
+    Run `rsync --list-only` on src. Yields what parse_list_line() makes of
+    each line while rsync runs. Raises RsyncError if rsync fails.
+
+    Arguments:
+        recursive: list everything below src. Otherwise rsync lists src
+            itself, or the contents of src if it ends with /.
+    """
+    cmd = rsync(src, None, filters=filters, **{'list-only': True, 'recursive': recursive})
+    log.debug('Executing: {}'.format(cmd))
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr)
+        completed = False
+        try:
+            for line in proc.stdout:
+                listed = parse_list_line(line)
+                if listed is not None:
+                    yield listed
+            completed = True
+        finally:
+            proc.stdout.close()
+            if not completed:
+                # The caller stopped listing early
+                proc.kill()
+            returncode = proc.wait()
+        if completed and returncode:
+            result = RsyncResult(cmd, returncode)
+            stderr.seek(0)
+            result.output = stderr.read().decode('utf-8', 'replace').splitlines()
+            raise RsyncError(result)
+
+def parse_list_line(line):
+    """
+    Parse a line of `rsync --list-only` output, as bytes. Returns (name,
+    is_dir, size, mtime, mode, link_target), or None if it isn't a listing.
+    """
+    m = list_line_regex.match(os.fsdecode(line.rstrip(b'\r\n')))
+    if not m:
+        return None
+    type_char, perms, size, date, name = m.groups()
+    if '\\#' in name:
+        name = os.fsdecode(list_escape_regex.sub(lambda m: bytes([int(m.group(1), 8)]), os.fsencode(name)))
+    link_target = None
+    if type_char == 'l' and ' -> ' in name:
+        name, link_target = name.split(' -> ', 1)
+    mode = list_types[type_char] | _perm_bits(perms)
+    mtime = time.mktime(time.strptime(date, '%Y/%m/%d %H:%M:%S'))
+    return name, type_char == 'd', int(size.replace(',', '')), mtime, mode, link_target
+
+def _perm_bits(perms):
+    """Permission bits of a ls style string like rwxr-xr-x"""
+    bits = 0
+    for i, c in enumerate(perms):
+        if c not in '-ST':
+            bits |= 1 << (8 - i)
+    if perms[2] in 'sS':
+        bits |= stat.S_ISUID
+    if perms[5] in 'sS':
+        bits |= stat.S_ISGID
+    if perms[8] in 'tT':
+        bits |= stat.S_ISVTX
+    return bits
+
+def run_rsync_parallel(src, dest, shards, progress=None, **kwargs):
+    """
+    Run one rsync per shard at once, each reading its shard of paths
+    relative to src with --files-from. progress is called from the thread
+    of each shard.
+
+    Returns an RsyncResult combining the results of all shards. Raises
+    RsyncError once all have finished if any of them failed, or the
+    exception a shard couldn't run rsync with, e.g. FileNotFoundError if
+    it isn't installed.
+    """
+    kwargs.update({'files-from': '-', 'from0': True})
+    cmd = rsync(src, dest, **_output_options(kwargs, progress))
+    results = [None] * len(shards)
+    errors = [None] * len(shards)
+    def run(i):
+        try:
+            results[i] = _run(cmd, shards[i], progress)
+        except BaseException as e:
+            errors[i] = e
+    threads = [threading.Thread(target=run, args=(i,), daemon=True)
+               for i, shard in enumerate(shards) if shard]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error is not None:
+            raise error
+    result = RsyncResult.combine([r for r in results if r is not None])
+    if result.returncode:
+        raise RsyncError(result)
+    return result
+
+def _output_options(kwargs, progress):
+    """Add the options for RsyncResult and progress callbacks to rsync() kwargs"""
+    kwargs.setdefault('stats', True)
+    if progress is not None:
+        kwargs.setdefault('info', 'progress2')
+    return kwargs
+
+def _run(cmd, files=None, progress=None):
+    """
+    Run rsync, feeding it files and parsing its output. Returns an
+    RsyncResult. If iterating files raises, rsync is killed and the
+    exception raised here.
+    """
+    log.debug('Executing: {}'.format(cmd))
+    result = RsyncResult(cmd)
+    start = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL if files is None else subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    feeder = None
+    feed_errors = []
+    if files is not None:
+        def feed():
+            try:
+                _feed_files(proc.stdin, files, abort=proc.kill)
+            except BaseException as e:
+                feed_errors.append(e)
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+    parser = _OutputParser(result, progress)
+    for chunk in iter(functools.partial(proc.stdout.read1, 65536), b''):
+        parser.feed(chunk)
+    parser.close()
+    if feeder is not None:
+        feeder.join()
+    result.returncode = proc.wait()
+    result.elapsed = time.monotonic() - start
+    if feed_errors:
+        raise feed_errors[0]
+    return result
+
+class _OutputParser(object):
+    """Splits rsync output into lines for RsyncResult.parse_line(). Progress updates end in \\r."""
+    _line_end_regex = re.compile(rb'[\r\n]')
+
+    def __init__(self, result, progress=None):
+        self.result = result
+        self.progress = progress
+        self.rest = b''
+
+    def feed(self, data):
+        lines = self._line_end_regex.split(self.rest + data)
+        self.rest = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self):
+        if self.rest:
+            self._line(self.rest)
+        self.rest = b''
+
+    def _line(self, line):
+        line = line.decode('utf-8', 'replace').rstrip()
+        if not line:
+            return
+        log.debug('rsync: %s', line)
+        update = self.result.parse_line(line)
+        if update is not None and self.progress is not None:
+            self.progress(update)
+
+def _feed_files(stdin, files, abort=None):
+    """
+    Write files to stdin for --files-from --from0, and close it. If files
+    raises, abort() is called before stdin is closed, so rsync doesn't go on
+    with part of the list, and the exception is raised.
+    """
+    try:
+        for rel_path in files:
+            stdin.write(os.fsencode(rel_path) + b'\0')
+    except BrokenPipeError:
+        # rsync quit early; its return code says why
+        pass
+    except BaseException:
+        if abort is not None:
+            abort()
+        raise
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+def split_shards(items, n, weight=None):
+    """
+    Split items into n lists with about equal total weight. Heaviest items
+    are placed first, each in the lightest shard so far.
+
+    Arguments:
+        weight: function returning the weight of an item. Defaults to 1.
+    """
+    if weight is None:
+        weight = lambda item: 1
+    shards = [[] for _ in range(n)]
+    heap = [(0, i) for i in range(n)]
+    for w, i, item in sorted(((weight(item), i, item) for i, item in enumerate(items)),
+                             key=lambda t: (-t[0], t[1])):
+        load, shard = heapq.heappop(heap)
+        shards[shard].append(item)
+        heapq.heappush(heap, (load + w, shard))
+    return shards
+
+async def arun_rsync(*args, files=None, progress=None, **kwargs):
+    """
+    Execute rsync as an asyncio subprocess. Returns and raises like
+    run_rsync(); files is a list of paths for --files-from.
+    """
+    if files is not None:
+        kwargs.update({'files-from': '-', 'from0': True})
+    cmd = rsync(*args, **_output_options(kwargs, progress))
+    log.debug('Executing: {}'.format(cmd))
+    result = RsyncResult(cmd)
+    start = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(*cmd,
+                                                stdin=asyncio.subprocess.DEVNULL if files is None else asyncio.subprocess.PIPE,
+                                                stdout=asyncio.subprocess.PIPE, 
+                                                stderr=asyncio.subprocess.STDOUT)
+    feeder = None
+    if files is not None:
+        feeder = asyncio.ensure_future(_afeed_files(proc.stdin, files))
+    parser = _OutputParser(result, progress)
+    while True:
+        chunk = await proc.stdout.read(65536)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    parser.close()
+    if feeder is not None:
+        await feeder
+    result.returncode = await proc.wait()
+    result.elapsed = time.monotonic() - start
+    if result.returncode:
+        raise RsyncError(result)
+    return result
+
+async def _afeed_files(stdin, files):
+    """Write a list of files to stdin for --files-from --from0, and close it"""
+    try:
+        stdin.write(b''.join(os.fsencode(rel_path) + b'\0' for rel_path in files))
+        await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # rsync quit early; its return code says why
+        pass
+    finally:
+        stdin.close()
+
+## Path information functions
+
+def is_rsync_path(path):
+    return is_rsync_uri(path) or is_rsync_shell(path) or is_rsync_daemon(path)
+
+def is_rsync_uri(path):
+    """Is this a Path style rsync path?"""
+    return str(path).lower().startswith('rsync://')
+
+def is_rsync_daemon(path):
+    """
+    Access via rsync daemon:
+      Pull: rsync [OPTION...] [USER@]HOST::SRC... [DEST]
+            rsync [OPTION...] rsync://[USER@]HOST[:PORT]/SRC... [DEST]
+      Push: rsync [OPTION...] SRC... [USER@]HOST::DEST
+            rsync [OPTION...] SRC... rsync://[USER@]HOST[:PORT]/DEST
+    """
+    return rsync_daemon_regex.match(str(path)) is not None
+
+def is_rsync_shell(path):
+    """Access via remote shell, with or without user name"""
+    return rsync_shell_regex.match(str(path)) is not None
+
+
+
@@ -1,18 +1,33 @@
 """
 Windows Server Message Block. Paths are UNCs.
 """
-from multipath.paths import path
+import os, subprocess, logging
+from multipath.paths import path, local
+
+log = logging.getLogger(__name__)
 
 class SmbPath(path.Path):
-    def copy(self, dest, metadata=True,
-            include=None, exclude=None, recursive=True,
-            delete=False, mirror=False):
+    def as_file(self, mode='r', **kwargs):
+        """
+        Opens file object and returns file like object. Arguments are passed on to open().
+        """
+        p = self.path
+        # On Windows, use extended file names
+        if os.name == 'nt':
+            p = to_extended(p)
+        return open(p, mode, **kwargs)
 
-        # Normalize paths
-        if is_nt_path(src):
-            src = src.replace('/', os.path.sep)
-        if is_nt_path(dest):
-            dest = dest.replace('/', os.path.sep)
+    def copy(self, dest, metadata=True, dir_exist_ok=True,
+            include=['.*'], exclude=[], recursive=True,
+            delete=False, mirror=False, username=None, password=None, **kwargs):
+        """
+        Log onto the servers of source and destination with NET USE if a
+        username is given, then copy with local.LocalPath.copy(), as a UNC
+        is a file system path once logged on. Files and dirs can be copied;
+        other keyword args are passed on.
+        """
+        src = self.path
+        dest_str = str(dest)
 
         # Log on if Windows UNC
         if is_unc(src) and username:
@@ -25,21 +40,23 @@ class SmbPath(path.Path):
             log.debug("NET USE said: %s" % r)
         else:
             log.debug('Source is a UNC but no OS username has been provided.')
-        if is_unc(dest) and username:
+        if is_unc(dest_str) and username:
             # Log user onto Windows server
-            log.debug('Trying to log user %(username)s onto %(path)s' % dict(username=username, path=dest))
+            log.debug('Trying to log user %(username)s onto %(path)s' % dict(username=username, path=dest_str))
             # cmd = 'NET USE ' + norm_unc_for_net_use(dest) + ' /User:' + username + ' ' + password
-            cmd = net_use(dest, username, password)
+            cmd = net_use(dest_str, username, password)
             log.debug('Excecuting: %(cmd)s' % dict(cmd=cmd))
             r = subprocess.check_call(cmd, stderr=subprocess.STDOUT)
             log.debug("NET USE said: %s" % r)
         else:
             log.debug('Destination is UNC path is a UNC but no OS username has been provided.')
 
-        # On Windows, rewrite local paths to use extended file names
+        # On Windows, use extended file names
         if os.name == 'nt':
             src = to_extended(src)
-            dest = to_extended(dest)
+        return local.LocalPath(src).copy(dest, metadata=metadata, dir_exist_ok=dir_exist_ok,
+            include=include, exclude=exclude, recursive=recursive,
+            delete=delete, mirror=mirror, **kwargs)
 
 def net_use(unc, username, password=''):
     """Make a NET USE command"""
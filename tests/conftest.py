@@ -0,0 +1,25 @@
+import os
+import pytest
+
+def write_tree(root, spec):
+    """
+    Create a tree below root. spec maps '/' separated paths to their content,
+    str or bytes, or to None for an empty dir. Returns root.
+    """
+    os.makedirs(root, exist_ok=True)
+    for rel_path, data in spec.items():
+        path = os.path.join(root, *rel_path.split('/'))
+        if data is None:
+            os.makedirs(path, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+    return root
+
+@pytest.fixture
+def make_tree(tmp_path):
+    """write_tree() below the test's tmp_path: make_tree(name, spec) returns the tree's path"""
+    def make(name, spec):
+        return write_tree(str(tmp_path / name), spec)
+    return make
@@ -0,0 +1,128 @@
+import os, shutil, asyncio, subprocess
+import pytest
+from multipath.paths import local, rsync
+
+def test_alist():
+    async def collect():
+        p = local.LocalPath('tests/fixtures/dirtree')
+        return [e['rel_path'] async for e in p.alist(batch_size=2)]
+    rel_paths = asyncio.run(collect())
+    assert sorted(rel_paths) == ['dir1', os.path.join('dir1', 'file1'), os.path.join('dir1', 'file2.txt')]
+
+def test_alist_kwargs():
+    async def collect():
+        p = local.LocalPath('tests/fixtures/dirtree')
+        return [e['rel_path'] async for e in p.alist(dirs=False, include='txt')]
+    assert asyncio.run(collect()) == [os.path.join('dir1', 'file2.txt')]
+
+def test_alist_closes_listing():
+    closed = []
+    listings = []
+    class ClosingPath(local.LocalPath):
+        def list(self, **kwargs):
+            listings.append(self.list_closing(**kwargs))
+            return listings[-1]
+        def list_closing(self, **kwargs):
+            try:
+                yield from super().list(**kwargs)
+            finally:
+                closed.append(True)
+    async def first():
+        paths = ClosingPath('tests/fixtures/dirtree').alist(batch_size=1)
+        try:
+            async for e in paths:
+                return e
+        finally:
+            await paths.aclose()
+    assert asyncio.run(first()) is not None
+    assert closed == [True]
+
+def test_ainfo():
+    p = local.LocalPath('tests/fixtures/dirtree/dir1/file2.txt')
+    assert asyncio.run(p.ainfo()).st_size == os.path.getsize(p.path)
+
+def test_acopy_concurrent(tmp_path):
+    src = local.LocalPath('tests/fixtures/dirtree')
+    dests = [str(tmp_path / str(i)) for i in range(10)]
+    async def copy_all():
+        return await asyncio.gather(*[src.acopy(dest) for dest in dests])
+    results = asyncio.run(copy_all())
+    assert [len(r) for r in results] == [3] * 10
+    for dest in dests:
+        assert os.path.isfile(os.path.join(dest, 'dir1', 'file1'))
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_acopy(tmp_path):
+    src = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/')
+    dest = rsync.RsyncPath(str(tmp_path))
+    assert asyncio.run(src.acopy(dest, makedirs=False)).returncode == 0
+    assert os.path.isfile(os.path.join(dest.path, 'dir1', 'file1'))
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_acopy_fails(tmp_path):
+    src = rsync.RsyncPath('/does/not/exist/')
+    dest = rsync.RsyncPath(str(tmp_path))
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(src.acopy(dest, makedirs=False))
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_acopy_makedirs(tmp_path):
+    src = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/')
+    dest = rsync.RsyncPath(str(tmp_path / 'new' / 'dir'))
+    assert asyncio.run(src.acopy(dest)).returncode == 0
+    assert os.path.isfile(os.path.join(dest.path, 'dir1', 'file1'))
+
+def test_rsync_acopy_filters(tmp_path, monkeypatch):
+    calls = []
+    async def arun_rsync(src, dest, **kwargs):
+        calls.append((src, kwargs))
+        return rsync.RsyncResult()
+    monkeypatch.setattr(rsync, 'arun_rsync', arun_rsync)
+    src = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/')
+    # Literal excludes become rsync filter rules
+    asyncio.run(src.acopy(str(tmp_path), exclude=['file1']))
+    assert calls[-1][1]['filters'] == ['- /**file1**']
+    # Other filters are applied here
+    asyncio.run(src.acopy(str(tmp_path), include=[r'\.txt$']))
+    assert calls[-1][1]['files'] == ['dir1/file2.txt']
+    asyncio.run(src.acopy(str(tmp_path), files=['dir1/file1']))
+    assert calls[-1][1]['files'] == ['dir1/file1']
+    with pytest.raises(ValueError):
+        asyncio.run(src.acopy(str(tmp_path), parallel=2, mirror=True))
+
+def test_rsync_acopy_str_dest(tmp_path, monkeypatch):
+    cmds = []
+    class FakeProc(object):
+        class stdout(object):
+            async def read(n):
+                return b''
+        async def wait(self):
+            return 0
+    async def create_subprocess_exec(*cmd, **kwargs):
+        cmds.append(cmd)
+        return FakeProc()
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', create_subprocess_exec)
+    src = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/')
+    asyncio.run(src.acopy(str(tmp_path)))
+    assert cmds[-1][0] == 'rsync'
+    assert cmds[-1][-2:] == (src.abs_path, os.path.abspath(str(tmp_path)))
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_acopy_files_from(tmp_path):
+    src = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/')
+    asyncio.run(src.acopy(str(tmp_path), include=[r'\.txt$']))
+    assert os.path.isfile(os.path.join(str(tmp_path), 'dir1', 'file2.txt'))
+    assert not os.path.exists(os.path.join(str(tmp_path), 'dir1', 'file1'))
+
+def test_rsync_acopy_makedirs_fails(tmp_path):
+    # Can't make a dir below a file; that isn't hidden
+    (tmp_path / 'file').write_text('x')
+    src = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/')
+    dest = rsync.RsyncPath(str(tmp_path / 'file' / 'dir'))
+    with pytest.raises(OSError):
+        asyncio.run(src.acopy(dest))
+
+if __name__ == '__main__':
+    test_alist()
+    test_alist_kwargs()
+    test_ainfo()
@@ -0,0 +1,49 @@
+import os
+import pytest
+from multipath.paths import local, entry
+
+def test_entry_compact_list():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    entries = list(p.list(compact=True))
+    paths = list(p.list())
+    assert all(type(e) == entry.Entry for e in entries)
+    for key in ('path', 'abs_path', 'rel_path', 'filename', 'abs_dirpath', 'is_dir', 'is_file'):
+        assert sorted(e[key] for e in entries) == sorted(p[key] for p in paths)
+
+def test_entry_shares_dir_refs():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    files = list(p.list(compact=True, dirs=False))
+    assert len(files) == 2
+    assert files[0].dir is files[1].dir
+    assert files[0].dir.rel_path == 'dir1'
+
+def test_entry_to_path():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    e = [e for e in p.list(compact=True) if e.name == 'file1'][0]
+    path = e.to_path()
+    assert type(path) == local.LocalPath
+    assert path.path == e.abs_path
+    assert path['rel_path'] == os.path.join('dir1', 'file1')
+    assert path['root'] is p
+    assert path.info().st_size == os.path.getsize(e)
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs FIFOs and symlinks')
+def test_entry_special_files(tmp_path):
+    open(str(tmp_path / 'file'), 'w').close()
+    os.mkfifo(str(tmp_path / 'fifo'))
+    os.symlink(str(tmp_path / 'nothing'), str(tmp_path / 'broken'))
+    p = local.LocalPath(str(tmp_path))
+    listed = {e['rel_path']: (e['is_dir'], e['is_file']) for e in p.list()}
+    assert {e.rel_path: (e.is_dir, e.is_file) for e in p.list(compact=True)} == listed
+    assert {e.rel_path: (e.to_path()['is_dir'], e.to_path()['is_file']) for e in p.list(compact=True)} == listed
+    assert listed['fifo'] == listed['broken'] == (False, False)
+
+def test_entry_compact_glob():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    assert [e.rel_path for e in p.list(compact=True, glob='*/file1')] == [os.path.join('dir1', 'file1')]
+
+if __name__ == '__main__':
+    test_entry_compact_list()
+    test_entry_shares_dir_refs()
+    test_entry_to_path()
+    test_entry_compact_glob()
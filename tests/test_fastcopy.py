@@ -0,0 +1,73 @@
+import os, tempfile, pathlib
+from multipath.paths import fastcopy, local
+
+def make_file(dir_path, size):
+    fd, path = tempfile.mkstemp(dir=str(dir_path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(size))
+    os.chmod(path, 0o640)
+    os.utime(path, (1000000000, 1000000000))
+    return path
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_fastcopy_default(tmp_path):
+    src = make_file(tmp_path, 3 * 1024 * 1024 + 17)
+    dest = src + '.copy'
+    copy_func = fastcopy.FastCopy()
+    assert copy_func(src, dest) == dest
+    assert read(src) == read(dest)
+    assert copy_func.used[dest] in fastcopy.STRATEGIES
+    assert int(os.stat(dest).st_mtime) == 1000000000
+
+def test_fastcopy_each_strategy(tmp_path):
+    src = make_file(tmp_path, 100000)
+    for strategy in fastcopy.STRATEGIES:
+        copy_func = fastcopy.FastCopy(strategies=[strategy, fastcopy.USERSPACE])
+        if strategy not in copy_func.strategies:
+            continue
+        dest = src + '.' + strategy
+        copy_func(src, dest)
+        assert read(src) == read(dest)
+        assert copy_func.used[dest] in (strategy, fastcopy.USERSPACE)
+
+def test_fastcopy_empty_file(tmp_path):
+    src = make_file(tmp_path, 0)
+    dest = src + '.copy'
+    fastcopy.FastCopy()(src, dest)
+    assert read(dest) == b''
+
+def test_fastcopy_no_metadata(tmp_path):
+    src = make_file(tmp_path, 10)
+    dest = src + '.copy'
+    fastcopy.FastCopy(metadata=False)(src, dest)
+    assert int(os.stat(dest).st_mtime) != 1000000000
+    assert os.stat(dest).st_mode & 0o777 == 0o640
+
+def test_fastcopy_as_copy_func(tmp_path):
+    dest = str(tmp_path)
+    copy_func = fastcopy.FastCopy()
+    copied = local.LocalPath('tests/fixtures/dirtree').copy(dest, copy_func=copy_func, dir_exist_ok=True)
+    assert len(copied) == 3
+    assert sorted(copy_func.counts().values()) == [2]
+
+def test_fastcopy_copy_metadata(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    make_file(src, 10)
+    for metadata in (True, False):
+        dest = tmp_path / str(metadata)
+        local.LocalPath(str(src)).copy(str(dest), metadata=metadata, copy_func=fastcopy.FastCopy())
+        dest_file = os.path.join(str(dest), os.listdir(str(dest))[0])
+        assert (int(os.stat(dest_file).st_mtime) == 1000000000) == metadata
+        assert os.stat(dest_file).st_mode & 0o777 == 0o640
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for test in [test_fastcopy_default, test_fastcopy_each_strategy, test_fastcopy_empty_file,
+                     test_fastcopy_no_metadata, test_fastcopy_as_copy_func, test_fastcopy_copy_metadata]:
+            test_dir = pathlib.Path(tmp_dir, test.__name__)
+            test_dir.mkdir()
+            test(test_dir)
@@ -0,0 +1,69 @@
+import os
+import pytest
+from multipath.paths import globs, local
+
+def test_glob_plan_prefix():
+    p = globs.plan('builds/2026/*/artifacts/*.tar')
+    assert p.prefix == ['builds', '2026']
+    assert p.segments == ['*', 'artifacts', '*.tar']
+
+def test_glob_plan_literal():
+    p = globs.plan('dir1/file1')
+    assert p.prefix == ['dir1']
+    assert p.segments == ['file1']
+
+def test_glob_plan_match():
+    p = globs.plan('src/**/*.py')
+    assert p.match('src/a.py')
+    assert p.match('src/x/y/a.py')
+    assert not p.match('src/x/a.txt')
+    assert not p.match('lib/a.py')
+
+def test_glob_plan_dirs_only():
+    p = globs.plan('*/')
+    assert p.dirs_only
+    assert p.match('a/') and p.match('a', is_dir=True)
+    assert not p.match('a')
+    assert not globs.plan('*').dirs_only
+
+def test_glob_plan_recursive_matches_dir():
+    p = globs.plan('a/builds/**')
+    assert (p.prefix, p.segments) == (['a'], ['builds', '**'])
+    assert p.match('a/builds') and p.match('a/builds/x/y')
+    assert not p.match('a/other')
+
+def test_glob_plan_parent():
+    for pattern in ('../g/top.tar', 'a/../../b', '..'):
+        with pytest.raises(ValueError):
+            globs.plan(pattern)
+
+def test_glob_list_dirs_only(make_tree):
+    root = make_tree('src', {'d/f': '', 'e': None, 'file': ''})
+    rel_paths = sorted(e['rel_path'] for e in local.LocalPath(root).list(glob='*/'))
+    assert rel_paths == ['d', 'e']
+
+def test_glob_list_recursive_includes_dir(make_tree):
+    root = make_tree('src', {'builds/a/f': '', 'other/g': ''})
+    rel_paths = sorted(e['rel_path'].replace(os.path.sep, '/') for e in local.LocalPath(root).list(glob='builds/**'))
+    assert rel_paths == ['builds', 'builds/a', 'builds/a/f']
+
+def test_glob_list(make_tree):
+    root = make_tree('src', {d + '/' + name: '' for d in ('builds/2026/1/artifacts', 'builds/2026/2/artifacts',
+                                                         'builds/2025/1/artifacts') for name in ('a.tar', 'a.txt')})
+    p = local.LocalPath(root)
+    rel_paths = sorted(e['rel_path'].replace(os.path.sep, '/') for e in p.list(glob='builds/2026/*/artifacts/*.tar'))
+    assert rel_paths == ['builds/2026/1/artifacts/a.tar', 'builds/2026/2/artifacts/a.tar']
+    rel_paths = sorted(e['rel_path'].replace(os.path.sep, '/') for e in p.list(glob='**/*.tar', exclude=['2025']))
+    assert rel_paths == ['builds/2026/1/artifacts/a.tar', 'builds/2026/2/artifacts/a.tar']
+
+def test_glob_list_missing_prefix():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    assert list(p.list(glob='nothere/*')) == []
+
+if __name__ == '__main__':
+    test_glob_plan_prefix()
+    test_glob_plan_literal()
+    test_glob_plan_match()
+    test_glob_plan_dirs_only()
+    test_glob_plan_recursive_matches_dir()
+    test_glob_list_missing_prefix()
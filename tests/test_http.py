@@ -0,0 +1,308 @@
+import os, sys, threading, functools, email.utils
+from http import server
+from urllib import parse
+import pytest
+from multipath import multipath
+from multipath.paths import http
+
+class Handler(server.SimpleHTTPRequestHandler):
+    """Serves a dir over HTTP/1.1 keep-alive, with PROPFIND, counting connections and HEAD requests"""
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    heads = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def do_HEAD(self):
+        type(self).heads += 1
+        super().do_HEAD()
+
+    def log_message(self, *args):
+        pass
+
+    def do_PROPFIND(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        dirpath = self.translate_path(self.path)
+        responses = []
+        for entry in [None] + sorted(os.scandir(dirpath), key=lambda e: e.name):
+            if entry is None:
+                href, is_dir, st = self.path, True, os.stat(dirpath)
+            else:
+                is_dir = entry.is_dir()
+                href, st = self.path + parse.quote(entry.name) + ('/' if is_dir else ''), entry.stat()
+            props = '<D:resourcetype><D:collection/></D:resourcetype>' if is_dir else \
+                    '<D:resourcetype/><D:getcontentlength>{}</D:getcontentlength>'.format(st.st_size)
+            props += '<D:getlastmodified>{}</D:getlastmodified>'.format(email.utils.formatdate(st.st_mtime, usegmt=True))
+            responses.append('<D:response><D:href>{}</D:href><D:propstat><D:prop>{}</D:prop>'
+                             '<D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response>'.format(href, props))
+        body = ('<?xml version="1.0" encoding="utf-8"?><D:multistatus xmlns:D="DAV:">{}</D:multistatus>'
+                .format(''.join(responses))).encode('utf-8')
+        self.send_response(207)
+        self.send_header('Content-Type', 'application/xml; charset="utf-8"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class RangeHandler(Handler):
+    """
+    Also serves byte ranges of files, honouring If-Range. Keeps the ranges
+    asked for, and counts the ranges answered with the whole file because
+    If-Range didn't match in stale. With unknown_total, Content-Range has *
+    as total; with volatile, the ETag changes with every range.
+    """
+    ranges = []
+    stale = 0
+    etag = '"v1"'
+    unknown_total = False
+    volatile = False
+
+    def do_GET(self):
+        byte_range = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if not byte_range or os.path.isdir(path):
+            return super().do_GET()
+        with open(path, 'rb') as f:
+            data = f.read()
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range != self.etag:
+            type(self).stale += 1
+            self.send_response(200)
+        else:
+            start, end = (int(n) for n in byte_range.split('=')[1].split('-'))
+            end = min(end, len(data) - 1)
+            type(self).ranges.append((start, end))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, '*' if self.unknown_total else len(data)))
+            data = data[start:end + 1]
+        if self.volatile:
+            type(self).etag = '"v{}"'.format(len(self.ranges) + 1)
+        self.send_header('ETag', self.etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class HostileHandler(Handler):
+    """Lists names that escape the dir, in index pages and PROPFIND, next to file1. Every file is x."""
+    hrefs = ['..%2Fescaped.txt', '%2e%2e/', '%2E%2E%2F..%2Fescaped.txt', 'a%5Cb', '.%2F', 'file1']
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/':
+            return self.send_body(200, 'application/octet-stream', b'x')
+        links = ''.join('<a href="{}">x</a>'.format(href) for href in self.hrefs)
+        self.send_body(200, 'text/html', '<html><body>{}</body></html>'.format(links).encode('utf-8'))
+
+    def do_PROPFIND(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        responses = ''.join(
+            '<D:response><D:href>/{}</D:href><D:propstat><D:prop>{}</D:prop>'
+            '<D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response>'.format(
+                href, '<D:resourcetype><D:collection/></D:resourcetype>' if href.endswith('/') else '<D:resourcetype/>')
+            for href in [''] + self.hrefs)
+        self.send_body(207, 'application/xml; charset="utf-8"',
+                       '<?xml version="1.0" encoding="utf-8"?><D:multistatus xmlns:D="DAV:">{}</D:multistatus>'
+                       .format(responses).encode('utf-8'))
+
+class Server(server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Downloads close responses they don't need before reading them
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+TREE = {'file1': b'one', 'dir1/file2.txt': b'two' * 1000, 'dir1/sub dir/file3': b'three'}
+
+def serve(make_tree, handler):
+    root = make_tree('site', TREE)
+    httpd = Server(('127.0.0.1', 0), functools.partial(handler, directory=root))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    Handler.connections = Handler.heads = 0
+    yield 'http://127.0.0.1:{}/'.format(httpd.server_address[1]), root
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def pool():
+    pool = http.ConnectionPool()
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def site(make_tree):
+    yield from serve(make_tree, Handler)
+
+@pytest.fixture
+def ranged_site(make_tree):
+    RangeHandler.ranges = []
+    RangeHandler.stale = 0
+    RangeHandler.etag = '"v1"'
+    RangeHandler.unknown_total = RangeHandler.volatile = False
+    yield from serve(make_tree, RangeHandler)
+
+@pytest.fixture
+def hostile_site(make_tree):
+    yield from serve(make_tree, HostileHandler)
+
+def make_big_file(root):
+    data = os.urandom(1000000)
+    with open(os.path.join(root, 'big'), 'wb') as f:
+        f.write(data)
+    return data
+
+def test_http_classify():
+    assert type(multipath.path('http://somehost/dir')) is http.HttpPath
+    assert type(multipath.path('https://somehost/dir/')) is http.HttpPath
+
+def test_http_list(site, pool):
+    url, root = site
+    listed = {p['rel_path']: p for p in http.HttpPath(url, pool=pool).list(recursive=True)}
+    assert sorted(listed) == ['dir1', 'dir1/file2.txt', 'dir1/sub dir', 'dir1/sub dir/file3', 'file1']
+    assert listed['dir1']['is_dir'] and listed['dir1'].path == url + 'dir1/'
+    assert listed['dir1/sub dir/file3'].path == url + 'dir1/sub%20dir/file3'
+    assert [p['rel_path'] for p in http.HttpPath(url, pool=pool).list(include=[r'\.txt$'], recursive=True)] == ['dir1/file2.txt']
+    assert sorted(p['rel_path'] for p in http.HttpPath(url, pool=pool).list()) == ['dir1', 'file1']
+    # Every request went over one connection
+    assert pool.connections_made == 1
+    assert Handler.connections == 1
+
+def test_http_list_dav(site, pool):
+    url, root = site
+    listed = {p['rel_path']: p for p in http.HttpPath(url, pool=pool).list(recursive=True, dav=True)}
+    assert sorted(listed) == ['dir1', 'dir1/file2.txt', 'dir1/sub dir', 'dir1/sub dir/file3', 'file1']
+    assert listed['dir1/file2.txt']['size'] == 3000
+    assert listed['dir1/file2.txt'].info().st_size == 3000
+    assert int(listed['file1']['mtime']) == int(os.stat(os.path.join(root, 'file1')).st_mtime)
+
+def test_http_read(site, pool):
+    url, root = site
+    assert http.HttpPath(url + 'file1', pool=pool).as_bytes() == b'one'
+    assert http.HttpPath(url + 'dir1/file2.txt', pool=pool).as_string() == 'two' * 1000
+    with http.HttpPath(url + 'dir1/file2.txt', pool=pool).as_file('r') as f:
+        assert f.read(3) == 'two'
+    info = http.HttpPath(url + 'dir1/file2.txt', pool=pool).info()
+    assert info.st_size == 3000
+    with pytest.raises(FileNotFoundError):
+        http.HttpPath(url + 'nothing', pool=pool).as_bytes()
+
+def test_http_copy(site, tmp_path, pool):
+    url, root = site
+    dest = str(tmp_path / 'dest')
+    result = http.HttpPath(url, pool=pool).copy(dest, jobs=2)
+    assert not result.errors and result.copied == 3
+    for rel_path in ['file1', 'dir1/file2.txt', 'dir1/sub dir/file3']:
+        with open(os.path.join(dest, *rel_path.split('/')), 'rb') as f, \
+             open(os.path.join(root, *rel_path.split('/')), 'rb') as g:
+            assert f.read() == g.read()
+    assert pool.connections_made <= 3
+    dest = tmp_path / 'file_dest'
+    dest.mkdir()
+    http.HttpPath(url + 'file1', pool=pool).copy(str(dest))
+    assert os.listdir(dest) == ['file1']
+
+def test_http_copy_mtime(site, tmp_path, pool):
+    url, root = site
+    os.utime(os.path.join(root, 'dir1', 'file2.txt'), (1000000000, 1000000000))
+    for dav in (False, True):
+        dest = str(tmp_path / 'dav' if dav else tmp_path / 'dest')
+        http.HttpPath(url, pool=pool).copy(dest, dav=dav)
+        assert os.path.getmtime(os.path.join(dest, 'dir1', 'file2.txt')) == 1000000000
+    # Index pages have no times; they came with the downloads
+    assert Handler.heads == 0
+    http.HttpPath(url + 'dir1/file2.txt', pool=pool).copy(dest, metadata=False)
+    assert os.path.getmtime(os.path.join(dest, 'file2.txt')) != 1000000000
+
+def test_http_copy_hostile_names(hostile_site, tmp_path, pool):
+    url, root = hostile_site
+    for dav in (False, True):
+        assert [p['rel_path'] for p in http.HttpPath(url, pool=pool).list(dav=dav, recursive=True)] == ['file1']
+        out = tmp_path / 'dav' if dav else tmp_path / 'index'
+        dest = out / 'dest'
+        result = http.HttpPath(url, pool=pool).copy(str(dest), dav=dav)
+        assert not result.errors
+        assert os.listdir(str(out)) == ['dest']
+        assert os.listdir(str(dest)) == ['file1']
+
+def test_http_stale_connection(site, pool):
+    url, root = site
+    assert http.HttpPath(url + 'file1', pool=pool).as_bytes() == b'one'
+    # Server side closes the idle connection
+    for conns in pool._idle.values():
+        for conn in conns:
+            conn.sock.shutdown(2)
+    assert http.HttpPath(url + 'file1', pool=pool).as_bytes() == b'one'
+
+def test_http_copy_ranges(ranged_site, tmp_path, pool):
+    url, root = ranged_site
+    data = make_big_file(root)
+    dest = str(tmp_path / 'big')
+    http.HttpPath(url + 'big', pool=pool).copy(dest, range_size=100000, range_jobs=3)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert sorted(RangeHandler.ranges) == [(start, start + 99999) for start in range(0, 1000000, 100000)]
+    assert not os.path.exists(dest + http.PARTS_SUFFIX)
+    # Small files and servers without ranges take one request
+    dest = str(tmp_path / 'file1')
+    http.download(url + 'file1', dest, pool=pool, range_size=100000)
+    with open(dest, 'rb') as f:
+        assert f.read() == b'one'
+
+def test_http_copy_ranges_resume(ranged_site, tmp_path, pool):
+    url, root = ranged_site
+    data = make_big_file(root)
+    dest = str(tmp_path / 'big')
+    # An interrupted download with the first half done
+    with open(dest, 'wb') as f:
+        f.write(data[:500000] + bytes(500000))
+    with open(dest + http.PARTS_SUFFIX, 'w') as f:
+        f.write('1000000 100000 "v1"\n')
+        f.write(''.join('{}\n'.format(start) for start in range(0, 500000, 100000)))
+    http.download(url + 'big', dest, pool=pool, range_size=100000)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert sorted(RangeHandler.ranges) == [(start, start + 99999) for start in range(500000, 1000000, 100000)]
+
+def test_http_copy_ranges_changed(ranged_site, tmp_path, pool):
+    url, root = ranged_site
+    data = make_big_file(root)
+    dest = str(tmp_path / 'big')
+    with open(dest, 'wb') as f:
+        f.write(bytes(1000000))
+    # Done with a version of the file that is gone
+    with open(dest + http.PARTS_SUFFIX, 'w') as f:
+        f.write('1000000 100000 "v0"\n0\n')
+    http.download(url + 'big', dest, pool=pool, range_size=100000, range_jobs=1)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    # The first stale range stops the others
+    assert RangeHandler.stale == 1
+
+def test_http_copy_ranges_unknown_total(ranged_site, tmp_path, pool):
+    url, root = ranged_site
+    data = make_big_file(root)
+    RangeHandler.unknown_total = True
+    dest = str(tmp_path / 'big')
+    http.download(url + 'big', dest, pool=pool, range_size=100000)
+    with open(dest, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(dest + http.PARTS_SUFFIX)
+
+def test_http_copy_ranges_changing(ranged_site, tmp_path, pool):
+    url, root = ranged_site
+    make_big_file(root)
+    RangeHandler.volatile = True
+    dest = str(tmp_path / 'big')
+    with pytest.raises(http.HttpError):
+        http.download(url + 'big', dest, pool=pool, range_size=100000)
+
+if __name__ == '__main__':
+    test_http_classify()
@@ -0,0 +1,102 @@
+import os, time
+import pytest
+from multipath.paths import index, local
+
+TREE = {rel_path: rel_path for rel_path in ('a/1.txt', 'a/b/2.txt', 'c/3.txt')}
+
+def rel_paths(entries):
+    return sorted(e['rel_path'].replace(os.path.sep, '/') for e in entries)
+
+def test_index_list_matches_walk(make_tree):
+    root = make_tree('src', TREE)
+    listing_index = index.ListingIndex()
+    p = local.LocalPath(root)
+    assert rel_paths(p.list(index=listing_index)) == rel_paths(p.list())
+    assert listing_index.has(p.path)
+    entry = [e for e in p.list(index=listing_index) if e['filename'] == '3.txt'][0]
+    assert entry['size'] == len('c/3.txt')
+    assert entry['is_file']
+
+def test_index_refresh_only_changed_dirs(make_tree):
+    root = make_tree('src', TREE)
+    listing_index = index.ListingIndex()
+    assert listing_index.refresh_local(root) == 4
+    assert listing_index.refresh_local(root) == 0
+    # Make sure the dir mtime changes even on coarse clocks
+    time.sleep(0.01)
+    open(os.path.join(root, 'a', 'b', 'new.txt'), 'w').close()
+    os.utime(os.path.join(root, 'a', 'b'), ns=(0, time.time_ns() + 10 ** 9))
+    assert listing_index.refresh_local(root) == 1
+    assert 'a/b/new.txt' in rel_paths(local.LocalPath(root).list(index=listing_index))
+
+def test_index_forgets_removed_dirs(make_tree):
+    root = make_tree('src', TREE)
+    listing_index = index.ListingIndex()
+    listing_index.refresh_local(root)
+    os.remove(os.path.join(root, 'a', 'b', '2.txt'))
+    os.rmdir(os.path.join(root, 'a', 'b'))
+    os.utime(os.path.join(root, 'a'), ns=(0, time.time_ns() + 10 ** 9))
+    assert rel_paths(local.LocalPath(root).list(index=listing_index)) == ['a', 'a/1.txt', 'c', 'c/3.txt']
+
+def test_index_persists(tmp_path, make_tree):
+    root = make_tree('src', TREE)
+    db = str(tmp_path / 'index.sqlite')
+    list(local.LocalPath(root).list(index=db, hashes=True))
+    listing_index = index.ListingIndex(db)
+    assert listing_index.refresh_local(root) == 0
+    hashes = [e['hash'] for e in listing_index.entries(root) if e['type'] == index.FILE]
+    assert len(hashes) == 3 and all(hashes)
+
+def test_index_path_closed(tmp_path, make_tree, monkeypatch):
+    root = make_tree('src', TREE)
+    db = str(tmp_path / 'index.sqlite')
+    closed = []
+    close = index.ListingIndex.close
+    monkeypatch.setattr(index.ListingIndex, 'close', lambda self: closed.append(self.path) or close(self))
+    list(local.LocalPath(root).list(index=db))
+    local.LocalPath(root).copy(str(tmp_path / 'dest'), index=db)
+    assert closed == [db, db]
+    # Indexes given as objects are left open
+    listing_index = index.ListingIndex(db)
+    list(local.LocalPath(root).list(index=listing_index))
+    assert closed == [db, db] and listing_index.has(root)
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs FIFOs and symlinks')
+def test_index_special_files(make_tree):
+    root = make_tree('src', TREE)
+    os.mkfifo(os.path.join(root, 'fifo'))
+    os.symlink(os.path.join(root, 'nothing'), os.path.join(root, 'broken'))
+    p = local.LocalPath(root)
+    listed = {e['rel_path']: (e['is_dir'], e['is_file']) for e in p.list()}
+    # The FIFO isn't hashed, which would block
+    assert {e['rel_path']: (e['is_dir'], e['is_file']) for e in p.list(index=index.ListingIndex(), hashes=True)} == listed
+    assert listed['fifo'] == listed['broken'] == (False, False)
+
+def test_index_store():
+    listing_index = index.ListingIndex()
+    listing_index.store('rsync://host/x', [dict(rel_path='d', type=index.DIR), dict(rel_path='d/f', type=index.FILE, size=3)])
+    entries = list(listing_index.entries('rsync://host/x'))
+    assert [e['rel_path'] for e in entries] == ['d', 'd/f']
+    assert entries[1]['size'] == 3
+
+def test_index_copy_update_stale(tmp_path, make_tree):
+    root = make_tree('src', TREE)
+    dest = str(tmp_path / 'dest')
+    listing_index = index.ListingIndex()
+    src = local.LocalPath(root)
+    src.copy(dest, index=listing_index, hashes=True, update='checksum', dir_exist_ok=True)
+    # Rewritten in place: same size, newer mtime, and the dir's mtime doesn't change
+    path = os.path.join(root, 'c', '3.txt')
+    dir_mtime_ns = os.stat(os.path.join(root, 'c')).st_mtime_ns
+    for i, (update, data) in enumerate([('checksum', 'c/3.TX'), ('quick', 'c/3.tx')]):
+        with open(path, 'w') as f:
+            f.write(data)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + (i + 2) * 10 ** 9))
+        os.utime(os.path.join(root, 'c'), ns=(0, dir_mtime_ns))
+        result = src.copy(dest, index=listing_index, hashes=True, update=update, dir_exist_ok=True)
+        assert (result.updated, result.skipped) == (1, 2)
+        with open(os.path.join(dest, 'c', '3.txt')) as f:
+            assert f.read() == data
+
+if __name__ == '__main__':
+    test_index_store()
@@ -0,0 +1,231 @@
+import os, shutil, tempfile
+import pytest
+from multipath.paths import path as base, local
+
+def test_local_lazy_paths():
+    abs_p = local.LocalPath('/dir/file.txt')
+    assert abs_p.path == abs_p['path'] == '/dir/file.txt'
+    assert abs_p._rel_path is None
+    cwd = os.getcwd()
+    rel_p = local.LocalPath('dir/file.txt')
+    assert rel_p['path'] == os.path.join(cwd, 'dir', 'file.txt')
+    # Relative paths keep pointing where they did when made
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            assert rel_p.abs_path == rel_p.path == os.path.join(cwd, 'dir', 'file.txt')
+            assert rel_p.rel_path == 'dir/file.txt'
+        finally:
+            os.chdir(cwd)
+    assert abs_p.rel_path == os.path.relpath('/dir/file.txt')
+    try:
+        abs_p.abs_path = '/x'
+    except Exception:
+        pass
+    else:
+        assert False
+
+def test_local_list_rel_paths():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    rel_paths = sorted(e['rel_path'] for e in p.list())
+    assert rel_paths == ['dir1', os.path.join('dir1', 'file1'), os.path.join('dir1', 'file2.txt')]
+
+def test_local_list_cached_type():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    for e in p.list():
+        assert e['is_dir'] == os.path.isdir(e.path)
+        assert e['is_file'] == os.path.isfile(e.path)
+        assert e.info().st_size == os.stat(e.path).st_size
+
+def test_local_list_files_only():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    entries = list(p.list(dirs=False))
+    assert len(entries) == 2
+    assert all(e['is_file'] for e in entries)
+
+def test_local_list_not_recursive():
+    p = local.LocalPath('tests/fixtures/dirtree')
+    assert [e['rel_path'] for e in p.list(recursive=False)] == ['dir1']
+
+def test_local_list_file():
+    p = local.LocalPath('tests/fixtures/dirtree/dir1/file2.txt')
+    entries = list(p.list())
+    assert len(entries) == 1
+    assert entries[0].path == p.path
+    assert entries[0]['rel_path'] == 'file2.txt'
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs FIFOs and symlinks')
+def test_local_list_special_files(tmp_path):
+    open(str(tmp_path / 'file'), 'w').close()
+    os.mkfifo(str(tmp_path / 'fifo'))
+    os.symlink(str(tmp_path / 'nothing'), str(tmp_path / 'broken'))
+    listed = {p['rel_path']: p for p in local.LocalPath(str(tmp_path)).list()}
+    assert sorted(listed) == ['broken', 'fifo', 'file']
+    assert {rel_path: (p['is_dir'], p['is_file']) for rel_path, p in listed.items()} == {
+        'broken': (False, False), 'fifo': (False, False), 'file': (False, True)}
+
+def test_local_list_prunes_excluded_dirs(make_tree):
+    root = make_tree('src', {'node_modules/pkg/index.js': '', 'main.js': ''})
+    visited = []
+    prune = base.PathFilter(exclude=['node_modules/']).prune
+    for dir_entry, abs_dirpath, rel_path in local.scandir_path_generator(root, prune=lambda d: visited.append(d) or prune(d)):
+        pass
+    assert visited == ['node_modules']
+    rel_paths = sorted(e['rel_path'] for e in local.LocalPath(root).list(exclude=['node_modules/']))
+    assert rel_paths == ['main.js', 'node_modules']
+
+def test_local_copy_tree(tmp_path):
+    src = local.LocalPath('tests/fixtures/dirtree')
+    dest = str(tmp_path / 'dest')
+    copied = src.copy(dest)
+    assert len(copied) == 3
+    assert os.path.isfile(os.path.join(dest, 'dir1', 'file1'))
+    assert os.path.isfile(os.path.join(dest, 'dir1', 'file2.txt'))
+
+def test_local_copy_file_into_dir(tmp_path):
+    src = local.LocalPath('tests/fixtures/dirtree/dir1/file1')
+    dest = str(tmp_path)
+    src.copy(dest)
+    assert os.path.isfile(os.path.join(dest, 'file1'))
+
+def test_local_copy_parallel(tmp_path, make_tree):
+    src_root = make_tree('src', {'d{}/sub/f{}'.format(d, f): str(f) for d in range(5) for f in range(20)})
+    dest = str(tmp_path / 'dest')
+    copied = local.LocalPath(src_root).copy(dest, jobs=4)
+    assert not copied.errors
+    assert len(copied) == 5 * 2 + 5 * 20
+    with open(os.path.join(dest, 'd3', 'sub', 'f7')) as fh:
+        assert fh.read() == '7'
+
+def test_local_copy_parallel_collects_errors(tmp_path):
+    def failing_copy(src, dest):
+        if src.endswith('file1'):
+            raise IOError('boom')
+        return shutil.copy2(src, dest)
+    dest = str(tmp_path / 'dest')
+    copied = local.LocalPath('tests/fixtures/dirtree').copy(dest, jobs=2, copy_func=failing_copy)
+    assert len(copied.errors) == 1
+    assert copied.errors[0][0]['rel_path'].endswith('file1')
+    assert os.path.isfile(os.path.join(dest, 'dir1', 'file2.txt'))
+
+def test_local_copy_remote_stays_in_dest(tmp_path):
+    class FakeEntry(dict):
+        path = '/dir/entry'
+    class FakeRemote(object):
+        path = '/dir/'
+        def list(self):
+            for rel_path in ('../escaped.txt', 'a/../../escaped.txt', 'a/../ok.txt', 'sub/..', 'file1'):
+                yield FakeEntry(rel_path=rel_path, is_dir=False, mtime=None)
+    def download(url, dest_file):
+        with open(dest_file, 'w') as f:
+            f.write('x')
+    dest = str(tmp_path / 'dest')
+    copied = local.copy_remote(FakeRemote(), dest, download, metadata=False)
+    assert sorted(os.listdir(str(tmp_path))) == ['dest']
+    assert sorted(os.listdir(dest)) == ['file1', 'ok.txt']
+    assert sorted(src['rel_path'] for src, dest_path, e in copied.errors) == [
+        '../escaped.txt', 'a/../../escaped.txt', 'sub/..']
+
+def test_local_copy_update_quick(tmp_path):
+    dest = str(tmp_path / 'dest')
+    src = local.LocalPath('tests/fixtures/dirtree')
+    first = src.copy(dest, update='quick')
+    assert (first.copied, first.updated, first.skipped) == (2, 0, 0)
+    # Repeated syncs keep the dirs already made
+    second = src.copy(dest, update='quick')
+    assert (second.copied, second.updated, second.skipped) == (0, 0, 2)
+    with open(os.path.join(dest, 'dir1', 'file1'), 'w') as f:
+        f.write('changed')
+    third = src.copy(dest, update='quick', jobs=2)
+    assert (third.copied, third.updated, third.skipped) == (0, 1, 1)
+
+def test_local_copy_update_checksum(make_tree):
+    src_root = make_tree('src', {'same': 'abc', 'differs': 'src'})
+    dest = make_tree('dest', {'same': 'abc', 'differs': 'dst'})
+    copied = local.LocalPath(src_root).copy(dest, update='checksum')
+    assert (copied.copied, copied.updated, copied.skipped) == (0, 1, 1)
+
+def test_local_list_sorted(make_tree):
+    root = make_tree('src', {'b': 'b', 'a-b': 'ab', 'a/z': 'z', 'a/c/d': 'd', 'A': 'A'})
+    rel_paths = [p['rel_path'] for p in local.LocalPath(root).list(sort=True)]
+    assert rel_paths == [os.path.join(*r.split('/')) for r in ['A', 'a', 'a/c', 'a/c/d', 'a/z', 'a-b', 'b']]
+    assert [p['rel_path'] for p in local.LocalPath(root).list(sort=True, glob='**/*')] == rel_paths
+
+def test_local_diff(make_tree):
+    src = make_tree('src', {'same': 'same', 'changed': 'abc', 'added': 'new', 'dir/file': 'f'})
+    dest = make_tree('dest', {'same': 'same', 'changed': 'abcd', 'removed': 'old', 'dir/file': 'g'})
+    records = {r.rel_path: r for r in local.LocalPath(src).diff(dest, compare='size')}
+    assert {rel_path: r.status for rel_path, r in records.items()} == {
+        'added': 'added', 'changed': 'changed', 'dir': 'same', os.path.join('dir', 'file'): 'same',
+        'removed': 'removed', 'same': 'same'}
+    records = {r.rel_path: r.status for r in local.LocalPath(src).diff(dest, compare='checksum')}
+    assert records[os.path.join('dir', 'file')] == 'changed'
+    assert records['same'] == 'same'
+
+def test_local_copy_delete(make_tree):
+    src = make_tree('src', {'keep': 'new', 'dir/file': 'f', 'file_now': 'x', 'dir_now/file': 'y', 'skip.tmp': 't'})
+    dest = make_tree('dest', {'keep': 'old', 'gone/sub/file': 'g', 'gone.txt': 'g', 'file_now/file': 'z',
+                      'dir_now': 'w', 'other.tmp': 'o'})
+    result = local.LocalPath(src).copy(dest, delete=True, exclude=[r'\.tmp$'])
+    assert not result.errors
+    listed = sorted(p['rel_path'] for p in local.LocalPath(dest).list())
+    assert listed == sorted(os.path.join(*r.split('/')) for r in
+                            ['dir', 'dir/file', 'dir_now', 'dir_now/file', 'file_now', 'keep', 'other.tmp'])
+    with open(os.path.join(dest, 'keep')) as f:
+        assert f.read() == 'new'
+    # gone, gone/sub, gone/sub/file, gone.txt, and file_now and dir_now that changed type
+    assert result.deleted == 6
+    assert sorted(p['rel_path'] for p in result.removed)[:2] == ['dir_now', 'file_now']
+
+def test_local_copy_mirror(tmp_path, make_tree):
+    src = make_tree('src', {'a': 'a', 'dir/b': 'b'})
+    dest = str(tmp_path / 'dest')
+    first = local.LocalPath(src).copy(dest, mirror=True)
+    assert (first.copied, first.skipped, first.deleted) == (2, 0, 0)
+    os.remove(os.path.join(src, 'a'))
+    with open(os.path.join(dest, 'extra'), 'w') as f:
+        f.write('extra')
+    second = local.LocalPath(src).copy(dest, mirror=True, jobs=2)
+    assert (second.copied, second.skipped, second.deleted) == (0, 1, 2)
+    assert sorted(os.listdir(dest)) == ['dir']
+
+def make_file(tmp_path, data):
+    fd, path = tempfile.mkstemp(dir=tmp_path)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return local.LocalPath(path)
+
+def test_local_as_bytes(tmp_path):
+    data = os.urandom(100000)
+    p = make_file(tmp_path, data)
+    small = p.as_bytes()
+    assert type(small) == bytes and small == data
+    mapped = p.as_bytes(mmap_threshold=4096)
+    assert type(mapped) == memoryview and mapped.readonly
+    assert mapped == data
+    assert make_file(tmp_path, b'').as_bytes(mmap_threshold=0) == b''
+
+def test_local_as_string(tmp_path):
+    p = make_file(tmp_path, 'gr\u00fc\u00dfe'.encode('utf-8'))
+    assert p.as_string() == 'gr\u00fc\u00dfe'
+    assert p.as_string(encoding='latin-1') == 'gr\u00fc\u00dfe'.encode('utf-8').decode('latin-1')
+
+def test_local_as_file(tmp_path):
+    p = make_file(tmp_path, b'abc')
+    with p.as_file('rb', buffering=0) as f:
+        assert f.read() == b'abc'
+
+def test_local_chunks(tmp_path):
+    data = os.urandom(10000)
+    p = make_file(tmp_path, data)
+    chunks = [bytes(c) for c in p.chunks(4096)]
+    assert [len(c) for c in chunks] == [4096, 4096, 1808]
+    assert b''.join(chunks) == data
+
+if __name__ == '__main__':
+    test_local_lazy_paths()
+    test_local_list_rel_paths()
+    test_local_list_cached_type()
+    test_local_list_files_only()
+    test_local_list_not_recursive()
+    test_local_list_file()
@@ -1,4 +1,4 @@
-from multipath.multipath import path
+from multipath.multipath import path, paths, classify
 from multipath.paths import posix, windows, smb, rsync
 
 ## Posix
@@ -91,6 +91,25 @@ def test_uri_rsync_p():
     print(u)
     assert type(u) == rsync.RsyncPath
 
+## Bulk
+
+def test_paths():
+    strs = ['/usr/local/dir/file.txt', 'username@hostname::/x/y/z', '/usr/local/dir/file.txt', r'\\hostname\share\file.txt']
+    ps = list(paths(strs))
+    assert [type(p) for p in ps] == [posix.PosixPath, rsync.RsyncPath, posix.PosixPath, smb.SmbPath]
+    assert ps[0] is not ps[2]
+    assert list(paths(strs, memo=False)) == ps
+
+def test_paths_path_class():
+    ps = list(paths(['dir/file.txt'], path_class=rsync.RsyncPath))
+    assert type(ps[0]) == rsync.RsyncPath
+
+def test_classify_root():
+    assert classify('/') == posix.PosixPath
+
+def test_path_memo():
+    assert type(path('/usr/local/dir/file.txt', memo=True)) == posix.PosixPath
+
 """
 def test_glob():
     g = glob('directory/*')
@@ -125,4 +144,8 @@ if __name__ == '__main__':
         print('Skipping Windows-only tests!')
     test_uri_rsync_daemon()
     test_uri_rsync_p()
+    test_paths()
+    test_paths_path_class()
+    test_classify_root()
+    test_path_memo()
     #test_glob()
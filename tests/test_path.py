@@ -1,4 +1,5 @@
-from multipath.paths import path as base
+import io, os
+from multipath.paths import path as base, local
 
 def test_path_str():
 	p = base.Path('/dir/path/file.txt')
@@ -10,9 +11,113 @@ def test_path_repr():
 	p._abs_path = '/dir/path/file.txt'
 	print(repr(p))
 
+def test_path_filter_accept():
+	f = base.PathFilter(include=['\\.txt$', 'file1'], exclude=['skip'])
+	assert f.accept('dir1/file2.txt')
+	assert f.accept('dir1/file1')
+	assert not f.accept('dir1/file3')
+	assert not f.accept('skip/file2.txt')
+
+def test_path_filter_prune_exclude():
+	f = base.PathFilter(exclude=['node_modules/', '\\.git$'])
+	assert f.prune('a/node_modules')
+	assert not f.prune('a/src')
+	# '$' depends on what follows, so the dir can't be pruned safely
+	assert not f.prune('.git')
+
+def test_path_filter_prune_include():
+	f = base.PathFilter(include=['^src/main/.*\\.java'])
+	assert not f.prune('src')
+	assert not f.prune('src/main/pkg')
+	assert f.prune('docs')
+	assert f.prune('src/test')
+
+class BytesPath(base.Path):
+	"""Path kept in memory, with nothing but as_file()"""
+	store = {}
+
+	def as_file(self, mode='r'):
+		if 'w' in mode:
+			f = io.BytesIO()
+			f.close = lambda: self.store.__setitem__(self.path, f.getvalue())
+			return f
+		return io.BytesIO(self.store[self.path])
+
+class ReadOnly(object):
+	"""File object without readinto()"""
+	def __init__(self, data):
+		self.f = io.BytesIO(data)
+
+	def read(self, n):
+		return self.f.read(n)
+
+class Failing(object):
+	def write(self, data):
+		raise IOError('disk full')
+
+def test_stream_copy():
+	data = os.urandom(100000)
+	dest = io.BytesIO()
+	assert base.stream_copy(io.BytesIO(data), dest, buffer_size=4096, buffers=2) == len(data)
+	assert dest.getvalue() == data
+	dest = io.BytesIO()
+	assert base.stream_copy(ReadOnly(data), dest, buffer_size=1000) == len(data)
+	assert dest.getvalue() == data
+
+def test_stream_copy_error():
+	try:
+		base.stream_copy(io.BytesIO(b'x' * 100000), Failing(), buffer_size=100, buffers=2)
+	except IOError:
+		pass
+	else:
+		assert False
+
+def test_path_copy(tmp_path):
+	data = os.urandom(10000)
+	BytesPath.store['a'] = data
+	dest = str(tmp_path / 'a')
+	result = BytesPath('a').copy(local.LocalPath(dest), buffer_size=1024)
+	assert result.copied == 1
+	with open(dest, 'rb') as f:
+		assert f.read() == data
+	# LocalPath has its own copy(), so call the generic one
+	# Keyword args meant for other classes' copy() are ignored
+	base.Path.copy(local.LocalPath(dest), BytesPath('b'), jobs=2, update='quick')
+	assert BytesPath.store['b'] == data
+
+def listed(rel_path, is_dir=False, size=None, mtime=0):
+	return base.Path(rel_path, rel_path=rel_path, is_dir=is_dir, size=size, mtime=mtime)
+
+def test_diff_listings():
+	src = [listed('a', True), listed('a/x', size=1), listed('a-b', size=2, mtime=5), listed('c', size=3), listed('d', True)]
+	dest = [listed('a', True), listed('a-b', size=2, mtime=5.5), listed('b', size=1), listed('c', size=4), listed('d', size=0)]
+	records = list(base.diff_listings(src, dest))
+	assert [(r.status, r.rel_path) for r in records] == [
+		('same', 'a'), ('added', 'a/x'), ('same', 'a-b'), ('removed', 'b'), ('changed', 'c'), ('changed', 'd')]
+	assert records[1].src is src[1] and records[1].dest is None
+	assert records[3].src is None and records[3].dest is dest[2]
+	dest[1]['mtime'] = 7
+	assert [r.status for r in base.diff_listings(src[2:3], dest[1:2], compare='quick')] == ['changed']
+	assert [r.status for r in base.diff_listings(src[2:3], dest[1:2], compare='size')] == ['same']
+
+def test_diff_listings_unsorted():
+	try:
+		list(base.diff_listings([listed('b'), listed('a')], []))
+	except ValueError:
+		pass
+	else:
+		assert False
+
 if __name__ == '__main__':
 	test_path_str()
 	test_path_repr()
+	test_path_filter_accept()
+	test_path_filter_prune_exclude()
+	test_path_filter_prune_include()
+	test_stream_copy()
+	test_stream_copy_error()
+	test_diff_listings()
+	test_diff_listings_unsorted()
 
 
 """
@@ -52,4 +157,4 @@ c:\\destdir\\subdir\\{recursive contents of subdir}
 c:/destdir/subdir/{recursive contents of subdir}
 >>> merge(r'//?/UNC/hostname/share/subdir', r'c:/destdir')
 c:/destdir/subdir/{recursive contents of subdir}
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,73 @@
+import os, threading
+import pytest
+from multipath.paths import local, plan
+
+def test_plan_copy(tmp_path, make_tree):
+    src = make_tree('src', {'a': 'aaa', 'dir/b': 'bb'})
+    dest = str(tmp_path / 'dest')
+    copy_plan = local.LocalPath(src).copy(dest, plan=True)
+    assert isinstance(copy_plan, plan.CopyPlan)
+    assert sorted((op.op, op.src['rel_path']) for op in copy_plan) == [
+        ('copy', 'a'), ('copy', os.path.join('dir', 'b')), ('mkdir', 'dir')]
+    # Parents come before what is below them
+    ops = [op.op for op in copy_plan if op.src['rel_path'].startswith('dir')]
+    assert ops == ['mkdir', 'copy']
+    assert (copy_plan.bytes, copy_plan.copies, copy_plan.mkdirs, copy_plan.skips) == (5, 2, 1, 0)
+    assert copy_plan.estimate(throughput=5, file_overhead=0.5) == 2.5
+    # Nothing done yet
+    assert not os.path.exists(dest)
+    result = copy_plan.execute(jobs=2)
+    assert (result.copied, result.updated) == (2, 0)
+    with open(os.path.join(dest, 'dir', 'b')) as f:
+        assert f.read() == 'bb'
+
+def test_plan_existing_dest(make_tree):
+    src = make_tree('src', {'a': 'aaa', 'dir/b': 'bb', 'dir/sub/c': 'c'})
+    dest = make_tree('dest', {'a': 'old', 'dir/sub': None})
+    copy_plan = local.LocalPath(src).copy(dest, plan=True)
+    assert (copy_plan.copies, copy_plan.updates, copy_plan.mkdirs) == (3, 1, 0)
+    result = copy_plan.execute()
+    assert (result.copied, result.updated) == (2, 1)
+    # Again, with dest up to date
+    copy_plan = local.LocalPath(src).copy(dest, plan=True, update='quick')
+    assert (copy_plan.copies, copy_plan.skips, copy_plan.mkdirs) == (0, 3, 0)
+    assert copy_plan.execute().skipped == 3
+
+def test_plan_empty_dest(make_tree):
+    src = make_tree('src', {'a': 'aaa'})
+    for path in (src, os.path.join(src, 'a')):
+        with pytest.raises(ValueError):
+            local.LocalPath(path).copy('', plan=True)
+
+def test_plan_mirror(tmp_path, make_tree):
+    src = make_tree('src', {'a': 'aaa', 'dir/b': 'bb'})
+    dest = str(tmp_path / 'dest')
+    local.LocalPath(src).copy(dest, mirror=True)
+    with open(os.path.join(src, 'a'), 'w') as f:
+        f.write('aaaa')
+    with open(os.path.join(dest, 'extra'), 'w') as f:
+        f.write('extra')
+    copy_plan = local.LocalPath(src).copy(dest, mirror=True, plan=True)
+    assert [(op.op, (op.src or op.dest)['rel_path']) for op in copy_plan] == [
+        ('copy', 'a'), ('mkdir', 'dir'), ('skip', os.path.join('dir', 'b')), ('delete', 'extra')]
+    assert (copy_plan.bytes, copy_plan.updates, copy_plan.mkdirs, copy_plan.deletes) == (4, 1, 0, 1)
+    result = copy_plan.execute()
+    assert (result.updated, result.skipped, result.deleted) == (1, 1, 1)
+    assert sorted(os.listdir(dest)) == ['a', 'dir']
+
+def test_plan_split(tmp_path, make_tree):
+    src = make_tree('src', {'d{}/f{}'.format(i % 3, i): 'x' * (i + 1) * 10 for i in range(20)})
+    dest = str(tmp_path / 'dest')
+    copy_plan = local.LocalPath(src).copy(dest, plan=True)
+    parts = copy_plan.split(3)
+    assert sum(part.copies for part in parts) == 20
+    assert sum(part.bytes for part in parts) == copy_plan.bytes
+    assert max(part.bytes for part in parts) - min(part.bytes for part in parts) <= 200
+    assert all(op.op == plan.COPY for part in parts[1:] for op in part)
+    threads = [threading.Thread(target=part.execute) for part in parts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i in range(20):
+        assert os.path.getsize(os.path.join(dest, 'd{}'.format(i % 3), 'f{}'.format(i))) == (i + 1) * 10
@@ -1,15 +1,218 @@
-from multipath.paths import rsync 
-
-def test_rsync_1():
-    src = rsync.RsyncPath(r'tests\fixtures\dirtree')
-    dest = rsync.RsyncPath(r'rsync://hostname/tests/fixtures/dirtree')
-    print(rsync.rsync(src, dest))
-
-def test_rsync_2():
-    src = rsync.RsyncPath(r'tests\fixtures\dirtree')
-    dest = rsync.RsyncPath(r'rsync://hostname/tests/fixtures/dirtree')
-    print(rsync.rsync(src, dest, mirror=True, f=True))
-
-if __name__ == '__main__':
-    test_rsync_1()
-    test_rsync_2()
\ No newline at end of file
+import os, sys, shutil, stat, time
+import pytest
+from multipath.paths import rsync, local
+
+def test_rsync_1():
+    src = rsync.RsyncPath(r'tests\fixtures\dirtree')
+    dest = rsync.RsyncPath(r'rsync://hostname/tests/fixtures/dirtree')
+    print(rsync.rsync(src, dest))
+
+def test_rsync_2():
+    src = rsync.RsyncPath(r'tests\fixtures\dirtree')
+    dest = rsync.RsyncPath(r'rsync://hostname/tests/fixtures/dirtree')
+    print(rsync.rsync(src, dest, mirror=True, f=True))
+
+def test_rsync_filters():
+    src = rsync.RsyncPath('/srcdir')
+    dest = rsync.RsyncPath('/destdir')
+    cmd = rsync.rsync(src, dest, filters=['- /srcdir/**.git**'], r=True)
+    assert cmd == ['rsync', '-r', '--filter=- /srcdir/**.git**', '/srcdir', '/destdir']
+
+def test_filter_rules():
+    assert rsync.filter_rules(None, [r'\.git', '^build/']) == ['- /**.git**', '- /build/**']
+    assert rsync.filter_rules(['.*'], 'tmp', prefix='src/') == ['- /src/**tmp**']
+    # Not exactly expressible as rsync rules
+    assert rsync.filter_rules([r'\.py$'], []) is None
+    assert rsync.filter_rules(None, ['a.b']) is None
+    assert rsync.filter_rules(None, ['a$']) is None
+    assert rsync.filter_rules(None, [r'\*']) is None
+
+def test_split_source():
+    root = local.LocalPath('tests/fixtures/dirtree')
+    for listed in [list(root.list(files=True, dirs=False)), list(root.list(files=True, dirs=False, compact=True))]:
+        assert sorted(rsync.split_source(p) for p in listed) == [
+            (root.abs_path, os.path.join('dir1', 'file1')),
+            (root.abs_path, os.path.join('dir1', 'file2.txt'))]
+    assert rsync.split_source('/a/b') == (None, '/a/b')
+
+def test_batch_sources():
+    root = local.LocalPath('tests/fixtures/dirtree')
+    sources = list(root.list(files=True, dirs=False, sort=True)) + [
+        'tests/fixtures/dirtree/dir1/file1', 'host:/dir/file', 'rsync://host/module/dir/']
+    batches, remote = rsync.batch_sources(sources)
+    assert batches == {
+        root.abs_path: ['dir1/file1', 'dir1/file2.txt'],
+        os.path.join(root.abs_path, 'dir1'): ['file1']}
+    assert remote == ['host:/dir/file', 'rsync://host/module/dir/']
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_copy_batch(tmp_path):
+    root = local.LocalPath('tests/fixtures/dirtree')
+    dest = str(tmp_path)
+    rsync.copy_batch(root.list(include=[r'\.txt$']), dest)
+    assert os.path.isfile(os.path.join(dest, 'dir1', 'file2.txt'))
+    assert not os.path.exists(os.path.join(dest, 'dir1', 'file1'))
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_copy_filtered(tmp_path):
+    dest = str(tmp_path / 'excluded')
+    rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree')).copy(dest, exclude=['file1'])
+    assert os.path.isfile(os.path.join(dest, 'dirtree', 'dir1', 'file2.txt'))
+    assert not os.path.exists(os.path.join(dest, 'dirtree', 'dir1', 'file1'))
+    dest = str(tmp_path / 'included')
+    rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree')).copy(dest, include=[r'\.txt$'])
+    assert os.path.isfile(os.path.join(dest, 'dirtree', 'dir1', 'file2.txt'))
+    assert not os.path.exists(os.path.join(dest, 'dirtree', 'dir1', 'file1'))
+
+def test_split_shards():
+    shards = rsync.split_shards([5, 1, 4, 3, 2, 2], 2, weight=lambda x: x)
+    assert sorted(sum(shard) for shard in shards) == [8, 9]
+    assert sorted(len(shard) for shard in rsync.split_shards(range(10), 3)) == [3, 3, 4]
+    assert rsync.split_shards([1], 2) == [[1], []]
+
+def test_rsync_result_combine():
+    result = rsync.RsyncResult.combine([rsync.RsyncResult(['a'], 0), rsync.RsyncResult(['b'], 23)])
+    assert result.returncode == 23
+    assert result.cmd == [['a'], ['b']]
+    assert len(result.shards) == 2
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_copy_parallel(tmp_path, make_tree):
+    src = make_tree('src', {'d{}/f{}'.format(i % 3, i): b'x' * i * 100 for i in range(20)})
+    dest = str(tmp_path / 'dest')
+    result = rsync.RsyncPath(src + '/').copy(dest, parallel=3)
+    assert result.returncode == 0 and len(result.shards) == 3
+    for i in range(20):
+        assert os.path.getsize(os.path.join(dest, 'd{}'.format(i % 3), 'f{}'.format(i))) == i * 100
+
+def test_rsync_parallel_shard_fails(monkeypatch):
+    def run(cmd, files=None, progress=None):
+        if 'b' in list(files):
+            raise FileNotFoundError('rsync')
+        return rsync.RsyncResult(cmd, 0)
+    monkeypatch.setattr(rsync, '_run', run)
+    with pytest.raises(FileNotFoundError):
+        rsync.run_rsync_parallel(rsync.RsyncPath('/srcdir'), rsync.RsyncPath('/destdir'), [['a'], ['b']])
+
+def test_rsync_files_raise():
+    def files():
+        yield 'a'
+        raise ValueError('bad listing')
+    # Stands in for rsync reading --files-from until stdin is closed
+    cmd = [sys.executable, '-c', 'import sys; sys.stdin.buffer.read()']
+    with pytest.raises(ValueError):
+        rsync._run(cmd, files())
+
+STATS_OUTPUT = (b'         32,768  50%   31.25MB/s    0:00:00 (xfr#1, to-chk=1/3)\r'
+                b'         65,536 100%   62.50MB/s    0:00:00 (xfr#2, to-chk=0/3)\n'
+                b'\n'
+                b'Number of files: 3 (reg: 2, dir: 1)\n'
+                b'Number of created files: 2 (reg: 2)\n'
+                b'Number of regular files transferred: 2\n'
+                b'Total file size: 65,536 bytes\n'
+                b'Total transferred file size: 65,536 bytes\n'
+                b'Literal data: 61,440 bytes\n'
+                b'Matched data: 4,096 bytes\n'
+                b'File list size: 0\n'
+                b'Total bytes sent: 61,783\n'
+                b'Total bytes received: 57\n'
+                b'\n'
+                b'sent 61,783 bytes  received 57 bytes  123,680.00 bytes/sec\n'
+                b'total size is 65,536  speedup is 1.06\n')
+
+def test_rsync_result_parse():
+    result = rsync.RsyncResult(['rsync'])
+    updates = []
+    parser = rsync._OutputParser(result, updates.append)
+    # Split mid line, like reads from a pipe may
+    parser.feed(STATS_OUTPUT[:50])
+    parser.feed(STATS_OUTPUT[50:])
+    parser.close()
+    assert updates == [rsync.RsyncProgress(32768, 50, '31.25MB/s', '0:00:00', 1, 1, 3),
+                       rsync.RsyncProgress(65536, 100, '62.50MB/s', '0:00:00', 2, 0, 3)]
+    assert result.files_transferred == 2
+    assert result.total_size == 65536
+    assert result.literal_bytes == 61440
+    assert result.matched_bytes == 4096
+    assert result.bytes_sent == 61783
+    assert result.bytes_received == 57
+    assert result.speedup == 1.06
+    assert 'Number of files: 3 (reg: 2, dir: 1)' in result.output
+
+def test_rsync_result_combine_stats():
+    a = rsync.RsyncResult(['a'])
+    a.literal_bytes, a.total_size, a.bytes_sent, a.bytes_received, a.elapsed = 10, 100, 20, 5, 1.0
+    b = rsync.RsyncResult(['b'])
+    b.literal_bytes, b.total_size, b.bytes_sent, b.bytes_received, b.elapsed = 30, 100, 70, 5, 2.0
+    result = rsync.RsyncResult.combine([a, b])
+    assert result.literal_bytes == 40
+    assert result.matched_bytes is None
+    assert result.elapsed == 2.0
+    assert result.speedup == 2.0
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_copy_stats(tmp_path):
+    dest = str(tmp_path)
+    updates = []
+    result = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree') + '/').copy(dest, progress=updates.append)
+    assert result.returncode == 0
+    assert result.files_transferred == 2
+    assert result.elapsed > 0
+    assert updates
+
+LIST_OUTPUT = [b'drwxr-xr-x          4,096 2020/01/31 12:00:00 dirtree\n',
+               b'drwxr-xr-x          4,096 2020/01/31 12:00:00 dirtree/dir1\n',
+               b'-rw-r--r--          1,024 2020/01/31 12:00:00 dirtree/dir1/file1\n',
+               b'-rw-r--r--              0 2020/01/31 12:00:00 dirtree/dir1/file2.txt\n',
+               b'lrwxrwxrwx              5 2020/01/31 12:00:00 dirtree/link -> dir1/file1\n']
+
+def test_parse_list_line():
+    name, is_dir, size, mtime, mode, link_target = rsync.parse_list_line(LIST_OUTPUT[2])
+    assert (name, is_dir, size, link_target) == ('dirtree/dir1/file1', False, 1024, None)
+    assert stat.filemode(mode) == '-rw-r--r--'
+    assert time.localtime(mtime)[:6] == (2020, 1, 31, 12, 0, 0)
+    name, is_dir, size, mtime, mode, link_target = rsync.parse_list_line(LIST_OUTPUT[4])
+    assert (name, link_target) == ('dirtree/link', 'dir1/file1')
+    assert stat.S_ISLNK(mode)
+    assert rsync.parse_list_line(b'-rw-r-sr-T 3 2020/01/31 12:00:00 a\\#012b\n')[0] == 'a\nb'
+    assert rsync.parse_list_line(b'sent 20 bytes  received 77 bytes\n') is None
+
+def test_rsync_list_parse(monkeypatch):
+    calls = []
+    def run_list(src, recursive=True, filters=None):
+        calls.append(filters)
+        return (rsync.parse_list_line(line) for line in LIST_OUTPUT)
+    monkeypatch.setattr(rsync, 'run_list', run_list)
+    root = rsync.RsyncPath('host:/srv/dirtree')
+    listed = list(root.list(exclude=['link']))
+    assert calls == [['- /dirtree/**link**']]
+    assert [p['rel_path'] for p in listed] == ['dir1', 'dir1/file1', 'dir1/file2.txt']
+    assert listed[1].path == 'host:/srv/dirtree/dir1/file1'
+    assert listed[1]['filename'] == 'file1'
+    assert listed[1].info().st_size == 1024
+    assert [p['rel_path'] for p in root.list(include=[r'\.txt$'], dirs=False)] == ['dir1/file2.txt']
+    assert calls[-1] == []
+    list(root.list(recursive=False))
+    assert calls[-1] == ['- /dirtree/*/*']
+
+@pytest.mark.skipif(shutil.which('rsync') is None, reason='rsync not installed')
+def test_rsync_list():
+    root = rsync.RsyncPath(os.path.abspath('tests/fixtures/dirtree'))
+    assert sorted(p['rel_path'] for p in root.list()) == ['dir1', 'dir1/file1', 'dir1/file2.txt']
+    assert [p['rel_path'] for p in root.list(exclude=['file1'], dirs=False)] == ['dir1/file2.txt']
+    assert stat.S_ISDIR(root.info().st_mode)
+
+if __name__ == '__main__':
+    test_rsync_1()
+    test_rsync_2()
+    test_rsync_filters()
+    test_filter_rules()
+    test_split_source()
+    test_batch_sources()
+    test_split_shards()
+    test_rsync_result_combine()
+    test_rsync_files_raise()
+    test_rsync_result_parse()
+    test_rsync_result_combine_stats()
+    test_parse_list_line()
+    test_rsync_list()
\ No newline at end of file
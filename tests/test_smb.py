@@ -0,0 +1,21 @@
+import os, tempfile
+from multipath.paths import smb
+
+def test_smb_is_unc():
+    assert smb.is_unc(r'\\host\share\dir')
+    assert smb.is_unc(r'\\?\UNC\host\share\dir')
+    assert not smb.is_unc(r'c:\dir')
+    assert smb.norm_unc_for_net_use(r'\\?\UNC\host\share\dir\file') == r'\\host\share'
+
+def test_smb_copy_dir():
+    # Without a username no NET USE is run, so a local dir stands in for a share
+    with tempfile.TemporaryDirectory() as dest:
+        result = smb.SmbPath('tests/fixtures/dirtree').copy(dest, jobs=2)
+        assert result.copied == 2
+        with open(os.path.join(dest, 'dir1', 'file2.txt')) as f, \
+             open(os.path.join('tests', 'fixtures', 'dirtree', 'dir1', 'file2.txt')) as g:
+            assert f.read() == g.read()
+
+if __name__ == '__main__':
+    test_smb_is_unc()
+    test_smb_copy_dir()
@@ -1,7 +1,33 @@
+import os, shutil, threading, time
 from pprint import pprint
+import pytest
 import pysvn
 from multipath.paths import svn
 
+ROOT_URL = 'http://svn.example.com/repos'
+
+class Entry(object):
+	def __init__(self, repos_path, kind, size=0, time=0.0):
+		self.repos_path = repos_path
+		self.kind = kind
+		self.size = size
+		self.time = time
+
+class FakeClient(object):
+	"""Answers like pysvn.Client for a repository with /tags/1.0/file1 at revision 7, counting calls"""
+	def __init__(self):
+		self.calls = []
+
+	def info2(self, url_or_path, revision=None, recurse=False):
+		self.calls.append('info2')
+		return [(url_or_path, {'repos_root_URL': ROOT_URL, 'URL': url_or_path,
+		                       'rev': pysvn.Revision(pysvn.opt_revision_kind.number, 7)})]
+
+	def list(self, url_or_path, peg_revision=None, revision=None, recurse=False, dirent_fields=None):
+		self.calls.append('list')
+		return [(Entry('/tags/1.0', pysvn.node_kind.dir), None),
+		        (Entry('/tags/1.0/file1', pysvn.node_kind.file, 3, 1.0), None)]
+
 def test_svn_list_1():
 	svn_path = svn.SvnPath('http://svn.apache.org/repos/asf/subversion/trunk')
 	paths = svn_path.list(recursive=False)
@@ -12,5 +38,132 @@ def test_svn_list_1():
 	for path in paths:
 		pprint(path)
 
+def test_svn_list_cached():
+	client = FakeClient()
+	cache = svn.ListingCache()
+	tag = svn.SvnPath(ROOT_URL + '/tags/1.0', client=client)
+	paths = tag.list(cache=cache)
+	assert [p['rel_path'] for p in paths] == ['file1']
+	assert paths[0]['revision'] == 7 and paths[0].client is client
+	assert client.calls == ['info2', 'list']
+	# HEAD is looked up again, the listing isn't
+	tag.list(cache=cache)
+	assert client.calls == ['info2', 'list', 'info2']
+	# Nothing to ask the server at a known revision
+	tag.list(revision=7, cache=cache)
+	assert client.calls == ['info2', 'list', 'info2']
+
+def test_svn_listing_cache_lru():
+	cache = svn.ListingCache(maxsize=2)
+	cache.put('a', 1)
+	cache.put('b', 2)
+	assert cache.get('a') == 1
+	cache.put('c', 3)
+	assert cache.get('b') is None
+	assert cache.get('a') == 1 and cache.get('c') == 3
+
+def test_svn_listing_cache_persisted(tmp_path):
+	path = str(tmp_path / 'cache')
+	cache = svn.ListingCache(path)
+	cache.put(('url', '/trunk', 7, True), [('/trunk/file1', False, 3, 1.0)])
+	cache.close()
+	cache = svn.ListingCache(path)
+	assert cache.get(('url', '/trunk', 7, True)) == [('/trunk/file1', False, 3, 1.0)]
+
+class Summary(object):
+	def __init__(self, path, summarize_kind, node_kind):
+		self.path = path
+		self.summarize_kind = summarize_kind
+		self.node_kind = node_kind
+
+class ChangesClient(FakeClient):
+	"""Between revisions 7 and 9 of /trunk: file1 was modified, dir2/file3 added and file2 deleted"""
+	def diff_summarize(self, url_or_path1, revision1, url_or_path2, revision2, recurse=True):
+		self.calls.append('diff_summarize')
+		kind = pysvn.diff_summarize_kind
+		return [Summary('file1', kind.modified, pysvn.node_kind.file),
+		        Summary('dir2', kind.added, pysvn.node_kind.dir),
+		        Summary('dir2/file3', kind.added, pysvn.node_kind.file),
+		        Summary('file2', kind.deleted, pysvn.node_kind.file)]
+
+	def export(self, src_url_or_path, dest_path, force=False, revision=None, peg_revision=None, recurse=True):
+		self.calls.append('export')
+		with open(dest_path, 'w') as f:
+			f.write(src_url_or_path)
+
+def test_svn_changes():
+	trunk = svn.SvnPath(ROOT_URL + '/trunk', client=ChangesClient())
+	assert list(trunk.changes(7, 9)) == [('file1', svn.MODIFIED, False), ('dir2', svn.ADDED, True),
+	                                     ('dir2/file3', svn.ADDED, False), ('file2', svn.DELETED, False)]
+	assert [c.rel_path for c in trunk.changes(7, 9, exclude=['^dir2'])] == ['file1', 'file2']
+
+def test_svn_copy_changes(tmp_path):
+	dest = str(tmp_path)
+	for name in ['file1', 'file2', 'file4']:
+		open(os.path.join(dest, name), 'w').close()
+	client = ChangesClient()
+	trunk = svn.SvnPath(ROOT_URL + '/trunk', client=client)
+	result = trunk.copy_changes(dest, 7, 9)
+	assert client.calls.count('export') == 2
+	assert result.deleted == 1 and result.updated + result.copied == 2
+	assert sorted(os.listdir(dest)) == ['dir2', 'file1', 'file4']
+	with open(os.path.join(dest, 'dir2', 'file3')) as f:
+		assert f.read() == ROOT_URL + '/trunk/dir2/file3'
+
+class ExportClient(ChangesClient):
+	"""/trunk holds file1 and dir1/file2. Keeps track of how many exports run at once."""
+	running = 0
+	most_running = 0
+	lock = threading.Lock()
+
+	def list(self, url_or_path, peg_revision=None, revision=None, recurse=False, dirent_fields=None):
+		self.calls.append('list')
+		return [(Entry('/trunk', pysvn.node_kind.dir), None),
+		        (Entry('/trunk/file1', pysvn.node_kind.file, 3, 1.0), None),
+		        (Entry('/trunk/dir1', pysvn.node_kind.dir), None),
+		        (Entry('/trunk/dir1/file2', pysvn.node_kind.file, 3, 1.0), None)]
+
+	def export(self, *args, **kwargs):
+		cls = type(self)
+		with cls.lock:
+			cls.running += 1
+			cls.most_running = max(cls.most_running, cls.running)
+		time.sleep(0.01)
+		super().export(*args, **kwargs)
+		with cls.lock:
+			cls.running -= 1
+
+def test_svn_copy(tmp_path):
+	dest = str(tmp_path / 'dest')
+	made = []
+	clients = svn.ClientPool(4, factory=lambda: made.append(ExportClient()) or made[-1])
+	trunk = svn.SvnPath(ROOT_URL + '/trunk', client=ExportClient())
+	result = trunk.copy(dest, jobs=4, per_server=2, clients=clients, cache=svn.ListingCache())
+	assert not result.errors
+	assert result.copied == 2
+	assert ExportClient.most_running <= 2
+	assert len(made) <= 2
+	with open(os.path.join(dest, 'dir1', 'file2')) as f:
+		assert f.read() == ROOT_URL + '/trunk/dir1/file2'
+	dest = str(tmp_path / 'excluded')
+	trunk.copy(dest, jobs=1, exclude=['^dir1'], clients=clients, cache=svn.ListingCache())
+	assert os.listdir(dest) == ['file1']
+
+@pytest.mark.skipif(shutil.which('svnadmin') is None, reason='svnadmin not installed')
+def test_svn_copy_file_repository(tmp_path):
+	repo = str(tmp_path / 'repo')
+	os.system('svnadmin create "{}"'.format(repo))
+	url = 'file://' + repo
+	client = pysvn.Client()
+	client.import_('tests/fixtures/dirtree', url + '/trunk', 'import')
+	dest = str(tmp_path / 'dest')
+	result = svn.SvnPath(url + '/trunk').copy(dest, jobs=4, recursive=True)
+	assert not result.errors
+	assert os.path.isfile(os.path.join(dest, 'dir1', 'file1'))
+	assert os.path.isfile(os.path.join(dest, 'dir1', 'file2.txt'))
+
 if __name__ == '__main__':
 	test_svn_list_1()
+	test_svn_list_cached()
+	test_svn_listing_cache_lru()
+	test_svn_changes()